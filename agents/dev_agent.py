@@ -1,11 +1,10 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
-from dotenv import load_dotenv
-import os, re
-
-load_dotenv()
-
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7)
+from langchain_core.prompts import PromptTemplate
+from utils.llm_client import get_llm
+from utils.sections import SectionStreamParser, parse_sections, section_template
+from utils.repair import repair_output, arepair_output
+from utils.instrumentation import span, record_usage, wants_tokens, emit
+from utils.token_budget import budget_for, compact_feedback
+from utils.solution_library import few_shot_examples
 
 DEV_PROMPT = PromptTemplate.from_template("""
 You are an expert software engineer proficient in multiple programming languages.
@@ -39,48 +38,167 @@ Format your output strictly like this:
 Make sure your response is parsable using the above format.
 """)
 
-def generate_code(summary: str, category: str, language: str, feedback: str=None) -> dict:
+# Feedback is passed as a template variable so braces in a review can't break the prompt
+DEV_FEEDBACK_PROMPT = PromptTemplate.from_template(
+    DEV_PROMPT.template + "\nPrevious feedback to improve on:\n{feedback}"
+)
+
+# Accepted solutions to similar tickets (utils/solution_library.py), shown before the instructions
+DEV_EXAMPLES_SECTION = """
+---ACCEPTED SOLUTIONS TO SIMILAR TICKETS---
+These passed review before. Reuse what applies, but solve the ticket above.
+{examples}
+
+"""
+DEV_EXAMPLES_PROMPT = PromptTemplate.from_template(
+    DEV_PROMPT.template.replace("Instructions:", DEV_EXAMPLES_SECTION.lstrip("\n") + "Instructions:", 1)
+)
+DEV_EXAMPLES_FEEDBACK_PROMPT = PromptTemplate.from_template(
+    DEV_EXAMPLES_PROMPT.template + "\nPrevious feedback to improve on:\n{feedback}"
+)
+
+DEV_MARKERS = {
+    "---FILENAME---": "filename",
+    "---CODE---": "code",
+    "---EXPLANATION---": "explanation",
+}
+DEV_REQUIRED = ("filename", "code")
+
+def _build_chain(inputs: dict, cache: bool=True, model: str=None, temperature: float=None):
+    llm = get_llm("dev", model=model, temperature=temperature, cache=cache)
+    if "examples" in inputs:
+        prompt = DEV_EXAMPLES_FEEDBACK_PROMPT if "feedback" in inputs else DEV_EXAMPLES_PROMPT
+    else:
+        prompt = DEV_FEEDBACK_PROMPT if "feedback" in inputs else DEV_PROMPT
+    return prompt | llm
+
+def _inputs(summary: str, category: str, language: str, feedback) -> dict:
     """
-    Generates code based on a ticket summary, category, and programming language.
-    Returns structured output with filename, code, and explanation.
+    Prompt variables for DevAgent. `feedback` may be one review or the list of reviews
+    from every attempt so far; it is compacted to the dev agent's token budget.
+    Accepted solutions to similar tickets are added as examples when there are any.
     """
-    dev_prompt = DEV_PROMPT.template
+    inputs = {"summary": summary, "category": category, "language": language}
+    feedback = compact_feedback(feedback, budget_for("dev"))
     if feedback:
-        dev_prompt = PromptTemplate.from_template(dev_prompt + f"\nPrevious feedback to improve on:\n{feedback}")
-        chain = dev_prompt | llm
-    else:
-        chain = DEV_PROMPT | llm
-        
-    response = chain.invoke({
-        "summary": summary,
-        "category": category,
-        "language": language
-    })
-
-    content = response.content.strip()
-    result = {"language": language}
-
-    # Parsing the structured output
-    try:
-        match = re.search(
-                r"---FILENAME---\s*(.+?)\s*---CODE---\s*(.+?)\s*---EXPLANATION---\s*(.+)", 
-                content, 
-                re.DOTALL
-            )
-
-        if match:
-            filename = match.group(1).strip()
-            code = match.group(2).strip()
-            explanation = match.group(3).strip()
-
-        result.update({
-            "filename": filename,
-            "code": code,
-            "explanation": explanation
-        })
-
-    except Exception as e:
-        result["error"] = f"Failed to parse LLM output: {str(e)}"
+        inputs["feedback"] = feedback
+    examples = few_shot_examples(summary, category, language)
+    if examples:
+        inputs["examples"] = examples
+    return inputs
+
+def parse_code_output(content: str, language: str) -> dict:
+    """
+    Parses the ---FILENAME---/---CODE---/---EXPLANATION--- sections of a DevAgent response.
+    When a required section is missing the result also carries "error", "missing" and "raw".
+    """
+    sections = parse_sections(content, DEV_MARKERS)
+    result = {
+        "language": language,
+        "filename": sections.get("filename", ""),
+        "code": sections.get("code", ""),
+        "explanation": sections.get("explanation", ""),
+    }
+
+    missing = [name for name in DEV_REQUIRED if not sections.get(name)]
+    if missing:
+        result["error"] = f"Failed to parse LLM output: missing {', '.join(missing)}"
+        result["missing"] = missing
         result["raw"] = content
 
-    return result
\ No newline at end of file
+    return result
+
+def _repair(record: dict, content: str, result: dict, language: str) -> dict:
+    """Fetch only the sections a response left out instead of regenerating the code."""
+    if "missing" not in result:
+        return result
+    template = section_template(DEV_MARKERS, result["missing"])
+    repaired = parse_code_output(repair_output("dev", content, result["missing"], template), language)
+    record["repaired"] = record.get("repaired", 0) + ("error" not in repaired)
+    return repaired
+
+async def _arepair(record: dict, content: str, result: dict, language: str) -> dict:
+    if "missing" not in result:
+        return result
+    template = section_template(DEV_MARKERS, result["missing"])
+    repaired = parse_code_output(await arepair_output("dev", content, result["missing"], template), language)
+    record["repaired"] = record.get("repaired", 0) + ("error" not in repaired)
+    return repaired
+
+def generate_code(summary: str, category: str, language: str, feedback=None, cache: bool=True,
+                  model: str=None, temperature: float=None) -> dict:
+    """
+    Generates code based on a ticket summary, category, and programming language.
+    Returns structured output with filename, code, and explanation.
+    Pass cache=False to force a fresh sample, e.g. for parallel candidates.
+    `model`/`temperature` override the configured ones, e.g. per retry (utils/retry_policy.py).
+    """
+    inputs = _inputs(summary, category, language, feedback)
+    with span("dev") as record:
+        response = _build_chain(inputs, cache, model, temperature).invoke(inputs)
+        record_usage(record, response)
+        result = _repair(record, response.content, parse_code_output(response.content, language), language)
+        record["parse_ok"] = "error" not in result
+    return result
+
+async def agenerate_code(summary: str, category: str, language: str, feedback=None, cache: bool=True,
+                         model: str=None, temperature: float=None) -> dict:
+    """
+    Async counterpart of generate_code, built on the chain's ainvoke.
+    Inside listening(..., tokens=True) (utils/instrumentation.py) the response is streamed
+    instead, and every piece of it is emitted as a "token" event.
+    """
+    if wants_tokens():
+        async for section, text in astream_code(summary, category, language, feedback, model, temperature):
+            if section == "result":
+                return text
+            emit("token", section=section, text=text)
+    inputs = _inputs(summary, category, language, feedback)
+    with span("dev") as record:
+        response = await _build_chain(inputs, cache, model, temperature).ainvoke(inputs)
+        record_usage(record, response)
+        result = await _arepair(record, response.content, parse_code_output(response.content, language), language)
+        record["parse_ok"] = "error" not in result
+    return result
+
+def stream_code(summary: str, category: str, language: str, feedback=None, model: str=None, temperature: float=None):
+    """
+    Streaming variant of generate_code.
+    Yields ("filename", name) once, then ("code", chunk) and ("explanation", chunk) events
+    as tokens arrive, and finally ("result", dict) with the same dict generate_code returns.
+    """
+    parser = SectionStreamParser(DEV_MARKERS, whole=("filename",))
+    message = None
+    inputs = _inputs(summary, category, language, feedback)
+    with span("dev", streamed=True) as record:
+        for chunk in _build_chain(inputs, model=model, temperature=temperature).stream(inputs):
+            message = chunk if message is None else message + chunk
+            yield from parser.feed(chunk.content)
+
+        yield from parser.close()
+        record_usage(record, message)
+        content = message.content if message else ""
+        result = _repair(record, content, parse_code_output(content, language), language)
+        record["parse_ok"] = "error" not in result
+    yield "result", result
+
+async def astream_code(summary: str, category: str, language: str, feedback=None, model: str=None, temperature: float=None):
+    """
+    Async counterpart of stream_code.
+    """
+    parser = SectionStreamParser(DEV_MARKERS, whole=("filename",))
+    message = None
+    inputs = _inputs(summary, category, language, feedback)
+    with span("dev", streamed=True) as record:
+        async for chunk in _build_chain(inputs, model=model, temperature=temperature).astream(inputs):
+            message = chunk if message is None else message + chunk
+            for event in parser.feed(chunk.content):
+                yield event
+
+        for event in parser.close():
+            yield event
+        record_usage(record, message)
+        content = message.content if message else ""
+        result = await _arepair(record, content, parse_code_output(content, language), language)
+        record["parse_ok"] = "error" not in result
+    yield "result", result
@@ -1,10 +1,7 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
-from dotenv import load_dotenv
-
-load_dotenv()
-
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7)
+from langchain_core.prompts import PromptTemplate
+from utils.llm_client import get_llm
+from utils.instrumentation import span, record_usage
+from utils.token_budget import budget_for, compact_code
 
 EXPLAIN_PROMPT = PromptTemplate.from_template("""
 You are an expert Python developer. Explain the following Python code in a clear and beginner-friendly way.
@@ -19,9 +16,18 @@ Code:
 {code}
 """)
 
-def explain_code(code: str):
-    chain = EXPLAIN_PROMPT | llm
-    response = chain.invoke({"code": code})
+def explain_code(code: str, language: str = "python"):
+    chain = EXPLAIN_PROMPT | get_llm("explain")
+    code = compact_code(code, budget_for("explain"), language)
+    with span("explain") as record:
+        response = chain.invoke({"code": code})
+        record_usage(record, response)
     return response.content.strip()
 
-
+async def aexplain_code(code: str, language: str = "python"):
+    chain = EXPLAIN_PROMPT | get_llm("explain")
+    code = compact_code(code, budget_for("explain"), language)
+    with span("explain") as record:
+        response = await chain.ainvoke({"code": code})
+        record_usage(record, response)
+    return response.content.strip()
@@ -0,0 +1,172 @@
+from langchain_core.prompts import PromptTemplate
+from utils.llm_client import get_llm
+from utils.instrumentation import span, record_usage
+from utils.token_budget import budget_for, count_tokens, truncate
+from utils.sections import first_marker
+from agents.ticket_agent import parse_ticket
+from agents.dev_agent import parse_code_output, DEV_MARKERS
+from agents.review_agent import parse_review, static_gate, with_diagnostics, _score_found, \
+    _repair as _repair_verdict, _arepair as _arepair_verdict, review_code, areview_code
+from agents.test_agent import parse_tests, TEST_MARKERS
+import asyncio
+
+# Fused prompts do the work of two agents in one round-trip. Their output is the two
+# agents' formats back to back, so the existing parsers handle each half.
+
+CLASSIFY_AND_CODE_PROMPT = PromptTemplate.from_template("""
+You are a helpful engineering assistant and an expert software engineer. Analyze the following software development issue or feature request, then write the code that resolves it.
+
+TASKS:
+1. Classify the ticket as one of the following categories: [Bug, Feature, Documentation, Enhancement].
+2. Rate its urgency as one of: [Low, Medium, High, Critical].
+3. Identify the programming language being referred to in the ticket (e.g., Python, JavaScript, Java, etc.). If no specific language is mentioned, return "Unknown" and write the code in Python.
+4. Generate a short summary (1–2 lines) of the ticket.
+5. Write clean, efficient, and minimal code in that language to solve the problem or implement the feature: a single code file, core logic only, no setup, scaffolding or unnecessary boilerplate, with helpful inline comments.
+6. Return the filename with it's respective extension, and a short paragraph explaining what the code does.
+
+TICKET:
+{ticket_text}
+
+FORMAT:
+Category: <one-word>
+Urgency: <one-word>
+Language: <one-word>
+Summary: <summary here>
+---FILENAME---
+<filename.extension>
+---CODE---
+<code here>
+---EXPLANATION---
+<brief explanation of what this code does>
+
+Make sure your response is parsable using the above format.
+""")
+
+REVIEW_AND_TEST_PROMPT = PromptTemplate.from_template(
+    """You are a senior {language} code reviewer and test engineer.
+
+Analyse the code below and provide **all** of the following:
+
+1. A short review summarising any issues, bugs, or improvements.
+2. A list of specific suggested changes (if any).
+3. A quality rating **out of 10** (higher = better).
+4. **Ready for deployment?**
+   • Return **exactly** “Yes” if there are **no critical bugs or minute(ignorable) bugs and quality ≥ 8**.
+   • Return “No” otherwise.
+5. 1–3 unit tests for the code using the standard testing framework for {language} (e.g., pytest/unittest for Python, Jest for JavaScript/React, JUnit for Java, etc.). Output realistic, meaningful tests for actual behavior.
+
+### CODE
+```{language}
+{code}
+```
+FORMAT (STRICT)
+Review:
+<your comments here>
+
+Score: <number>/10
+Ready for deployment: Yes|No
+
+---FRAMEWORK---
+<framework name>
+
+---TEST CODE---
+<test code>
+
+---EXPLANATION---
+<brief explanation of what the tests validate>
+"""
+)
+REVIEW_AND_TEST_DIAGNOSTICS_PROMPT = with_diagnostics(REVIEW_AND_TEST_PROMPT)
+# Tests for code that doesn't compile would only be rewritten with the code
+STATIC_FAILED_TESTS = {"error": "Skipped: the code failed static checks", "raw_output": ""}
+SPLIT_REVIEW_TESTS = {"error": "Skipped: the code is too long for one prompt, so it was reviewed in parts", "raw_output": ""}
+
+
+def _split(content: str, markers: dict) -> tuple[str, str]:
+    """Split a fused response where the second agent's output starts."""
+    index = first_marker(content, markers)
+    if index == -1:
+        return content, ""
+    return content[:index], content[index:]
+
+
+def parse_classify_and_code(content: str) -> tuple[dict, dict]:
+    """Parse a fused response into (ticket_info, code_output)."""
+    head, rest = _split(content, DEV_MARKERS)
+    ticket_info = parse_ticket(head)
+    language = ticket_info.get("language", "python").lower()
+    return ticket_info, parse_code_output(rest, language)
+
+
+def classify_and_generate(ticket_text: str) -> tuple[dict, dict]:
+    """
+    Classify a ticket and write its first solution in one call.
+    Returns (ticket_info, code_output) shaped like classify_ticket and generate_code.
+    """
+    chain = CLASSIFY_AND_CODE_PROMPT | get_llm("dev")
+    with span("ticket_dev") as record:
+        response = chain.invoke({"ticket_text": truncate(ticket_text, budget_for("ticket"))})
+        record_usage(record, response)
+        ticket_info, code_output = parse_classify_and_code(response.content)
+        record["parse_ok"] = "summary" in ticket_info and "error" not in code_output
+    return ticket_info, code_output
+
+
+async def aclassify_and_generate(ticket_text: str) -> tuple[dict, dict]:
+    chain = CLASSIFY_AND_CODE_PROMPT | get_llm("dev")
+    with span("ticket_dev") as record:
+        response = await chain.ainvoke({"ticket_text": truncate(ticket_text, budget_for("ticket"))})
+        record_usage(record, response)
+        ticket_info, code_output = parse_classify_and_code(response.content)
+        record["parse_ok"] = "summary" in ticket_info and "error" not in code_output
+    return ticket_info, code_output
+
+
+def _review_and_test_inputs(code: str, language: str, diagnostics: str):
+    inputs = {"code": code, "language": language}
+    if diagnostics:
+        return REVIEW_AND_TEST_DIAGNOSTICS_PROMPT, {**inputs, "diagnostics": diagnostics}
+    return REVIEW_AND_TEST_PROMPT, inputs
+
+
+def review_and_test(code: str, language: str) -> tuple[dict, dict]:
+    """
+    Review code and write its unit tests in one call.
+    Returns (review, tests) shaped like review_code and generate_tests.
+    Code that fails the static gate gets review_code's 0/10 review and no call is made.
+    A missing score is repaired like review_code does; missing tests are left for the
+    caller to regenerate if it needs them.
+    Code over the review budget gets review_code's review in parts and no tests, rather
+    than being cut down to fit one prompt.
+    """
+    if count_tokens(code) > budget_for("review"):
+        return review_code(code, language), dict(SPLIT_REVIEW_TESTS)
+    failed, diagnostics = static_gate(code, language)
+    if failed:
+        return failed, dict(STATIC_FAILED_TESTS)
+    prompt, inputs = _review_and_test_inputs(code, language, diagnostics)
+    with span("review_test") as record:
+        response = (prompt | get_llm("review")).invoke(inputs)
+        record_usage(record, response)
+        head, rest = _split(response.content, TEST_MARKERS)
+        head = _repair_verdict(record, head)
+        review, tests = parse_review(head), parse_tests(rest)
+        record.update(score=review["score"], parse_ok=_score_found(head) and "error" not in tests)
+    return review, tests
+
+
+async def areview_and_test(code: str, language: str) -> tuple[dict, dict]:
+    if count_tokens(code) > budget_for("review"):
+        return await areview_code(code, language), dict(SPLIT_REVIEW_TESTS)
+    failed, diagnostics = await asyncio.to_thread(static_gate, code, language)
+    if failed:
+        return failed, dict(STATIC_FAILED_TESTS)
+    prompt, inputs = _review_and_test_inputs(code, language, diagnostics)
+    with span("review_test") as record:
+        response = await (prompt | get_llm("review")).ainvoke(inputs)
+        record_usage(record, response)
+        head, rest = _split(response.content, TEST_MARKERS)
+        head = await _arepair_verdict(record, head)
+        review, tests = parse_review(head), parse_tests(rest)
+        record.update(score=review["score"], parse_ok=_score_found(head) and "error" not in tests)
+    return review, tests
@@ -1,11 +1,8 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7)
+from langchain_core.prompts import PromptTemplate
+from utils.llm_client import get_llm
+from utils.instrumentation import span, record_usage
+from utils.token_budget import budget_for, truncate
+import re
 
 IMPROVE_PROMPT = PromptTemplate.from_template("""
 You are a senior software engineer. Your task is to improve the following {language} code based on a reviewer's feedback.
@@ -27,6 +24,11 @@ Do not use markdown syntax (no triple backticks, no headings).
 Keep explanations minimal and directly tied to changes.
 """)
 
+def _clean_improved(content: str) -> str:
+    # Drop markdown fence lines if any slipped through; the code itself is left untouched
+    lines = [ln for ln in content.strip().splitlines() if not re.match(r"\s*```[\w+#.-]*\s*$", ln)]
+    return "\n".join(lines).strip()
+
 def improve_code(code: str, feedback: str, language: str) -> str:
     """
     Improve code based on reviewer feedback.
@@ -35,14 +37,29 @@ def improve_code(code: str, feedback: str, language: str) -> str:
         Returns error message string on failure.
     """
     try:
-        chain = IMPROVE_PROMPT | llm
-        result = chain.invoke({"code": code, "feedback": feedback, "language": language})
-        content = result.content.strip()
-        
-        # Remove triple backticks and language labels if any slipped through
-        cleaned = content.replace("```", "").replace(language, "").strip()
-
-        return cleaned
+        chain = IMPROVE_PROMPT | get_llm("improve")
+        # The code is sent whole since it is rewritten; only the feedback is capped
+        feedback = truncate(feedback, budget_for("improve") // 4)
+        with span("improve") as record:
+            result = chain.invoke({"code": code, "feedback": feedback, "language": language})
+            record_usage(record, result)
+        return _clean_improved(result.content)
+
+    except Exception as e:
+        return f"# Error during improvement: {str(e)}"
+
+async def aimprove_code(code: str, feedback: str, language: str) -> str:
+    """
+    Async counterpart of improve_code, built on the chain's ainvoke.
+    """
+    try:
+        chain = IMPROVE_PROMPT | get_llm("improve")
+        # The code is sent whole since it is rewritten; only the feedback is capped
+        feedback = truncate(feedback, budget_for("improve") // 4)
+        with span("improve") as record:
+            result = await chain.ainvoke({"code": code, "feedback": feedback, "language": language})
+            record_usage(record, result)
+        return _clean_improved(result.content)
 
     except Exception as e:
         return f"# Error during improvement: {str(e)}"
@@ -1,13 +1,9 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
-import os
-from dotenv import load_dotenv
-
-# Load environment
-load_dotenv()
-
-# Load model
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7)
+from langchain_core.prompts import PromptTemplate
+from utils.llm_client import get_llm
+from utils.instrumentation import span, record_usage
+from utils.token_budget import budget_for, compact_code
+from utils.sections import parse_sections, section_template
+from utils.repair import repair_output, arepair_output
 
 # Prompt
 TEST_PROMPT = PromptTemplate.from_template("""
@@ -36,29 +32,77 @@ Format:
 <brief explanation of what the tests validate>
 """)
 
-def generate_tests(code: str, language: str) -> dict:
-    try:
-        chain = TEST_PROMPT | llm
-        response = chain.invoke({"code": code, "language": language})
-        content = response.content.strip()
+TEST_MARKERS = {
+    "---FRAMEWORK---": "framework",
+    "---TEST CODE---": "test_code",
+    "---EXPLANATION---": "explanation",
+}
+TEST_REQUIRED = ("framework", "test_code")
+
+def parse_tests(content: str) -> dict:
+    """Split a TestAgent response into framework, test_code and explanation."""
+    sections = parse_sections(content, TEST_MARKERS)
+    missing = [name for name in TEST_REQUIRED if not sections.get(name)]
+    if missing:
+        return {
+            "error": f"Missing {', '.join(missing)} in TestAgent output",
+            "missing": missing,
+            "raw_output": content.strip()
+        }
 
-        framework = content.split("---FRAMEWORK---")[1].split("---")[0].strip()
-        test_code = content.split("---TEST CODE---")[1].split("---")[0].strip()
-        explanation = content.split("---EXPLANATION---")[1].strip()
+    return {
+        "framework": sections["framework"],
+        "test_code": sections["test_code"],
+        "explanation": sections.get("explanation", "")
+    }
+
+def _repair(record: dict, content: str, result: dict) -> dict:
+    """Fetch only the sections a response left out instead of regenerating the tests."""
+    if "missing" not in result:
+        return result
+    template = section_template(TEST_MARKERS, result["missing"])
+    repaired = parse_tests(repair_output("test", content, result["missing"], template))
+    record["repaired"] = record.get("repaired", 0) + ("error" not in repaired)
+    return repaired
+
+async def _arepair(record: dict, content: str, result: dict) -> dict:
+    if "missing" not in result:
+        return result
+    template = section_template(TEST_MARKERS, result["missing"])
+    repaired = parse_tests(await arepair_output("test", content, result["missing"], template))
+    record["repaired"] = record.get("repaired", 0) + ("error" not in repaired)
+    return repaired
 
-        cleaned_code = test_code
-        if cleaned_code.startswith("```"):
-            cleaned_code = cleaned_code.strip("`").split("\n", 1)[-1].rsplit("```", 1)[0].strip()
+def generate_tests(code: str, language: str) -> dict:
+    try:
+        chain = TEST_PROMPT | get_llm("test")
+        code = compact_code(code, budget_for("test"), language)
+        with span("test") as record:
+            response = chain.invoke({"code": code, "language": language})
+            record_usage(record, response)
+            result = _repair(record, response.content, parse_tests(response.content))
+            record["parse_ok"] = "error" not in result
+        return result
 
+    except Exception as e:
         return {
-            "framework": framework,
-            "test_code": cleaned_code,
-            "explanation": explanation
+            "error": str(e),
+            "raw_output": ""
         }
 
+async def agenerate_tests(code: str, language: str) -> dict:
+    try:
+        chain = TEST_PROMPT | get_llm("test")
+        code = compact_code(code, budget_for("test"), language)
+        with span("test") as record:
+            response = await chain.ainvoke({"code": code, "language": language})
+            record_usage(record, response)
+            result = await _arepair(record, response.content, parse_tests(response.content))
+            record["parse_ok"] = "error" not in result
+        return result
 
     except Exception as e:
         return {
             "error": str(e),
-            "raw_output": content if "content" in locals() else ""
+            "raw_output": ""
         }
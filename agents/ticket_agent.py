@@ -1,12 +1,11 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
-from dotenv import load_dotenv
+from langchain_core.prompts import PromptTemplate
+from utils.llm_client import get_llm
+from utils.instrumentation import span, record_usage
+from utils.token_budget import budget_for, truncate
+from utils.repair import repair_output, arepair_output
+import asyncio, re
 
 
-load_dotenv()
-
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7)
-
 TICKET_PROMPT = PromptTemplate.from_template("""
 You are a helpful engineering assistant. Analyze the following software development issue or feature request.
 
@@ -28,19 +27,123 @@ Summary: <summary here>
 
 
 
-def classify_ticket(ticket_text: str) -> dict:
-    chain = TICKET_PROMPT | llm
-    response = chain.invoke({"ticket_text":ticket_text})
+TICKET_FIELDS = {
+    "category": "Category: <one-word>",
+    "urgency":  "Urgency: <one-word>",
+    "language": "Language: <one-word>",
+    "summary":  "Summary: <summary here>",
+}
 
+def parse_ticket(content: str) -> dict:
     result={}
-    for line in response.content.strip().splitlines():
+    for line in content.strip().splitlines():
         if ":" in line:
             key, value = line.split(":", 1)
-            result[key.strip().lower()] = value.strip()
+            # Tolerate markdown such as "- **Category:** Bug"
+            key = re.sub(r"[*#`_]|^\s*[-•]\s*", "", key).strip().lower()
+            value = value.strip().strip("*`").strip()
+            if key and key not in result:
+                result[key] = value
     
     return result
 
 
+def _missing(result: dict) -> list:
+    return [field for field in TICKET_FIELDS if not result.get(field)]
+
+
+def _repair(record: dict, content: str, result: dict) -> dict:
+    """Ask for just the fields a classification left out instead of classifying again."""
+    missing = _missing(result)
+    if not missing:
+        return result
+    template = "\n".join(TICKET_FIELDS[field] for field in missing)
+    repaired = parse_ticket(repair_output("ticket", content, missing, template))
+    record["repaired"] = record.get("repaired", 0) + (not _missing(repaired))
+    return repaired
+
+
+async def _arepair(record: dict, content: str, result: dict) -> dict:
+    missing = _missing(result)
+    if not missing:
+        return result
+    template = "\n".join(TICKET_FIELDS[field] for field in missing)
+    repaired = parse_ticket(await arepair_output("ticket", content, missing, template))
+    record["repaired"] = record.get("repaired", 0) + (not _missing(repaired))
+    return repaired
+
+
+def classify_ticket(ticket_text: str) -> dict:
+    chain = TICKET_PROMPT | get_llm("ticket")
+    with span("ticket") as record:
+        response = chain.invoke({"ticket_text": truncate(ticket_text, budget_for("ticket"))})
+        record_usage(record, response)
+        result = _repair(record, response.content, parse_ticket(response.content))
+        record["parse_ok"] = "summary" in result
+    return result
+
+
+async def aclassify_ticket(ticket_text: str) -> dict:
+    chain = TICKET_PROMPT | get_llm("ticket")
+    with span("ticket") as record:
+        response = await chain.ainvoke({"ticket_text": truncate(ticket_text, budget_for("ticket"))})
+        record_usage(record, response)
+        result = await _arepair(record, response.content, parse_ticket(response.content))
+        record["parse_ok"] = "summary" in result
+    return result
+
+
+def classify_tickets(ticket_texts: list[str], max_concurrency: int = 8) -> list[dict]:
+    """
+    Classify many tickets through the chain's batch path.
+    A ticket whose call fails comes back as {"error": "..."} instead of aborting the batch.
+    """
+    chain = TICKET_PROMPT | get_llm("ticket")
+    with span("ticket_batch", size=len(ticket_texts)) as record:
+        responses = chain.batch(
+            [{"ticket_text": truncate(text, budget_for("ticket"))} for text in ticket_texts],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+        results = [
+            result if isinstance(response, Exception) else _repair(record, response.content, result)
+            for response, result in zip(responses, _batch_results(record, responses))
+        ]
+        record["parse_ok"] = all("summary" in r for r in results)
+        return results
+
+
+async def aclassify_tickets(ticket_texts: list[str], max_concurrency: int = 8) -> list[dict]:
+    chain = TICKET_PROMPT | get_llm("ticket")
+    with span("ticket_batch", size=len(ticket_texts)) as record:
+        responses = await chain.abatch(
+            [{"ticket_text": truncate(text, budget_for("ticket"))} for text in ticket_texts],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+        results = await asyncio.gather(*(
+            _async_value(result) if isinstance(response, Exception) else _arepair(record, response.content, result)
+            for response, result in zip(responses, _batch_results(record, responses))
+        ))
+        record["parse_ok"] = all("summary" in r for r in results)
+        return list(results)
+
+
+async def _async_value(value):
+    return value
+
+
+def _batch_results(record: dict, responses: list) -> list[dict]:
+    results = []
+    for response in responses:
+        if isinstance(response, Exception):
+            results.append({"error": str(response)})
+            continue
+        record_usage(record, response)
+        results.append(parse_ticket(response.content))
+    return results
+
+
 # # Example usage
 # if __name__ == "__main__":
 #         # ticket = """App crashes when uploading a PNG image larger than 5MB on the user profile page."""
@@ -0,0 +1,364 @@
+"""
+Offline benchmark for the agent pipeline.
+
+Runs every stage against a fixed ticket corpus using the stub or replay LLM backend
+(see utils/llm_client.py), so no Gemini quota is spent:
+
+    python -m benchmarks.run_benchmarks                        # stub backend, no latency
+    python -m benchmarks.run_benchmarks --latency-ms 300       # simulate network time
+    python -m benchmarks.run_benchmarks --backend replay --cassette cassettes/run.jsonl
+
+Record a cassette from real traffic first with LLM_BACKEND=record LLM_CASSETTE=... .
+Reports p50/p90/p99 latency per stage, throughput and peak traced memory.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+CORPUS = os.path.join(os.path.dirname(__file__), "tickets.jsonl")
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(name: str, durations: list, elapsed: float, peak_bytes: int, extra: dict | None = None) -> dict:
+    row = {
+        "stage": name,
+        "calls": len(durations),
+        "p50_ms": round(percentile(durations, 50) * 1000, 3),
+        "p90_ms": round(percentile(durations, 90) * 1000, 3),
+        "p99_ms": round(percentile(durations, 99) * 1000, 3),
+        "throughput_per_s": round(len(durations) / elapsed, 2) if elapsed else 0.0,
+        "peak_mem_kb": round(peak_bytes / 1024, 1),
+    }
+    row.update(extra or {})
+    return row
+
+
+def measure(name: str, fn, items: list, extra=None, trace: bool = True) -> dict:
+    """
+    Call fn(item) for every item, timing each call and tracing peak memory.
+    trace=False skips tracemalloc, which slows sub-millisecond calls down several-fold.
+    """
+    durations = []
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        durations.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return summarize(name, durations, elapsed, peak, extra(items) if extra else None)
+
+
+def bench_stages(tickets: list) -> list:
+    from agents.ticket_agent import classify_ticket
+    from agents.dev_agent import generate_code
+    from agents.review_agent import review_code
+    from agents.test_agent import generate_tests
+    from agents.fused_agent import classify_and_generate, review_and_test
+
+    infos = [classify_ticket(t["ticket"]) for t in tickets]
+    codes = [generate_code(i["summary"], i["category"], i["language"].lower()) for i in infos]
+
+    return [
+        measure("classify_ticket", lambda t: classify_ticket(t["ticket"]), tickets),
+        measure("generate_code", lambda i: generate_code(i["summary"], i["category"], i["language"].lower()), infos),
+        measure("review_code", lambda c: review_code(c["code"], c["language"]), codes),
+        measure("generate_tests", lambda c: generate_tests(c["code"], c["language"]), codes),
+        measure("classify_and_generate", lambda t: classify_and_generate(t["ticket"]), tickets),
+        measure("review_and_test", lambda c: review_and_test(c["code"], c["language"]), codes),
+    ]
+
+
+def bench_orchestrate(tickets: list, fused: bool = False, name: str | None = None) -> dict:
+    from pipeline.orchestrator_pipeline import orchestrate_pipeline
+
+    attempts = []
+    early_stops = []
+
+    def run(ticket):
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = orchestrate_pipeline(ticket["ticket"], fused=fused)
+        attempts.append(result["attempts"])
+        early_stops.append(result["retry"]["saved_attempts"])
+
+    name = name or ("orchestrate_pipeline (fused)" if fused else "orchestrate_pipeline")
+    return measure(name, run, tickets,
+                   extra=lambda _: {"avg_attempts": round(sum(attempts) / len(attempts), 2),
+                                    "early_stop_saved": sum(early_stops)})
+
+
+def bench_fused(tickets: list, baseline: dict) -> dict:
+    """Fused orchestration, with the p50 latency it saves over `baseline`.
+    Fused runs also return unit tests, which the baseline pipeline does not generate."""
+    row = bench_orchestrate(tickets, fused=True)
+    row["saved_p50_ms"] = round(baseline["p50_ms"] - row["p50_ms"], 3)
+    return row
+
+
+def bench_post_review(tickets: list) -> dict:
+    """
+    Orchestration that also writes unit tests and an explanation. The two run concurrently
+    in the stage graph; post_review_p50_ms is the time they add after the dev loop, next to
+    the p50 of their summed stage times, which is what running them one after the other costs.
+    """
+    from pipeline.orchestrator_pipeline import orchestrate_pipeline
+
+    post, serial = [], []
+
+    def run(ticket):
+        with contextlib.redirect_stdout(io.StringIO()):
+            stages = orchestrate_pipeline(ticket["ticket"], write_tests=True, explain=True).get("stages", {})
+        if "dev_loop" not in stages:
+            return
+        loop_end = stages["dev_loop"]["start_ms"] + stages["dev_loop"]["wall_ms"]
+        after = [stages[name] for name in ("unit_tests", "explanation") if name in stages]
+        post.append(max((t["start_ms"] + t["wall_ms"] for t in after), default=loop_end) - loop_end)
+        serial.append(sum(t["wall_ms"] for t in after))
+
+    return measure("orchestrate_pipeline (tests + explain)", run, tickets,
+                   extra=lambda _: {"post_review_p50_ms": round(percentile(post, 50), 3),
+                                    "serial_p50_ms": round(percentile(serial, 50), 3)})
+
+
+def bench_large_review(sizes=(1000, 3000, 6000), repeat: int = 3) -> list:
+    """
+    review_code on synthetic Python files of `sizes` lines, whole and split into parts
+    reviewed concurrently. Every size is over the review budget, so the whole reviews raise
+    REVIEW_AGENT_INPUT_BUDGET to fit the file. The stub's latency doesn't grow with the
+    prompt, so this shows the parts' overhead: waves of REVIEW_CHUNK_CONCURRENCY calls plus
+    the split itself.
+    """
+    from unittest import mock
+    from agents import review_agent
+    from utils.token_budget import count_tokens
+
+    def source(lines):
+        function = "def handler_{n}(order):\n" + "    order.total += order.price * order.quantity  # line\n" * 18 + "    return order\n\n"
+        return "".join(function.format(n=n) for n in range(lines // 21))
+
+    rows = []
+    threshold = review_agent.CHUNKED_REVIEW_TOKENS
+    try:
+        for lines in sizes:
+            code = source(lines)
+            whole_budget = {"REVIEW_AGENT_INPUT_BUDGET": str(count_tokens(code))}
+            for mode, tokens, env in (("whole", 0, whole_budget), ("chunked", 1, {})):
+                review_agent.CHUNKED_REVIEW_TOKENS = tokens
+                parts = []
+                with mock.patch.dict(os.environ, env):
+                    rows.append(measure(f"review_code {mode} ({lines} lines)",
+                                        lambda c: parts.append(len(review_agent.review_code(c, "python").get("chunks", [])) or 1),
+                                        [code] * repeat, extra=lambda _: {"parts": max(parts)}, trace=False))
+                if mode == "whole":
+                    assert max(parts) == 1, f"whole review of {lines} lines was split into {max(parts)} parts"
+    finally:
+        review_agent.CHUNKED_REVIEW_TOKENS = threshold
+    return rows
+
+
+def bench_few_shot(tickets: list) -> list:
+    """
+    Every other ticket is run first so its accepted solution lands in a fresh solution
+    library; the rest are then run cold and with those solutions as few-shot examples.
+    The few-shot row reports the attempts per ticket it saves. The stub backend ignores the
+    examples, so there the rows only show the library's overhead and the saving is reported
+    as unmeasured; it takes a replay cassette recorded from real traffic, few-shot prompts
+    included, to measure it.
+    """
+    from utils import solution_library
+
+    seed, measured = tickets[::2], tickets[1::2]
+    cold = bench_orchestrate(measured, name="orchestrate_pipeline (cold)")
+    with tempfile.TemporaryDirectory() as tmp:
+        solution_library._library = solution_library.SolutionLibrary(os.path.join(tmp, "solutions.sqlite"))
+        os.environ["SOLUTION_LIBRARY_DISABLED"] = "0"
+        try:
+            bench_orchestrate(seed)
+            row = bench_orchestrate(measured, name="orchestrate_pipeline (few-shot)")
+            row["examples"] = len(solution_library._library)
+        finally:
+            os.environ["SOLUTION_LIBRARY_DISABLED"] = "1"
+            solution_library._library = None
+    row["saved_attempts"] = round(cold["avg_attempts"] - row["avg_attempts"], 2) \
+        if os.getenv("LLM_BACKEND") != "stub" else "unmeasured"
+    return [cold, row]
+
+
+def bench_bulk(tickets: list, concurrency: int) -> dict:
+    from pipeline.bulk_pipeline import run_bulk
+
+    out = io.StringIO()
+    tracemalloc.start()
+    started = time.perf_counter()
+    stats = asyncio.run(run_bulk(iter(tickets), out, concurrency=concurrency))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    durations = [json.loads(line).get("seconds", 0.0) for line in out.getvalue().splitlines()]
+    return summarize(f"bulk (concurrency={concurrency})", durations, elapsed, peak,
+                     {"errors": stats["errors"]})
+
+
+def bench_export(count: int, code_kb: int = 8) -> list:
+    """
+    Bulk ZIP export of `count` synthetic results with `code_kb` of code each, per compression.
+    Reports the archive size next to peak traced memory, which should not grow with it.
+    """
+    from utils.zip_file import write_bulk_export
+
+    line = "    total = sum(item.price * item.quantity for item in order.items)  # order total\n"
+
+    def results():
+        for number in range(count):
+            yield {
+                "id": f"t{number}", "ticket": f"Synthetic ticket {number}",
+                "ticket_info": {"summary": f"Ticket {number}", "category": "Bug", "language": "Python"},
+                "code_output": {"filename": "solution.py", "code": f"# {number}\n" + line * (code_kb * 1024 // len(line))},
+                "review": {"review": "Looks fine.", "ready": "Yes"}, "score": 8.0,
+                "tests": {"test_code": "def test_total():\n    assert True\n"},
+            }
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for compression in ("stored", "deflate", "lzma"):
+            path = os.path.join(tmp, f"{compression}.zip")
+            tracemalloc.start()
+            started = time.perf_counter()
+            write_bulk_export(path, results(), compression)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            rows.append(summarize(f"bulk_export {compression} (n={count})", [elapsed], elapsed, peak,
+                                  {"archive_kb": round(os.path.getsize(path) / 1024, 1)}))
+    return rows
+
+
+def bench_ticket_index(tickets: list, size: int, lookups: int = 500) -> list:
+    """
+    Duplicate-index add/lookup latency at `size` tickets. Synthetic tickets mix the corpus'
+    words with rare terms, since a real backlog's vocabulary is far larger than the corpus'.
+    """
+    import random
+    from utils.ticket_index import TicketIndex
+
+    rng = random.Random(0)
+    words = [w for t in tickets for w in t["ticket"].split()] + [f"term{n}" for n in range(5000)]
+    synthetic = lambda: " ".join(rng.sample(words, min(len(words), rng.randint(8, 30))))
+
+    index = TicketIndex(":memory:")
+    for _ in range(size):
+        index.add(synthetic(), {})
+    queries = [synthetic() for _ in range(lookups)]
+    return [
+        measure(f"ticket_index lookup (n={size})", lambda q: index.lookup(q), queries, trace=False),
+        measure(f"ticket_index add (n={size})", lambda q: index.add(q, {}), queries[:100], trace=False),
+    ]
+
+
+def bench_parsers(repeat: int) -> list:
+    from langchain_core.messages import HumanMessage
+    from utils.llm_backends import StubChatModel
+    from agents.ticket_agent import parse_ticket
+    from agents.dev_agent import parse_code_output
+    from agents.review_agent import parse_review
+    from agents.test_agent import parse_tests
+
+    stub = StubChatModel()
+
+    def sample(prompt: str) -> str:
+        return stub.respond([HumanMessage(content=prompt)])[0]
+
+    samples = {
+        "parse_ticket": (parse_ticket, sample("Analyze the following software development issue\nTICKET:\nx\nFORMAT:")),
+        "parse_code_output": (lambda c: parse_code_output(c, "python"), sample("---FILENAME--- ---CODE---")),
+        "parse_review": (parse_review, sample("code reviewer")),
+        "parse_tests": (parse_tests, sample("---TEST CODE---")),
+    }
+    return [measure(name, lambda _: fn(content), range(repeat)) for name, (fn, content) in samples.items()]
+
+
+def print_table(rows: list):
+    columns = ["stage", "calls", "p50_ms", "p90_ms", "p99_ms", "throughput_per_s", "peak_mem_kb"]
+    extras = sorted({k for row in rows for k in row} - set(columns))
+    columns += extras
+    widths = {c: max(len(c), *(len(str(row.get(c, ""))) for row in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    print("  ".join("-" * widths[c] for c in columns))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(widths[c]) for c in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the agent pipeline offline.")
+    parser.add_argument("--backend", choices=["stub", "replay"], default="stub")
+    parser.add_argument("--cassette", help="Cassette file for --backend replay")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated latency per LLM call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latency jitter as a fraction, e.g. 0.2")
+    parser.add_argument("--corpus", default=CORPUS, help="JSONL ticket corpus")
+    parser.add_argument("--limit", type=int, default=0, help="Only use the first N tickets")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrency for the bulk benchmark")
+    parser.add_argument("--parse-repeat", type=int, default=2000, help="Iterations per parser benchmark")
+    parser.add_argument("--export-size", type=int, default=500, help="Tickets in the bulk export benchmark")
+    parser.add_argument("--index-size", type=int, default=20000, help="Tickets in the duplicate-index benchmark")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    os.environ["LLM_BACKEND"] = args.backend
+    os.environ["LLM_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["LLM_JITTER"] = str(args.jitter)
+    os.environ.setdefault("LLM_CACHE_DISABLED", "1")
+    # Every benchmark round must run the stages, not resume them
+    os.environ.setdefault("PIPELINE_CHECKPOINTS_DISABLED", "1")
+    os.environ.setdefault("TICKET_INDEX_DISABLED", "1")
+    os.environ.setdefault("SOLUTION_LIBRARY_DISABLED", "1")
+    if args.cassette:
+        os.environ["LLM_CASSETTE"] = args.cassette
+        os.environ.setdefault("LLM_REPLAY_FALLBACK", "stub")
+
+    from pipeline.bulk_pipeline import read_tickets
+
+    tickets = list(read_tickets(args.corpus))
+    if args.limit:
+        tickets = tickets[:args.limit]
+
+    rows = bench_stages(tickets)
+    rows.append(bench_orchestrate(tickets))
+    rows.append(bench_fused(tickets, rows[-1]))
+    rows.append(bench_post_review(tickets))
+    rows.extend(bench_large_review())
+    rows.extend(bench_few_shot(tickets))
+    rows.append(bench_bulk(tickets, args.concurrency))
+    rows.extend(bench_parsers(args.parse_repeat))
+    rows.extend(bench_ticket_index(tickets, args.index_size))
+    rows.extend(bench_export(args.export_size))
+
+    print(f"📊 {len(tickets)} tickets, backend={args.backend}, latency={args.latency_ms}ms\n")
+    print_table(rows)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({"args": vars(args), "results": rows}, fh, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,28 +1,10 @@
-from agents.ticket_agent import classify_ticket
-from agents.dev_agent import generate_code
-from agents.review_agent import review_code
+from pipeline.orchestrator_pipeline import orchestrate_pipeline
+from utils.retry_policy import RetryPolicy
 
-def run_pipeline(ticket_text):
-    print("🕵️ Running TicketAgent...")
-    ticket_info = classify_ticket(ticket_text)
-    
-    print("\n📋 Ticket Classification:")
-    for key, value in ticket_info.items():
-        print(f"{key.capitalize()}: {value}")
-
-    print("\n💻 Running DevAgent...")
-    code_output = generate_code(ticket_info['summary'], ticket_info['category'])
-
-    print("\n📁 File:", code_output['filename'])
-    print("\n🧾 Code:\n", code_output['code'])
-    print("\n🧠 Explanation:\n", code_output['explanation'])
-
-    print("\n🧪 Running ReviewAgent...")
-    review = review_code(code_output["code"])
-
-    print("\n📋 Review:", review['review'])
-    print("\n📊 Score:", review['score'])
-    print("\n✅ Ready:", review['ready'])
+def run_pipeline(ticket_text, write_tests=False, explain=False):
+    # The orchestrator's stages, cut down to a single attempt on the configured model
+    return orchestrate_pipeline(ticket_text, dedupe=False, write_tests=write_tests, explain=explain,
+                                policy=RetryPolicy(max_attempts=1, escalation_model=None))
 
 # Example tickets
 if __name__ == "__main__":
@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from agents.ticket_agent import aclassify_ticket
+from agents.dev_agent import agenerate_code, astream_code
+from agents.review_agent import areview_code
+from agents.test_agent import agenerate_tests
+from agents.explain_agent import aexplain_code
+from agents.improve_agent import aimprove_code
+from pipeline.orchestrator_pipeline import aorchestrate_pipeline, REVIEW_THRESHOLD
+from utils.instrumentation import recording, listening
+from utils.output_store import OutputStore, DEFAULT_OUTPUT_DIR
+from utils.sandbox_runner import format_test_report
+from utils.zip_file import iter_export_zip
+
+# HTTP front-end for the pipeline and the individual agents. Tickets run as tasks on the
+# server's event loop, API_CONCURRENCY at a time; their stage/attempt progress and the
+# DevAgent's code tokens go out as server-sent events. Finished results are written to an
+# OutputStore, so they can still be fetched once the job has left memory.
+#
+#     uvicorn pipeline.api:app          or          python -m pipeline.api --port 8000
+#     LLM_BACKEND=stub python -m pipeline.api       # no Gemini calls
+API_CONCURRENCY = int(os.getenv("API_CONCURRENCY", 16))
+# Finished jobs kept in memory for status/events; older ones are only in the OutputStore
+MAX_JOBS = 1000
+# Events kept per job for clients that connect (or reconnect) late
+MAX_EVENTS = 5000
+KEEPALIVE_SECONDS = 15.0
+
+
+class TicketRequest(BaseModel):
+    ticket: str = Field(min_length=1)
+    speculative: int = 0
+    fused: bool = False
+    execute_tests: bool = False
+    dedupe: bool = True
+    resume: bool = True
+    write_tests: bool = False
+    explain: bool = False
+
+
+class ClassifyRequest(BaseModel):
+    ticket: str = Field(min_length=1)
+
+
+class GenerateRequest(BaseModel):
+    summary: str
+    category: str = "Feature"
+    language: str = "python"
+    feedback: str | list[str] | None = None
+
+
+class CodeRequest(BaseModel):
+    code: str
+    language: str = "python"
+
+
+class ImproveRequest(CodeRequest):
+    feedback: str = ""
+
+
+def _sse(event: str, data, event_id: int | None = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class Job:
+    """A ticket running through the pipeline, with the events it produced so far."""
+
+    def __init__(self, ticket: str, options: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.ticket = ticket
+        self.options = options
+        self.status = "queued"
+        self.stage = None
+        self.attempt = None
+        self.score = None
+        self.error = None
+        self.result = None
+        self.created = self.updated = time.time()
+        self.events = deque(maxlen=MAX_EVENTS)
+        self._sequence = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def publish(self, event: str, data: dict):
+        self._sequence += 1
+        self.events.append((self._sequence, event, data))
+        self.updated = time.time()
+        # Wake every waiting stream, then start a fresh Event for the next publish
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def on_span(self, event: dict):
+        """Listener for utils/instrumentation spans: stage starts/ends and streamed tokens."""
+        kind = event.pop("event")
+        if kind == "token":
+            self.publish("token", event)
+            return
+        if kind == "start":
+            self.stage = event["stage"]
+            self.attempt = event.get("attempt", self.attempt)
+        elif event["stage"] == "attempt" and "score" in event:
+            self.score = event["score"] if self.score is None else max(self.score, event["score"])
+        self.publish(f"stage_{kind}", event)
+
+    def set_status(self, status: str, **data):
+        self.status = status
+        self.publish("status", {"status": status, **data})
+
+    def snapshot(self) -> dict:
+        return {
+            "id": self.id, "status": self.status, "stage": self.stage, "attempt": self.attempt,
+            "score": self.score, "error": self.error, "created": self.created, "updated": self.updated,
+            "ticket": self.ticket, "options": self.options,
+        }
+
+    async def stream(self, request: Request, after: int = 0):
+        """SSE lines for every event after sequence number `after`, until the job finishes."""
+        while True:
+            changed = self._changed
+            for sequence, event, data in list(self.events):
+                if sequence > after:
+                    after = sequence
+                    yield _sse(event, data, sequence)
+            if self.finished or await request.is_disconnected():
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+
+
+async def _sse_stream(request: Request, events):
+    """SSE lines for an async iterator of (event, data), ending with "done" or "error"."""
+    try:
+        async for event, data in events:
+            if await request.is_disconnected():
+                return
+            yield _sse(event, data)
+        yield _sse("done", {})
+    except Exception as e:
+        yield _sse("error", {"error": str(e)})
+
+
+def create_app(output_dir: str = DEFAULT_OUTPUT_DIR, concurrency: int = API_CONCURRENCY) -> FastAPI:
+    app = FastAPI(title="DevPilot API", description="Run tickets through the agent pipeline over HTTP.")
+    store = OutputStore(output_dir)
+    jobs = OrderedDict()
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    def remember(job: Job):
+        jobs[job.id] = job
+        # Forget the oldest finished jobs; their results stay in the OutputStore
+        while len(jobs) > MAX_JOBS:
+            oldest = next((key for key, value in jobs.items() if value.finished), None)
+            if oldest is None:
+                break
+            del jobs[oldest]
+
+    def get_job(job_id: str) -> Job:
+        if job_id not in jobs:
+            raise HTTPException(404, f"Unknown job {job_id}")
+        return jobs[job_id]
+
+    def get_result(job_id: str) -> dict:
+        job = jobs.get(job_id)
+        if job is not None and not job.finished:
+            raise HTTPException(409, f"Job {job_id} is still {job.status}")
+        if job is not None and job.status == "failed":
+            raise HTTPException(500, job.error)
+        result = job.result if job is not None else store.load(job_id)
+        if result is None:
+            raise HTTPException(404, f"Unknown job {job_id}")
+        return result
+
+    async def run(job: Job):
+        async with slots:
+            job.set_status("running")
+            loop = asyncio.get_running_loop()
+            # Spans may end in worker threads (sandboxed test runs), so hop back onto the loop
+            listener = lambda event: loop.call_soon_threadsafe(job.on_span, event)
+            try:
+                with recording(job.id) as recorder, listening(listener, tokens=True):
+                    result = await aorchestrate_pipeline(job.ticket, verbose=False, **job.options)
+                result["metrics"] = recorder.summary()
+                await asyncio.to_thread(store.save, job.id, result)
+            except Exception as e:
+                job.error = str(e)
+                await asyncio.sleep(0)  # deliver span events scheduled from threads first
+                job.set_status("failed", error=job.error)
+                return
+            job.result = result
+            job.score = result["score"]
+            await asyncio.sleep(0)
+            job.set_status("done", score=result["score"], attempts=result["attempts"],
+                           passed=result["score"] >= REVIEW_THRESHOLD, result_url=f"/tickets/{job.id}/result")
+
+    @app.get("/health")
+    async def health():
+        counts = {}
+        for job in jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"status": "ok", "jobs": counts}
+
+    @app.post("/tickets", status_code=202)
+    async def submit(body: TicketRequest):
+        """Queue a ticket for the full pipeline; poll its status or follow its events."""
+        job = Job(body.ticket, body.model_dump(exclude={"ticket"}))
+        remember(job)
+        job.publish("status", {"status": "queued"})
+        task = asyncio.create_task(run(job))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return {
+            "id": job.id,
+            "status": job.status,
+            "status_url": f"/tickets/{job.id}",
+            "events_url": f"/tickets/{job.id}/events",
+            "result_url": f"/tickets/{job.id}/result",
+        }
+
+    @app.get("/tickets/{job_id}")
+    async def status(job_id: str):
+        return get_job(job_id).snapshot()
+
+    @app.get("/tickets/{job_id}/events")
+    async def events(job_id: str, request: Request):
+        """
+        Server-sent events: "status" (queued/running/done/failed), "stage_start"/"stage_end"
+        for every pipeline stage (with attempt, score, wall_ms...) and "token" for code as
+        the DevAgent writes it. Past events are replayed first; Last-Event-ID resumes.
+        """
+        job = get_job(job_id)
+        after = int(request.headers.get("last-event-id") or 0)
+        return StreamingResponse(job.stream(request, after), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.get("/tickets/{job_id}/result")
+    async def result(job_id: str):
+        return get_result(job_id)
+
+    @app.get("/tickets/{job_id}/export")
+    async def export(job_id: str):
+        """The result's code, tests, review and test report as a streamed ZIP."""
+        result = get_result(job_id)
+        code_output = result.get("code_output") or {}
+        if not code_output.get("code"):
+            raise HTTPException(404, f"Job {job_id} produced no code")
+        chunks = iter_export_zip(
+            code_output["code"],
+            code_output.get("filename") or "solution.py",
+            (result.get("tests") or {}).get("test_code"),
+            (result.get("review") or {}).get("review"),
+            None,
+            (result.get("ticket_info") or {}).get("language", "python"),
+            format_test_report(result["test_run"]) if result.get("test_run") else None,
+        )
+        return StreamingResponse(chunks, media_type="application/zip",
+                                 headers={"Content-Disposition": f'attachment; filename="{job_id}.zip"'})
+
+    # Individual agents, answered directly
+    @app.post("/agents/classify")
+    async def classify(body: ClassifyRequest):
+        return await aclassify_ticket(body.ticket)
+
+    @app.post("/agents/generate")
+    async def generate(body: GenerateRequest):
+        return await agenerate_code(body.summary, body.category, body.language, body.feedback)
+
+    @app.post("/agents/generate/stream")
+    async def generate_stream(body: GenerateRequest, request: Request):
+        """Server-sent "filename"/"code"/"explanation" events as the code is written, then "result" and "done"."""
+        events = astream_code(body.summary, body.category, body.language, body.feedback)
+        return StreamingResponse(_sse_stream(request, events), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.post("/agents/review")
+    async def review(body: CodeRequest):
+        return await areview_code(body.code, body.language)
+
+    @app.post("/agents/tests")
+    async def tests(body: CodeRequest):
+        return await agenerate_tests(body.code, body.language)
+
+    @app.post("/agents/explain")
+    async def explain(body: CodeRequest):
+        return {"explanation": await aexplain_code(body.code, body.language)}
+
+    @app.post("/agents/improve")
+    async def improve(body: ImproveRequest):
+        return {"improved_code": await aimprove_code(body.code, body.feedback, body.language)}
+
+    return app
+
+
+app = create_app(os.getenv("PIPELINE_OUTPUT_DIR", DEFAULT_OUTPUT_DIR))
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the agent pipeline over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
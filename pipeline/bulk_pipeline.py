@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+
+from agents.ticket_agent import aclassify_tickets
+from agents.fused_agent import aclassify_and_generate
+from pipeline.orchestrator_pipeline import arun_dev_loop, checkpoint_key, find_similar, reuse_result, remember_result, REVIEW_THRESHOLD
+from utils.ticket_index import DUPLICATE_THRESHOLD
+from utils.checkpoints import get_checkpoint_store
+from utils.instrumentation import span, recording
+from utils.scheduler import priority_for
+from utils.zip_file import BulkExport, COMPRESSION, DEFAULT_COMPRESSION
+
+BATCH_SIZE = 20
+CONCURRENCY = 8
+
+
+def read_tickets(path: str = "-"):
+    """
+    Yield {"id", "ticket"} records from a JSONL or CSV file, or from stdin when path is "-".
+    JSONL/CSV rows may name the text column "ticket" or "text"; plain text lines are one ticket each.
+    """
+    stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(stream)
+        else:
+            rows = (_parse_line(line) for line in stream if line.strip())
+
+        for index, row in enumerate(rows):
+            text = (row.get("ticket") or row.get("text") or "").strip()
+            if text:
+                yield {"id": row.get("id") or str(index), "ticket": text}
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def _parse_line(line: str) -> dict:
+    line = line.strip()
+    if line.startswith("{"):
+        return json.loads(line)
+    return {"ticket": line}
+
+
+def _chunks(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _aclassify_fused(texts: list[str]) -> list[tuple]:
+    """(ticket_info, first_code_output) per ticket from the fused classify+generate call."""
+    pairs = await asyncio.gather(*(aclassify_and_generate(text) for text in texts), return_exceptions=True)
+    results = []
+    for pair in pairs:
+        if isinstance(pair, Exception):
+            results.append(({"error": str(pair)}, None))
+        else:
+            ticket_info, code_output = pair
+            results.append((ticket_info, None if "error" in code_output else code_output))
+    return results
+
+
+async def run_bulk(tickets, out, batch_size: int = BATCH_SIZE, concurrency: int = CONCURRENCY,
+                   speculative: int = 0, fused: bool = False, execute_tests: bool = False,
+                   dedupe: bool = True, archive: BulkExport | None = None) -> dict:
+    """
+    Classify tickets in batches, then fan generate/review out under a concurrency limit.
+    Each ticket's result is written to `out` as one JSON line as soon as it finishes.
+    With fused=True each ticket is classified together with its first solution, and
+    reviews write the unit tests in the same call (see agents/fused_agent.py).
+    With execute_tests=True passing solutions also have their tests run in a sandbox; the
+    runs share utils/sandbox_runner's worker pool, so at most TEST_WORKERS run at once.
+    With dedupe=True near-duplicates of already processed tickets reuse their results
+    before classification (see utils/ticket_index.py), and passing results are indexed.
+    With an `archive` every record is also added to that bulk ZIP as it finishes.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {"tickets": 0, "passed": 0, "errors": 0, "duplicates": 0}
+    started = time.perf_counter()
+
+    def emit(record: dict):
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        if archive is not None:
+            archive.add(record)
+
+    async def process(ticket: dict, ticket_info: dict, first_code_output: dict = None):
+        record = {"id": ticket["id"], "ticket": ticket["ticket"]}
+        try:
+            if "error" in ticket_info or "summary" not in ticket_info:
+                raise RuntimeError(ticket_info.get("error", "Ticket classification could not be parsed"))
+            async with semaphore:
+                started_ticket = time.perf_counter()
+                key = checkpoint_key(ticket["ticket"], speculative=speculative, fused=fused, execute_tests=execute_tests)
+                with span("pipeline", ticket=ticket["id"]):
+                    result = await arun_dev_loop(ticket_info, speculative=speculative, fused=fused,
+                                                 first_code_output=first_code_output,
+                                                 execute_tests=execute_tests, checkpoint_key=key)
+                store = get_checkpoint_store()
+                if store:
+                    store.clear(key)
+            record.update(result)
+            record["seconds"] = round(time.perf_counter() - started_ticket, 3)
+            remember_result(ticket["ticket"], result, dedupe)
+            if result["score"] >= REVIEW_THRESHOLD:
+                stats["passed"] += 1
+        except Exception as e:
+            record.update({"ticket_info": ticket_info, "error": str(e)})
+            stats["errors"] += 1
+        stats["tickets"] += 1
+        emit(record)
+
+    def reuse(ticket: dict, similar: dict):
+        emit({"id": ticket["id"], "ticket": ticket["ticket"], **reuse_result(similar), "seconds": 0.0})
+        stats["tickets"] += 1
+        stats["passed"] += 1
+        stats["duplicates"] += 1
+
+    tasks = []
+    for batch in _chunks(tickets, batch_size):
+        if dedupe:
+            fresh = []
+            for ticket in batch:
+                similar = find_similar(ticket["ticket"])
+                if similar and similar["similarity"] >= DUPLICATE_THRESHOLD:
+                    reuse(ticket, similar)
+                else:
+                    fresh.append(ticket)
+            batch = fresh
+            if not batch:
+                continue
+        texts = [t["ticket"] for t in batch]
+        if fused and speculative <= 1:
+            classified = await _aclassify_fused(texts)
+        else:
+            infos = await aclassify_tickets(texts, max_concurrency=batch_size)
+            classified = [(info, None) for info in infos]
+        # Code generation for this batch starts while the next batch is being classified.
+        # Urgent tickets are queued first, so they get the next free concurrency slots.
+        ranked = sorted(zip(batch, classified), key=lambda pair: priority_for(pair[1][0].get("urgency")))
+        tasks.extend(asyncio.create_task(process(t, *pair)) for t, pair in ranked)
+
+    await asyncio.gather(*tasks)
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+async def run_bulk_recorded(tickets, out, *args, **kwargs):
+    """run_bulk inside its own metrics Recorder; returns (stats, recorder)."""
+    with recording() as recorder:
+        stats = await run_bulk(tickets, out, *args, **kwargs)
+    return stats, recorder
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the agent pipeline over a file of tickets.")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL/CSV file of tickets, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="Output JSONL file, or - for stdout")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Tickets per classification batch")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Tickets in generate/review at once")
+    parser.add_argument("--speculative", type=int, default=0, help="Parallel candidates per attempt (0 = off)")
+    parser.add_argument("--fused", action="store_true", help="Fuse classify+generate and review+tests into one call each")
+    parser.add_argument("--run-tests", action="store_true", help="Run each passing solution's unit tests in a sandbox")
+    parser.add_argument("--metrics-dir", help="Write metrics.jsonl and metrics.prom for the run here")
+    parser.add_argument("--archive", help="Also bundle every ticket's code, tests and review into this ZIP")
+    parser.add_argument("--compression", choices=list(COMPRESSION), default=DEFAULT_COMPRESSION,
+                        help="Compression for --archive")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    archive = BulkExport(args.archive, args.compression) if args.archive else None
+    try:
+        stats, recorder = asyncio.run(run_bulk_recorded(
+            read_tickets(args.input), out, args.batch_size, args.concurrency, args.speculative, args.fused,
+            args.run_tests, archive=archive
+        ))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if archive is not None:
+            archive.close()
+
+    print(f"📦 Processed {stats['tickets']} tickets in {stats['seconds']}s "
+          f"({stats['passed']} passed, {stats['errors']} errors, {stats['duplicates']} reused)", file=sys.stderr)
+    if archive is not None:
+        print(f"🗜️ Archived {archive.count} tickets to {args.archive}", file=sys.stderr)
+    print(recorder.summary_table(), file=sys.stderr)
+    if args.metrics_dir:
+        recorder.export(args.metrics_dir)
+
+
+if __name__ == "__main__":
+    main()
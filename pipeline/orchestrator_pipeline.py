@@ -1,63 +1,653 @@
-from agents.ticket_agent import classify_ticket
-from agents.dev_agent import generate_code
-from agents.review_agent import review_code
 
-MAX_ATTEMPTS = 3
-REVIEW_THRESHOLD = 7.0
+import asyncio
+import hashlib
+import time
+from contextlib import contextmanager
 
-def orchestrate_pipeline(user_ticket: str):
-    print("📨 User Ticket Received")
-    print(f"📝 {user_ticket}\n")
+from agents.ticket_agent import classify_ticket, aclassify_ticket
+from agents.dev_agent import generate_code, agenerate_code
+from agents.review_agent import review_code, areview_code
+from agents.test_agent import generate_tests, agenerate_tests
+from agents.fused_agent import classify_and_generate, aclassify_and_generate, review_and_test, areview_and_test
+from agents.explain_agent import explain_code, aexplain_code
+from utils.sandbox_runner import run_tests, arun_tests, failed_tests_feedback
+from utils.instrumentation import span, recording, export_from_env, annotate
+from utils.scheduler import urgency
+from utils.checkpoints import get_checkpoint_store
+from utils.ticket_index import get_ticket_index, DUPLICATE_THRESHOLD
+from utils.solution_library import remember_solution
+from utils.retry_policy import RetryPolicy, get_retry_policy, REVIEW_THRESHOLD
+from utils.token_budget import budget_for, truncate
+from utils.stage_graph import StageGraph, GraphRun
+
+def ticket_key(user_ticket: str) -> str:
+    """Short stable id for a ticket text, used to label metrics."""
+    return hashlib.sha1(user_ticket.strip().encode("utf-8")).hexdigest()[:12]
 
-    print("🕵️ Running TicketAgent...")
-    ticket_info = classify_ticket(user_ticket)
+def checkpoint_key(user_ticket: str, **options) -> str:
+    """
+    Id a run's checkpoints are saved under: the ticket text and the options that shape the
+    run (speculative, fused, execute_tests...), so a run with other options starts afresh.
+    """
+    settings = ",".join(f"{name}={value}" for name, value in sorted(options.items()))
+    return hashlib.sha1(f"{user_ticket.strip()}\n{settings}".encode("utf-8")).hexdigest()[:16]
 
+def _print_classification(ticket_info: dict):
     print("\n📋 Ticket Classification:")
     for key, value in ticket_info.items():
         print(f"{key.capitalize()}: {value}")
 
-    attempts = 0
-    best_score = 0.0
-    best_review = None
-    best_code_output = None
-
-    while attempts < MAX_ATTEMPTS:
-        print(f"\n💻 Running DevAgent... (Attempt {attempts + 1})")
-        code_output = generate_code(ticket_info['summary'], ticket_info['category'])
-
-        print("\n📁 File:", code_output['filename'])
-        print("\n🧾 Code:\n", code_output['code'])
-        print("\n🧠 Explanation:\n", code_output['explanation'])
+def _print_code(code_output: dict):
+    print("\n📁 File:", code_output.get('filename'))
+    print("\n🧾 Code:\n", code_output.get('code'))
+    print("\n🧠 Explanation:\n", code_output.get('explanation'))
 
-        print("\n🧪 Running ReviewAgent...")
-        review = review_code(code_output["code"])
-        score = review["score"]
+def _print_review(review: dict):
+    print("\n📋 Review:", review['review'])
+    print("📊 Score:", review['score'])
+    print("✅ Ready:", review['ready'])
 
-        print("\n📋 Review:", review['review'])
-        print("📊 Score:", score)
-        print("✅ Ready:", review['ready'])
+def _print_test_run(test_run: dict):
+    print(f"\n🧪 Tests: {test_run['status']} ({test_run.get('passed', 0)} passed, "
+          f"{test_run.get('failed', 0)} failed, {test_run.get('errors', 0)} errors)")
+    if test_run.get("error"):
+        print("⚠️", test_run["error"])
 
-        if score > best_score:
-            best_score = score
-            best_review = review
-            best_code_output = code_output
+def _print_retry(report: dict):
+    if report["stopped"] == "plateau":
+        print(f"\n⏹️ Scores plateaued ({report['scores']}), stopped early: saved {report['saved_attempts']} "
+              f"attempt(s), ~{report['saved_seconds']}s")
 
-        if score >= REVIEW_THRESHOLD:
-            print("\n🎉 Code passed the review threshold!")
-            break
+def _print_final(result: dict):
+    best_code_output = result["code_output"]
+    best_review = result["review"]
+    best_score = result["score"]
 
-        print(f"\n⚠️ Score {score} is below threshold ({REVIEW_THRESHOLD}). Retrying...\n")
-        attempts += 1
+    if best_review is None:
+        print("\n❌ No attempt produced a reviewable result.")
+        return
 
     if best_score < REVIEW_THRESHOLD:
         print(f"\n❌ Max attempts reached. Best score achieved: {best_score}")
 
     print("\n📦 Final Output:")
-    print("📁 File:", best_code_output['filename'])
-    print("🧾 Code:\n", best_code_output['code'])
+    print("📁 File:", best_code_output.get('filename'))
+    print("🧾 Code:\n", best_code_output.get('code'))
     print("📋 Final Review:", best_review['review'])
     print("📊 Final Score:", best_score)
     print("✅ Ready Status:", best_review['ready'])
+    tests = result.get("tests")
+    if tests and "error" not in tests:
+        print(f"🧪 Unit Tests ({tests['framework']}):\n", tests['test_code'])
+    if result.get("explanation"):
+        print("🧠 Explanation:\n", result["explanation"])
+
+def ticket_graph(classify, dev_loop, write_tests=None, explain=None) -> StageGraph:
+    """
+    The stages every front-end runs a ticket through, each with its own (printing, async or
+    Streamlit) implementation of them:
+
+        classification ─► dev_loop ─┬─► unit_tests    (when the best code passed)
+                                    └─► explanation   (when there is code)
+
+    classify(ticket, similar) returns (ticket_info, first_code_output); dev_loop(classification)
+    is the generate/review retry loop and returns the result dict. Writing the tests and the
+    explanation only needs its code, so they run concurrently and the time after review is
+    the slower of the two. Stages left as None are not part of the graph.
+    """
+    graph = StageGraph()
+    graph.add("classification", classify, inputs=("ticket", "similar"))
+    graph.add("dev_loop", dev_loop, inputs=("classification",))
+    if write_tests is not None:
+        graph.add("unit_tests", write_tests, inputs=("dev_loop",), when=_passed)
+    if explain is not None:
+        graph.add("explanation", explain, inputs=("dev_loop",), when=_has_code)
+    return graph
+
+def _has_code(dev_loop: dict) -> bool:
+    return bool((dev_loop["code_output"] or {}).get("code"))
+
+def _passed(dev_loop: dict) -> bool:
+    return _has_code(dev_loop) and dev_loop["score"] >= REVIEW_THRESHOLD and not _tests_failed(dev_loop.get("test_run"))
+
+def _language(dev_loop: dict) -> str:
+    return dev_loop["ticket_info"].get("language", "python").lower()
+
+def write_unit_tests(dev_loop: dict) -> dict:
+    """unit_tests stage: the tests the dev loop already wrote (fused or executed), else new ones."""
+    tests = dev_loop.get("tests")
+    if tests and "error" not in tests:
+        return tests
+    return generate_tests(dev_loop["code_output"]["code"], _language(dev_loop))
+
+async def awrite_unit_tests(dev_loop: dict) -> dict:
+    tests = dev_loop.get("tests")
+    if tests and "error" not in tests:
+        return tests
+    return await agenerate_tests(dev_loop["code_output"]["code"], _language(dev_loop))
+
+def explain_solution(dev_loop: dict) -> str:
+    """explanation stage: a walk-through of the best code."""
+    return explain_code(dev_loop["code_output"]["code"], _language(dev_loop))
+
+async def aexplain_solution(dev_loop: dict) -> str:
+    return await aexplain_code(dev_loop["code_output"]["code"], _language(dev_loop))
+
+def graph_result(run: GraphRun) -> dict:
+    """The dev loop's result with what the post-review stages wrote, and the graph's stage timings."""
+    result = run["dev_loop"]
+    if run.get("unit_tests"):
+        result["tests"] = run["unit_tests"]
+    if run.get("explanation"):
+        result["explanation"] = run["explanation"]
+    result["stages"] = run.timings
+    return result
+
+async def _acandidate(ticket_info: dict, language: str, number: int, feedback=None, **plan):
+    # The label keeps concurrent candidates' spans (and streamed tokens) apart
+    with span("candidate", candidate=number):
+        code_output = await agenerate_code(ticket_info['summary'], ticket_info['category'], language, feedback,
+                                           cache=False, **plan)
+        review = await areview_code(code_output.get("code", ""), language)
+    return code_output, review
+
+async def aspeculative_attempt(ticket_info: dict, language: str, candidates: int, feedback=None, **plan):
+    """
+    Generate `candidates` solutions concurrently and review each as soon as it is written.
+    Once any candidate clears REVIEW_THRESHOLD the outstanding calls are cancelled, and the
+    best-scoring finished candidate is returned as (code_output, review).
+    `plan` (model/temperature, see RetryRun.plan) is passed on to the DevAgent.
+    Failed candidates are listed on the enclosing span as "candidate_errors"; if every
+    candidate failed the first one's exception is raised.
+    """
+    pending = {asyncio.create_task(_acandidate(ticket_info, language, number, feedback, **plan))
+               for number in range(1, candidates + 1)}
+    finished, errors = [], []
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    finished.append(task.result())
+                else:
+                    errors.append(task.exception())
+            if any(review["score"] >= REVIEW_THRESHOLD for _, review in finished):
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    if errors:
+        annotate(candidate_errors=[f"{type(e).__name__}: {e}" for e in errors])
+    if not finished:
+        raise errors[0]
+    return max(finished, key=lambda candidate: candidate[1]["score"])
+
+def orchestrate_pipeline(user_ticket: str, speculative: int = 0, fused: bool = False,
+                         execute_tests: bool = False, resume: bool = True, dedupe: bool = True,
+                         policy: RetryPolicy | None = None, write_tests: bool = False,
+                         explain: bool = False) -> dict:
+    """
+    Classify a ticket, then generate and review code until it clears REVIEW_THRESHOLD.
+    With speculative > 1 each attempt runs that many candidates in parallel (see aspeculative_attempt).
+    With fused=True classification shares a call with the first generation, and every review
+    also writes the unit tests (see agents/fused_agent.py); result["tests"] holds them.
+    With execute_tests=True an attempt that clears the review also has its unit tests run in
+    a sandbox (utils/sandbox_runner.py); failing tests send it back to the DevAgent like a
+    low score would, and result["test_run"] holds the run.
+    Each stage is checkpointed under checkpoint_key(user_ticket, <options>) (see
+    utils/checkpoints.py), so a run that dies part-way resumes after its last completed stage
+    when the ticket is run again with the same options; resume=False discards the checkpoints
+    and starts over. A run that completes clears them.
+    With dedupe=True a near-duplicate of an earlier passing ticket (utils/ticket_index.py)
+    returns that ticket's result without any LLM call (result["duplicate_of"] says which);
+    a merely similar one reuses its classification. Passing results are added to the index,
+    and to the solution library the DevAgent draws few-shot examples from either way.
+    `policy` (default get_retry_policy()) decides when to retry, stop early or escalate to a
+    stronger model; result["retry"] reports what it did and the attempts it saved.
+    The stages run as ticket_graph: with write_tests=True a passing solution gets unit tests
+    (unless the loop already wrote them) and with explain=True result["explanation"] walks
+    through the code; both are written at the same time. result["stages"] times each stage.
+    Prints a per-stage timing/token summary at the end; set PIPELINE_METRICS_DIR to also
+    export metrics.jsonl and metrics.prom.
+    """
+    key = checkpoint_key(user_ticket, speculative=speculative, fused=fused, execute_tests=execute_tests)
+    if not resume:
+        _clear_checkpoints(key)
+    with recording() as recorder:
+        with span("pipeline", ticket=ticket_key(user_ticket)):
+            result = _orchestrate_pipeline(user_ticket, speculative, fused, execute_tests, key, dedupe,
+                                           policy or get_retry_policy(), write_tests, explain)
+    _clear_checkpoints(key)
+
+    print("\n⏱️ Stage Summary:")
+    print(recorder.summary_table())
+    export_from_env(recorder)
+    remember_result(user_ticket, result, dedupe)
+    result["metrics"] = recorder.summary()
+    return result
+
+def find_similar(user_ticket: str) -> dict | None:
+    """The closest earlier ticket above SIMILAR_THRESHOLD (see utils/ticket_index.py), or None."""
+    index = get_ticket_index()
+    if index is None:
+        return None
+    with span("dedupe") as record:
+        similar = index.lookup(user_ticket)
+        record["similarity"] = similar["similarity"] if similar else 0.0
+    return similar
+
+def reuse_result(similar: dict) -> dict:
+    """An earlier ticket's result, marked with the ticket it came from."""
+    return {**similar["result"], "attempts": 0,
+            "duplicate_of": {"ticket": similar["ticket"], "similarity": similar["similarity"]}}
+
+def reuse_classification(user_ticket: str, similar: dict) -> dict:
+    """
+    A similar ticket's category, urgency and language. Similar tickets can still ask for
+    different things ("Logout..." vs "Login..."), so the summary is this ticket's own text.
+    """
+    ticket_info = similar["result"]["ticket_info"]
+    reused = {field: ticket_info[field] for field in ("category", "urgency", "language") if field in ticket_info}
+    return {**reused, "summary": truncate(" ".join(user_ticket.split()), budget_for("ticket"))}
+
+def remember_result(user_ticket: str, result: dict, dedupe: bool = True):
+    """
+    Keep a passing result: as a few-shot example for the DevAgent (utils/solution_library.py)
+    and, with dedupe, in the ticket index so later near-duplicates can reuse it.
+    """
+    if "duplicate_of" in result or result["score"] < REVIEW_THRESHOLD or _tests_failed(result.get("test_run")):
+        return
+    remember_solution(result["ticket_info"], result["code_output"])
+    index = get_ticket_index() if dedupe else None
+    if index is not None:
+        index.add(user_ticket, result)
+
+def _load_checkpoint(key: str | None, stage: str):
+    store = get_checkpoint_store() if key else None
+    return store.load(key, stage) if store else None
+
+def _save_checkpoint(key: str | None, stage: str, value):
+    store = get_checkpoint_store() if key else None
+    if store:
+        store.save(key, stage, value)
+
+def _clear_checkpoints(key: str):
+    store = get_checkpoint_store()
+    if store:
+        store.clear(key)
+
+def _tests_failed(test_run: dict | None) -> bool:
+    # "skipped" means there is no runner for the language, which says nothing about the code
+    return bool(test_run) and test_run["status"] in ("failed", "error")
+
+def _attempt_tests(code_output: dict, language: str, tests: dict | None,
+                   key: str | None = None, attempt: int = 0) -> tuple[dict, dict | None]:
+    """
+    Generate tests for an attempt that cleared the review (unless fused ones exist) and run
+    them. A completed run is checkpointed as "tests-<attempt>".
+    """
+    saved = _load_checkpoint(key, f"tests-{attempt}")
+    if saved:
+        return saved["tests"], saved["test_run"]
+    if not tests or "error" in tests:
+        tests = generate_tests(code_output.get("code", ""), language)
+    if "error" in tests:
+        return tests, None
+    test_run = run_tests(code_output.get("code", ""), code_output.get("filename", ""), tests["test_code"], language)
+    _save_checkpoint(key, f"tests-{attempt}", {"tests": tests, "test_run": test_run})
+    return tests, test_run
+
+async def _aattempt_tests(code_output: dict, language: str, tests: dict | None,
+                          key: str | None = None, attempt: int = 0) -> tuple[dict, dict | None]:
+    saved = _load_checkpoint(key, f"tests-{attempt}")
+    if saved:
+        return saved["tests"], saved["test_run"]
+    if not tests or "error" in tests:
+        tests = await agenerate_tests(code_output.get("code", ""), language)
+    if "error" in tests:
+        return tests, None
+    test_run = await arun_tests(code_output.get("code", ""), code_output.get("filename", ""), tests["test_code"], language)
+    _save_checkpoint(key, f"tests-{attempt}", {"tests": tests, "test_run": test_run})
+    return tests, test_run
+
+def _fused_classification_usable(ticket_info: dict, code_output: dict) -> bool:
+    return "summary" in ticket_info and "error" not in code_output
+
+def _classify(user_ticket: str, similar: dict | None, speculative: int, fused: bool,
+              key: str | None) -> tuple[dict, dict | None]:
+    """classification stage: (ticket_info, first_code_output) from a checkpoint, a similar ticket or the TicketAgent."""
+    # Speculative attempts race fresh candidates, so there is no first solution to fuse in
+    fused_code_output = None
+    classified = _load_checkpoint(key, "classify")
+    if classified:
+        print("♻️ Classification resumed from checkpoint")
+        ticket_info, fused_code_output = classified["ticket_info"], classified["first_code_output"]
+    elif similar:
+        print(f"♻️ Reusing the category, urgency and language of a similar ticket (similarity {similar['similarity']})")
+        ticket_info = reuse_classification(user_ticket, similar)
+    elif fused and speculative <= 1:
+        print("🕵️ Running TicketAgent + DevAgent in one call...")
+        ticket_info, fused_code_output = classify_and_generate(user_ticket)
+        if not _fused_classification_usable(ticket_info, fused_code_output):
+            print("⚠️ Fused output could not be parsed, classifying separately...")
+            ticket_info, fused_code_output = classify_ticket(user_ticket), None
+    else:
+        print("🕵️ Running TicketAgent...")
+        ticket_info = classify_ticket(user_ticket)
+    if not classified and "summary" in ticket_info:
+        _save_checkpoint(key, "classify", {"ticket_info": ticket_info, "first_code_output": fused_code_output})
+    _print_classification(ticket_info)
+    return ticket_info, fused_code_output
+
+def _orchestrate_pipeline(user_ticket: str, speculative: int, fused: bool, execute_tests: bool,
+                          key: str | None, dedupe: bool, policy: RetryPolicy,
+                          write_tests: bool, explain: bool) -> dict:
+    print("📨 User Ticket Received")
+    print(f"📝 {user_ticket}\n")
+
+    similar = find_similar(user_ticket) if dedupe else None
+    if similar and similar["similarity"] >= DUPLICATE_THRESHOLD:
+        print(f"♻️ Near-duplicate of an earlier ticket (similarity {similar['similarity']}), reusing its result:")
+        print(f"   {similar['ticket']}")
+        result = reuse_result(similar)
+        _print_final(result)
+        return result
+
+    graph = ticket_graph(
+        lambda ticket, similar: _classify(ticket, similar, speculative, fused, key),
+        lambda classification: _dev_loop(*classification, speculative, fused, execute_tests, key, policy),
+        write_unit_tests if write_tests else None,
+        explain_solution if explain else None,
+    )
+    result = graph_result(graph.run(ticket=user_ticket, similar=similar))
+    _print_retry(result["retry"])
+    _print_final(result)
+    return result
+
+class Attempt:
+    """One attempt of a DevLoop: its number, the DevAgent plan and what it produced."""
+
+    def __init__(self, loop: "DevLoop", number: int, plan: dict, saved: dict | None):
+        self.loop = loop
+        self.number = number
+        self.plan = plan
+        # The attempt's checkpoint, when it is resumed instead of run
+        self.saved = saved
+        self.code_output = None
+        self.review = None
+        self.tests = None
+        self.test_run = None
+        self.started = time.perf_counter()
+        self._record = None
+
+    @contextmanager
+    def running(self):
+        """The attempt's span; the LLM calls made inside queue at the ticket's urgency."""
+        with span("attempt", attempt=self.number) as record, urgency(self.loop.ticket_info.get("urgency")):
+            record.update(self.plan)
+            if self.saved:
+                record["resumed"] = True
+            self._record = record
+            yield self
+
+    def resume(self):
+        """Take the code, review and tests from the attempt's checkpoint."""
+        self.reviewed(self.saved["code_output"], self.saved["review"], self.saved["tests"])
+
+    def reviewed(self, code_output: dict, review: dict, tests: dict | None = None):
+        """Store the attempt's code and review (and fused tests), checkpointing a new attempt."""
+        self.code_output, self.review, self.tests = code_output, review, tests
+        if not self.saved:
+            _save_checkpoint(self.loop.key, f"attempt-{self.number}",
+                             {"code_output": code_output, "review": review, "tests": tests})
+        if self._record is not None:
+            self._record["score"] = review["score"]
+
+    @property
+    def score(self) -> float:
+        return self.review["score"]
+
+    @property
+    def cleared(self) -> bool:
+        """Whether the review score reached the threshold; the tests may still fail."""
+        return self.score >= self.loop.policy.threshold
+
+    @property
+    def passed(self) -> bool:
+        return self.cleared and not _tests_failed(self.test_run)
+
+    def rank(self) -> tuple:
+        # An attempt whose tests failed only wins when nothing better came along
+        return not _tests_failed(self.test_run), self.score
+
+class DevLoop:
+    """
+    Bookkeeping of a ticket's generate/review attempts, shared by the printing, async and
+    Streamlit dev loops, which only differ in how they run and show an attempt:
+
+        loop = DevLoop(ticket_info, policy, key, notify)
+        while (attempt := loop.start()) is not None:
+            with attempt.running():
+                ... attempt.resume() or attempt.reviewed(code_output, review) ...
+            loop.finish(attempt)
+        return loop.result()
+
+    start() plans the next attempt (see RetryRun.plan) and loads its checkpoint; finish()
+    keeps the best attempt, asks the policy whether to go on and adds the attempt's review
+    (or failed tests) to the feedback the DevAgent gets. notify(event, attempt) is told
+    "passed", "retry", "plateau" or "exhausted" so the caller can print or render it.
+    """
+
+    def __init__(self, ticket_info: dict, policy: RetryPolicy | None = None, key: str | None = None,
+                 notify=None):
+        self.ticket_info = ticket_info
+        self.language = ticket_info.get("language", "python").lower()
+        self.policy = policy or get_retry_policy()
+        self.key = key
+        self.notify = notify or (lambda event, attempt: None)
+        self.retry = self.policy.start(ticket_info.get("urgency"))
+        # Every attempt's review; the dev agent compacts them to its token budget
+        self.feedback = []
+        self.attempts = 0
+        self.best = None
+
+    def start(self) -> Attempt | None:
+        """The next attempt, or None once one passed or the policy gave up."""
+        if self.retry.stopped or self.attempts >= self.policy.max_attempts:
+            return None
+        self.attempts += 1
+        return Attempt(self, self.attempts, self.retry.plan(), _load_checkpoint(self.key, f"attempt-{self.attempts}"))
+
+    def finish(self, attempt: Attempt) -> str:
+        """Record a reviewed (and maybe tested) attempt. Returns RetryRun.record's decision."""
+        if self.best is None or attempt.rank() > self.best.rank():
+            self.best = attempt
+        decision = self.retry.record(attempt.score, attempt.passed, time.perf_counter() - attempt.started)
+        if decision == "retry":
+            self.feedback.append(failed_tests_feedback(attempt.test_run) if attempt.cleared
+                                 else attempt.review.get("review", ""))
+        self.notify(decision if decision != "stop" else self.retry.stopped, attempt)
+        return decision
+
+    def result(self) -> dict:
+        """The best attempt as {ticket_info, code_output, review, score, attempts, tests, test_run, retry}."""
+        best = self.best
+        return {
+            "ticket_info": self.ticket_info,
+            "code_output": best.code_output if best else None,
+            "review": best.review if best else None,
+            "score": best.score if best else 0.0,
+            "attempts": self.attempts,
+            "tests": best.tests if best else None,
+            "test_run": best.test_run if best else None,
+            "retry": self.retry.report(),
+        }
+
+def _print_outcome(event: str, attempt: Attempt):
+    if event == "passed":
+        print("\n🎉 Code passed the review threshold!")
+    elif event == "retry" and attempt.cleared:
+        print("\n⚠️ Unit tests failed. Retrying...\n")
+    elif event == "retry":
+        print(f"\n⚠️ Score {attempt.score} is below threshold ({attempt.loop.policy.threshold}). Retrying...\n")
+
+def _dev_loop(ticket_info: dict, fused_code_output: dict | None, speculative: int, fused: bool,
+              execute_tests: bool, key: str | None, policy: RetryPolicy) -> dict:
+    """
+    dev_loop stage of orchestrate_pipeline: generate and review until an attempt clears the
+    threshold or the policy gives up, printing each attempt. Returns the best attempt.
+    """
+    loop = DevLoop(ticket_info, policy, key, _print_outcome)
+    language = loop.language
+    while (attempt := loop.start()) is not None:
+        with attempt.running():
+            if attempt.saved:
+                print(f"\n♻️ Attempt {attempt.number} resumed from checkpoint")
+                attempt.resume()
+                _print_code(attempt.code_output)
+            elif speculative > 1:
+                print(f"\n💻 Running {speculative} DevAgent + ReviewAgent candidates in parallel... (Attempt {attempt.number})")
+                attempt.reviewed(*asyncio.run(
+                    aspeculative_attempt(ticket_info, language, speculative, loop.feedback, **attempt.plan)
+                ))
+                _print_code(attempt.code_output)
+            else:
+                if attempt.number == 1 and fused_code_output:
+                    code_output = fused_code_output
+                else:
+                    escalated = f" on {attempt.plan['model']}" if attempt.plan["model"] else ""
+                    print(f"\n💻 Running DevAgent{escalated}... (Attempt {attempt.number})")
+                    code_output = generate_code(ticket_info['summary'], ticket_info['category'], language,
+                                                loop.feedback, **attempt.plan)
+                _print_code(code_output)
+
+                if fused:
+                    print("\n🧪 Running ReviewAgent + TestAgent in one call...")
+                    attempt.reviewed(code_output, *review_and_test(code_output.get("code", ""), language))
+                else:
+                    print("\n🧪 Running ReviewAgent...")
+                    attempt.reviewed(code_output, review_code(code_output.get("code", ""), language))
+            _print_review(attempt.review)
+
+            if execute_tests and attempt.cleared:
+                print("\n🧪 Running the unit tests...")
+                attempt.tests, attempt.test_run = _attempt_tests(attempt.code_output, language, attempt.tests,
+                                                                 key, attempt.number)
+                if attempt.test_run:
+                    _print_test_run(attempt.test_run)
+        loop.finish(attempt)
+    return loop.result()
+
+async def arun_dev_loop(ticket_info: dict, verbose: bool = False, speculative: int = 0,
+                        fused: bool = False, first_code_output: dict = None,
+                        execute_tests: bool = False, checkpoint_key: str | None = None,
+                        policy: RetryPolicy | None = None) -> dict:
+    """
+    Generate/review retry loop for an already classified ticket.
+    With speculative > 1 each attempt races that many candidates (see aspeculative_attempt).
+    With fused=True reviews also write unit tests in the same call. `first_code_output`, e.g.
+    from aclassify_and_generate, is reviewed as the first attempt instead of generating one.
+    execute_tests=True runs the tests of attempts that clear the review (see orchestrate_pipeline).
+    With a `checkpoint_key` (see checkpoint_key()) attempts are checkpointed and resumed
+    like orchestrate_pipeline's; clearing them once the ticket is done is up to the caller.
+    `policy` defaults to get_retry_policy().
+    Returns the best attempt as {ticket_info, code_output, review, score, attempts, tests, test_run, retry}.
+    """
+    loop = DevLoop(ticket_info, policy, checkpoint_key, _print_outcome if verbose else None)
+    language = loop.language
+    while (attempt := loop.start()) is not None:
+        with attempt.running():
+            if attempt.saved:
+                attempt.resume()
+            elif speculative > 1:
+                attempt.reviewed(*await aspeculative_attempt(ticket_info, language, speculative,
+                                                             loop.feedback, **attempt.plan))
+            else:
+                if attempt.number == 1 and first_code_output:
+                    code_output = first_code_output
+                else:
+                    code_output = await agenerate_code(ticket_info['summary'], ticket_info['category'], language,
+                                                       loop.feedback, **attempt.plan)
+                if fused:
+                    attempt.reviewed(code_output, *await areview_and_test(code_output.get("code", ""), language))
+                else:
+                    attempt.reviewed(code_output, await areview_code(code_output.get("code", ""), language))
+            if execute_tests and attempt.cleared:
+                attempt.tests, attempt.test_run = await _aattempt_tests(attempt.code_output, language, attempt.tests,
+                                                                        checkpoint_key, attempt.number)
+            if verbose:
+                print(f"\n💻 DevAgent + ReviewAgent (Attempt {attempt.number})")
+                _print_code(attempt.code_output)
+                _print_review(attempt.review)
+                if attempt.test_run:
+                    _print_test_run(attempt.test_run)
+        loop.finish(attempt)
+    return loop.result()
+
+async def _aclassify(user_ticket: str, similar: dict | None, speculative: int, fused: bool,
+                     key: str | None, verbose: bool) -> tuple[dict, dict | None]:
+    first_code_output = None
+    classified = _load_checkpoint(key, "classify")
+    if classified:
+        ticket_info, first_code_output = classified["ticket_info"], classified["first_code_output"]
+    elif similar:
+        ticket_info = reuse_classification(user_ticket, similar)
+    elif fused and speculative <= 1:
+        ticket_info, first_code_output = await aclassify_and_generate(user_ticket)
+        if not _fused_classification_usable(ticket_info, first_code_output):
+            ticket_info, first_code_output = await aclassify_ticket(user_ticket), None
+    else:
+        ticket_info = await aclassify_ticket(user_ticket)
+    if not classified and "summary" in ticket_info:
+        _save_checkpoint(key, "classify", {"ticket_info": ticket_info, "first_code_output": first_code_output})
+    if verbose:
+        print("📨 User Ticket Received")
+        print(f"📝 {user_ticket}\n")
+        _print_classification(ticket_info)
+    return ticket_info, first_code_output
+
+async def aorchestrate_pipeline(user_ticket: str, verbose: bool = True, speculative: int = 0,
+                               fused: bool = False, execute_tests: bool = False, resume: bool = True,
+                               dedupe: bool = True, policy: RetryPolicy | None = None,
+                               write_tests: bool = False, explain: bool = False) -> dict:
+    """
+    Non-blocking version of orchestrate_pipeline. Every agent call is awaited,
+    so many tickets can share one event loop, e.g.
+    asyncio.gather(*(aorchestrate_pipeline(t, verbose=False) for t in tickets)).
+    """
+    key = checkpoint_key(user_ticket, speculative=speculative, fused=fused, execute_tests=execute_tests)
+    if not resume:
+        _clear_checkpoints(key)
+
+    async def classify(ticket, similar):
+        return await _aclassify(ticket, similar, speculative, fused, key, verbose)
+
+    async def dev_loop(classification):
+        ticket_info, first_code_output = classification
+        return await arun_dev_loop(ticket_info, verbose, speculative, fused, first_code_output,
+                                   execute_tests, key, policy)
+
+    with span("pipeline", ticket=ticket_key(user_ticket)):
+        similar = find_similar(user_ticket) if dedupe else None
+        if similar and similar["similarity"] >= DUPLICATE_THRESHOLD:
+            result = reuse_result(similar)
+            if verbose:
+                print(f"♻️ Near-duplicate of an earlier ticket (similarity {similar['similarity']}): {similar['ticket']}")
+                _print_final(result)
+            return result
+
+        graph = ticket_graph(classify, dev_loop,
+                             awrite_unit_tests if write_tests else None,
+                             aexplain_solution if explain else None)
+        result = graph_result(await graph.arun(ticket=user_ticket, similar=similar))
+    _clear_checkpoints(key)
+    remember_result(user_ticket, result, dedupe)
+    if verbose:
+        _print_retry(result["retry"])
+        _print_final(result)
+    return result
 
 # Example ticket
 if __name__ == "__main__":
@@ -1,18 +1,216 @@
 import sys
 import os
+import asyncio
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 import streamlit as st
 from agents.ticket_agent import classify_ticket
-from agents.dev_agent import generate_code
-from agents.review_agent import review_code
+from agents.dev_agent import stream_code
+from agents.review_agent import review_code, review_code_incremental
 from agents.test_agent import generate_tests
 from agents.improve_agent import improve_code
 from agents.explain_agent import explain_code
+from agents.fused_agent import classify_and_generate, review_and_test
 from utils.zip_file import create_export_zip 
+from utils.sandbox_runner import run_tests, format_test_report
+from utils.llm_cache import get_response_cache
+from pipeline.orchestrator_pipeline import (Attempt, DevLoop, aspeculative_attempt, checkpoint_key, find_similar,
+                                            remember_result, reuse_classification, ticket_graph, graph_result,
+                                            write_unit_tests)
+from utils.ticket_index import DUPLICATE_THRESHOLD
+from utils.checkpoints import get_checkpoint_store
+from utils.instrumentation import recording, export_from_env
+from utils.memo import BoundedMemo
+from utils.retry_policy import get_retry_policy
+
+MEMO_SIZE = 16
+
+def _show_test_run(test_run: dict):
+    if test_run["status"] == "skipped":
+        st.info(f"ℹ️ {test_run['error']}")
+        return
+    summary = (f"{test_run['passed']} passed, {test_run['failed']} failed, "
+               f"{test_run['errors']} errors in {test_run['duration_s']}s")
+    if test_run["status"] == "passed":
+        st.success(f"✅ {summary}")
+    else:
+        st.error(f"❌ {test_run.get('error') or summary}")
+    if test_run.get("output"):
+        st.expander("🖥️ Test Output").code(test_run["output"], language="bash")
+
+def _classify(ticket: str, similar: dict | None, key: str) -> tuple:
+    """classification stage (see ticket_graph); like the dev loop it runs on the script thread, so it can render."""
+    # Speculative attempts race fresh candidates, so there is no first solution to fuse in
+    fused_code_output = None
+    classified = checkpoints.load(key, "classify") if checkpoints else None
+    if classified:
+        st.info("♻️ Classification resumed from checkpoint")
+        ticket_info, fused_code_output = classified["ticket_info"], classified["first_code_output"]
+    elif similar:
+        st.info(f"♻️ Reusing the category, urgency and language of a similar ticket (similarity {similar['similarity']})")
+        ticket_info = reuse_classification(ticket, similar)
+    elif fused and speculative <= 1:
+        with st.spinner("🕵️ Running TicketAgent + DevAgent..."):
+            ticket_info, fused_code_output = classify_and_generate(ticket)
+        if "summary" not in ticket_info or "error" in fused_code_output:
+            with st.spinner("🕵️ Running TicketAgent..."):
+                ticket_info, fused_code_output = classify_ticket(ticket), None
+    else:
+        with st.spinner("🕵️ Running TicketAgent..."):
+            ticket_info = classify_ticket(ticket)
+    if checkpoints and not classified and "summary" in ticket_info:
+        checkpoints.save(key, "classify", {"ticket_info": ticket_info, "first_code_output": fused_code_output})
+    st.subheader("📋 Ticket Classification")
+    st.json(ticket_info)
+    return ticket_info, fused_code_output
+
+def _show_outcome(event: str, attempt: Attempt):
+    if event == "retry" and attempt.cleared:
+        st.warning("⚠️ Unit tests failed. Retrying...\n")
+    elif event == "retry":
+        st.warning(f"⚠️ Score {attempt.score} is below threshold ({attempt.loop.policy.threshold}). Retrying...\n")
+    elif event == "plateau":
+        report = attempt.loop.retry.report()
+        st.info(f"⏹️ Scores plateaued ({report['scores']}), stopped early: saved "
+                f"{report['saved_attempts']} attempt(s), ~{report['saved_seconds']}s")
+
+def _show_code(code_output: dict, language: str):
+    st.markdown(f"**Filename**: `{code_output['filename']}`")
+    st.code(code_output['code'], language=language)
+    st.expander("🧠 Explanation").write(code_output['explanation'])
+
+def _dev_loop(classification: tuple, key: str) -> dict:
+    """dev_loop stage: the generate/review attempts (see DevLoop), streamed into the page."""
+    ticket_info, fused_code_output = classification
+    loop = DevLoop(ticket_info, get_retry_policy(), key, _show_outcome)
+    language = loop.language
+
+    while (attempt := loop.start()) is not None:
+        # Calls for this ticket queue at its urgency when the LLM quota is exhausted
+        with attempt.running():
+            if attempt.saved:
+                attempt.resume()
+                st.subheader(f"📁 Code Output - Attempt {attempt.number} (resumed from checkpoint)")
+                _show_code(attempt.code_output, language)
+            elif speculative > 1:
+                with st.spinner(f"⚡ Racing {speculative} DevAgent candidates (Attempt {attempt.number})..."):
+                    attempt.reviewed(*asyncio.run(aspeculative_attempt(
+                        ticket_info,
+                        language,
+                        speculative,
+                        loop.feedback,
+                        **attempt.plan
+                    )))
+                st.subheader(f"📁 Code Output - Attempt {attempt.number}")
+                _show_code(attempt.code_output, language)
+            else:
+                if attempt.number == 1 and fused_code_output:
+                    code_output = fused_code_output
+                    st.subheader(f"📁 Code Output - Attempt {attempt.number}")
+                    _show_code(code_output, language)
+                else:
+                    # Stream the DevAgent response and render the code as it is written
+                    st.subheader(f"📁 Code Output - Attempt {attempt.number}")
+                    filename_slot = st.empty()
+                    code_slot = st.empty()
+                    streamed_code = ""
+                    escalated = f" on {attempt.plan['model']}" if attempt.plan["model"] else ""
+                    filename_slot.markdown(f"💻 Running DevAgent{escalated} (Attempt {attempt.number})...")
+
+                    for section, text in stream_code(
+                        ticket_info['summary'],
+                        ticket_info['category'],
+                        language,
+                        loop.feedback,
+                        **attempt.plan
+                    ):
+                        if section == "filename":
+                            filename_slot.markdown(f"**Filename**: `{text}`")
+                        elif section == "code":
+                            streamed_code += text
+                            code_slot.code(streamed_code.strip(), language=language)
+                        elif section == "result":
+                            code_output = text
+
+                    filename_slot.markdown(f"**Filename**: `{code_output.get('filename')}`")
+                    code_slot.code(code_output.get('code', ''), language=language)
+                    st.expander("🧠 Explanation").write(code_output.get('explanation', ''))
+
+                if fused:
+                    with st.spinner("🔍 Running ReviewAgent + TestAgent..."):
+                        attempt.reviewed(code_output, *review_and_test(code_output["code"], language))
+                else:
+                    with st.spinner("🔍 Running ReviewAgent..."):
+                        attempt.reviewed(code_output, review_code(code_output["code"], language))
+
+            review = attempt.review
+            st.subheader(f"📋 Review - Attempt {attempt.number}")
+            st.markdown(f"**Score:** {attempt.score}/10")
+            st.markdown(f"**Ready for Deployment:** {review['ready']}")
+            st.expander("💬 Full Review").write(review['review'])
+
+            if attempt.cleared:
+                st.success("🎉 Code passed the review threshold!")
+                _attempt_tests(attempt, key)
+        loop.finish(attempt)
+
+    result = loop.result()
+    if result["code_output"] and (explain_upfront or not result["tests"]):
+        st.caption("✍️ Writing the unit tests and the explanation side by side...")
+    return result
+
+def _attempt_tests(attempt: Attempt, key: str):
+    """Write (unless fused ones exist), show and, when enabled, run the tests of an attempt that cleared the review."""
+    code_output, fused_tests = attempt.code_output, attempt.tests
+    language = attempt.loop.language
+    saved_tests = checkpoints.load(key, f"tests-{attempt.number}") if checkpoints else None
+    if saved_tests:
+        test_results = saved_tests["tests"]
+    elif fused_tests and "error" not in fused_tests:
+        test_results = fused_tests
+    elif run_generated_tests:
+        with st.spinner("🧪 Generating Test Cases..."):
+            test_results = generate_tests(code_output["code"], language)
+    else:
+        # Nothing to run them for: the unit_tests stage writes them after the loop
+        test_results = None
+
+    # Only tests that were written make it into the result; the unit_tests stage writes the others
+    attempt.tests = None
+    if test_results is None:
+        return
+    st.subheader("🧪 Unit Tests")
+    if "error" in test_results:
+        st.error("❌ Failed to generate tests.")
+        st.text(test_results["error"])
+        st.code(test_results.get("raw_output", ""), language="markdown")
+        return
+    st.markdown(f"**Framework**: `{test_results['framework']}`")
+    st.code(test_results["test_code"], language=language)
+    st.expander("💡 What the Tests Cover").write(test_results["explanation"])
+    attempt.tests = test_results
+
+    test_run = saved_tests["test_run"] if saved_tests else None
+    if run_generated_tests and test_run is None:
+        with st.spinner("🧪 Running the tests in a sandbox..."):
+            test_run = run_tests(
+                code_output["code"],
+                code_output["filename"],
+                test_results["test_code"],
+                language
+            )
+    if checkpoints and not saved_tests:
+        checkpoints.save(key, f"tests-{attempt.number}", {"tests": test_results, "test_run": test_run})
 
-MAX_ATTEMPTS = 3
-REVIEW_THRESHOLD = 7.0
+    if run_generated_tests:
+        st.subheader("📊 Test Execution Result")
+        attempt.test_run = test_run
+        _show_test_run(test_run)
+
+def _explain(dev_loop: dict) -> str:
+    # Runs in a worker thread next to the unit_tests stage; the memo is only touched here
+    return memo.call("explain", explain_code, dev_loop["code_output"]["code"],
+                     dev_loop["ticket_info"]["language"].lower())
 
 st.set_page_config(page_title="DevPilot", page_icon="🛠️", layout="wide")
 st.title("🧠 AI Dev Assistant")
@@ -23,6 +221,50 @@ if "pipeline_ran" not in st.session_state:
     st.session_state.pipeline_ran = False
 if "improved_code" not in st.session_state:
     st.session_state.improved_code = None
+# Streamlit reruns this script on every interaction; memoize LLM calls and the ZIP per session
+if "memo" not in st.session_state:
+    st.session_state.memo = BoundedMemo(MEMO_SIZE)
+memo = st.session_state.memo
+
+llm_cache = get_response_cache()
+if llm_cache:
+    cache_stats = llm_cache.stats()
+    st.sidebar.subheader("🗄️ LLM Cache")
+    st.sidebar.markdown(f"**Hits:** {cache_stats['hits']} · **Misses:** {cache_stats['misses']}")
+    st.sidebar.markdown(f"**Entries:** {cache_stats['entries']} ({cache_stats['bytes'] / 1024:.0f} KB)")
+
+speculative = st.sidebar.number_input(
+    "⚡ Parallel candidates per attempt", min_value=1, max_value=5, value=1,
+    help="Generate and review several candidates at once; the first to pass the threshold wins."
+)
+
+fused = st.sidebar.checkbox(
+    "🔗 Fused prompts",
+    help="Classify + write the first solution in one call, and review + write tests in one call."
+)
+
+run_generated_tests = st.sidebar.checkbox(
+    "🧪 Run generated tests",
+    help="Run the unit tests in a sandbox (Python); failing tests send the code back for another attempt. "
+         "The sandbox only limits CPU, memory and file sizes: the generated code can still reach the "
+         "network and your files."
+)
+
+explain_upfront = st.sidebar.checkbox(
+    "🧠 Explain the final code", value=True,
+    help="Write the explanation while the unit tests are written, instead of when you ask for it."
+)
+
+resume = st.sidebar.checkbox(
+    "♻️ Resume from checkpoints", value=True,
+    help="Reuse the classification, attempts and tests saved by an unfinished run of this ticket with the same options."
+)
+checkpoints = get_checkpoint_store()
+
+dedupe = st.sidebar.checkbox(
+    "🔁 Reuse duplicate tickets", value=True,
+    help="Return the result of a near-identical ticket processed before instead of calling the LLM."
+)
 
 ticket_input = st.text_area("🎟️ User Ticket", height=150, placeholder="e.g., Add a Django view to update user profiles...")
 
@@ -31,89 +273,51 @@ if st.button("🚀 Run Pipeline"):
     if not ticket_input.strip():
         st.warning("Please enter a ticket before running.")
     else:
-        st.success("📨 Ticket received!")
-        st.code(ticket_input, language="markdown")
-
-        with st.spinner("🕵️ Running TicketAgent..."):
-            ticket_info = classify_ticket(ticket_input)
-            st.subheader("📋 Ticket Classification")
-            st.json(ticket_info)
-
-        attempts = 0
-        best_score = 0.0
-        best_review = None
-        best_code_output = None
-        best_test_output = None
-        feedback_for_retry = None
-
-        while attempts < MAX_ATTEMPTS:
-            with st.spinner(f"💻 Running DevAgent (Attempt {attempts + 1})..."):
-                code_output = generate_code(
-                    ticket_info['summary'],
-                    ticket_info['category'],
-                    ticket_info["language"].lower(),
-                    feedback_for_retry
+        with recording() as recorder:
+            st.success("📨 Ticket received!")
+            st.code(ticket_input, language="markdown")
+
+            key = checkpoint_key(ticket_input, speculative=speculative, fused=fused, execute_tests=run_generated_tests)
+            if checkpoints and not resume:
+                checkpoints.clear(key)
+
+            similar = find_similar(ticket_input) if dedupe else None
+            duplicate = similar if similar and similar["similarity"] >= DUPLICATE_THRESHOLD else None
+
+            if duplicate:
+                st.info(f"♻️ Near-duplicate of an earlier ticket (similarity {duplicate['similarity']}), reusing its result.")
+                st.caption(duplicate["ticket"])
+                result = duplicate["result"]
+                st.subheader("📋 Ticket Classification")
+                st.json(result["ticket_info"])
+            else:
+                # Classification and the attempts render as they go; once they are done the
+                # unit tests and the explanation are written concurrently
+                graph = ticket_graph(
+                    lambda ticket, similar: _classify(ticket, similar, key),
+                    lambda classification: _dev_loop(classification, key),
+                    write_unit_tests,
+                    _explain if explain_upfront else None,
                 )
-
-            st.subheader(f"📁 Code Output - Attempt {attempts + 1}")
-            st.markdown(f"**Filename**: `{code_output['filename']}`")
-            st.code(code_output['code'], language=ticket_info["language"].lower())
-            st.expander("🧠 Explanation").write(code_output['explanation'])
-
-            with st.spinner("🔍 Running ReviewAgent..."):
-                review = review_code(code_output["code"], ticket_info["language"].lower())
-
-            try:
-                score = float(review["score"])
-            except (ValueError, TypeError):
-                st.warning(f"⚠️ Invalid score format: {review['score']}. Defaulting to 0.0")
-                score = 0.0
-
-            st.subheader(f"📋 Review - Attempt {attempts + 1}")
-            st.markdown(f"**Score:** {score}/10")
-            st.markdown(f"**Ready for Deployment:** {review['ready']}")
-            st.expander("💬 Full Review").write(review['review'])
-
-            if score > best_score:
-                best_score = score
-                best_review = review
-                best_code_output = code_output
-
-            if score >= REVIEW_THRESHOLD:
-                st.success("🎉 Code passed the review threshold!")
-
-                with st.spinner("🧪 Generating Test Cases..."):
-                    test_results = generate_tests(code_output["code"], ticket_info["language"])
-
-                st.subheader("🧪 Unit Tests")
-                if "error" in test_results:
-                    st.error("❌ Failed to generate tests.")
-                    st.text(test_results["error"])
-                    st.code(test_results.get("raw_output", ""), language="markdown")
-                else:
-                    st.markdown(f"**Framework**: `{test_results['framework']}`")
-                    st.code(test_results["test_code"], language=ticket_info["language"].lower())
-                    st.expander("💡 What the Tests Cover").write(test_results["explanation"])
-                    best_test_output = test_results
-
-                    # if ticket_info["language"].lower() == "python":
-                    #     st.subheader("📊 Test Execution Result")
-                    #     test_run_result = run_python_tests(best_test_output["test_code"])
-
-                    #     if "error" in test_run_result:
-                    #         st.error("❌ Error running test code")
-                    #         st.text(test_run_result["error"])
-                    #     else:
-                    #         st.code(test_run_result["stdout"] or "✅ All tests passed!", language="bash")
-                    #         if test_run_result["stderr"]:
-                    #             st.error("⚠️ Warnings/Errors:")
-                    #             st.code(test_run_result["stderr"], language="bash")
-
-                break
-
-            feedback_for_retry = review.get("review", "")
-            st.warning(f"⚠️ Score {score} is below threshold ({REVIEW_THRESHOLD}). Retrying...\n")
-            attempts += 1
+                result = graph_result(graph.run(ticket=ticket_input, similar=similar))
+                if checkpoints:
+                    checkpoints.clear(key)
+                st.caption("⏱️ " + " · ".join(f"{name} {timing['wall_ms'] / 1000:.1f}s"
+                                               for name, timing in result["stages"].items()))
+
+            ticket_info = result["ticket_info"]
+            best_score, best_review = result["score"], result["review"]
+            best_code_output, best_test_output, best_test_run = result["code_output"], result.get("tests"), result.get("test_run")
+
+        if not duplicate and best_review:
+            remember_result(ticket_input, {
+                "ticket_info": ticket_info,
+                "code_output": best_code_output,
+                "review": best_review,
+                "score": best_score,
+                "tests": best_test_output,
+                "test_run": best_test_run,
+            }, dedupe)
 
         # Save pipeline state
         st.session_state.pipeline_ran = True
@@ -121,7 +325,11 @@ if st.button("🚀 Run Pipeline"):
         st.session_state["best_code_output"] = best_code_output
         st.session_state["best_review"] = best_review
         st.session_state["test_results"] = best_test_output
+        st.session_state["test_run"] = best_test_run
         st.session_state.improved_code = None  # reset previous improvement
+        st.session_state.pop("last_reviewed", None)
+        st.session_state["metrics"] = recorder.summary()
+        export_from_env(recorder)
 
 # DISPLAY FINAL OUTPUT AFTER PIPELINE
 if st.session_state.get("pipeline_ran", False):
@@ -141,12 +349,20 @@ if st.session_state.get("pipeline_ran", False):
         st.markdown(f"**✅ Ready for Deployment**: {best_review['ready']}")
         st.expander("🧾 Final Review").write(best_review['review'])
 
+    if st.session_state.get("metrics"):
+        with st.expander("⏱️ Stage Metrics"):
+            st.dataframe(st.session_state["metrics"])
+
     if best_code_output:
-        if st.button("🧠 Explain This Code"):
+        explain_clicked = st.button("🧠 Explain This Code")
+        explanation = memo.get("explain", best_code_output['code'], ticket_info["language"].lower())
+        if explain_clicked and explanation is None:
             with st.spinner("Thinking..."):
-                explanation = explain_code(best_code_output['code'])
-                st.subheader("📖 Code Explanation")
-                st.write(explanation)
+                explanation = memo.call("explain", explain_code, best_code_output['code'],
+                                        ticket_info["language"].lower())
+        if explanation:
+            st.subheader("📖 Code Explanation")
+            st.write(explanation)
 
     if best_code_output:
         st.divider()
@@ -159,10 +375,27 @@ if st.session_state.get("pipeline_ran", False):
             key="manual_edit"
         )
 
-        if st.button("🕵️ Re-run ReviewAgent", key="review_button"):
+        # Re-reviews only send the diff against the last reviewed version (see review_code_incremental)
+        last_code, last_review = st.session_state.get(
+            "last_reviewed", (best_code_output['code'], best_review)
+        )
+        if st.button("🕵️ Re-run ReviewAgent", key="review_button") and edited_code != last_code:
             with st.spinner("Re-reviewing your edited code..."):
-                edited_review = review_code(edited_code, ticket_info["language"].lower())
+                reviewed = memo.call(
+                    "review",
+                    review_code_incremental,
+                    edited_code,
+                    ticket_info["language"].lower(),
+                    last_code,
+                    last_review
+                )
+            st.session_state["last_reviewed"] = (edited_code, reviewed)
 
+        edited_review = None
+        if "last_reviewed" in st.session_state and st.session_state["last_reviewed"][0] == edited_code:
+            edited_review = st.session_state["last_reviewed"][1]
+
+        if edited_review:
             try:
                 new_score = float(edited_review["score"])
             except Exception:
@@ -171,6 +404,10 @@ if st.session_state.get("pipeline_ran", False):
             st.subheader("📋 New Review (After Edit)")
             st.markdown(f"**Score:** {new_score}/10")
             st.markdown(f"**Ready for Deployment:** {edited_review['ready']}")
+            if edited_review.get("mode") == "incremental":
+                st.caption(f"Incremental review of {edited_review['changed_lines']} changed lines")
+            elif edited_review.get("mode") == "chunked":
+                st.caption(f"Reviewed in {len(edited_review['chunks'])} parts concurrently")
             st.expander("💬 Full Review").write(edited_review["review"])
 
 
@@ -184,6 +421,8 @@ if st.session_state.get("pipeline_ran", False):
             st.markdown(f"**Framework**: `{best_test_output['framework']}`")
             st.code(best_test_output["test_code"], language=ticket_info["language"].lower())
             st.expander("💡 What the Tests Cover").write(best_test_output["explanation"])
+            if st.session_state.get("test_run"):
+                _show_test_run(st.session_state["test_run"])
 
 # IMPROVE CODE SECTION (Always available after pipeline run)
 if st.session_state.get("best_code_output") and st.session_state.get("ticket_info"):
@@ -194,7 +433,9 @@ if st.session_state.get("best_code_output") and st.session_state.get("ticket_inf
 
     if st.button("🔁 Improve with My Feedback", key="improve_button"):
         with st.spinner("Improving your code..."):
-            improved = improve_code(
+            improved = memo.call(
+                "improve",
+                improve_code,
                 st.session_state["best_code_output"]["code"],
                 feedback,
                 st.session_state["ticket_info"]["language"].lower()
@@ -205,11 +446,16 @@ if st.session_state.get("best_code_output") and st.session_state.get("ticket_inf
         st.subheader("🔧 Code Improved Based on Your Feedback")
         st.code(st.session_state.improved_code, language=st.session_state["ticket_info"]["language"].lower())
 
-        if st.button("🧠 Explain This Code", key="explain_code"):
+        explain_clicked = st.button("🧠 Explain This Code", key="explain_code")
+        improved_explanation = memo.get("explain", st.session_state.improved_code,
+                                        st.session_state["ticket_info"]["language"].lower())
+        if explain_clicked and improved_explanation is None:
             with st.spinner("Thinking..."):
-                explanation = explain_code(st.session_state.improved_code)
-                st.subheader("📖 Improved Code Explanation")
-                st.write(explanation)
+                improved_explanation = memo.call("explain", explain_code, st.session_state.improved_code,
+                                                 st.session_state["ticket_info"]["language"].lower())
+        if improved_explanation:
+            st.subheader("📖 Improved Code Explanation")
+            st.write(improved_explanation)
 
 
     #Export to ZIP File
@@ -219,18 +465,22 @@ if st.session_state.get("best_code_output") and st.session_state.get("ticket_inf
 
         export_code    = best_code_output["code"]
         export_fname   = best_code_output["filename"]
-        print(export_fname)
         export_tests   = best_test_output.get("test_code") if best_test_output else None
         export_review  = best_review["review"] if best_review else None
         export_impcode = st.session_state.get("improved_code", None)   
-
-        zip_bytes = create_export_zip(
-            code          = export_code,
-            filename      = export_fname,
-            test_code     = export_tests,
-            review        = export_review,
-            improved_code = export_impcode,
-            language      = ticket_info["language"]
+        export_report  = format_test_report(st.session_state["test_run"]) if st.session_state.get("test_run") else None
+
+        # Only recompress when one of the exported parts actually changed
+        zip_bytes = memo.call(
+            "zip",
+            create_export_zip,
+            export_code,
+            export_fname,
+            export_tests,
+            export_review,
+            export_impcode,
+            ticket_info["language"],
+            export_report
         )
 
         st.download_button(
@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+
+from pipeline.bulk_pipeline import read_tickets
+from pipeline.orchestrator_pipeline import aorchestrate_pipeline, REVIEW_THRESHOLD
+from utils.job_queue import JobQueue, DEFAULT_QUEUE_PATH, VISIBILITY_TIMEOUT
+from utils.output_store import OutputStore, DEFAULT_OUTPUT_DIR
+from utils.instrumentation import recording
+
+# Headless workers: tickets go into a durable queue (utils/job_queue.py) and any number of
+# worker processes, each running CONCURRENCY jobs at once, drain it into an OutputStore.
+# A worker that dies mid-job loses its lease and the job is picked up again.
+CONCURRENCY = 4
+POLL_SECONDS = 2.0
+
+
+async def _keep_leased(queue: JobQueue, job_id: str, worker: str, visibility_timeout: float):
+    while True:
+        await asyncio.sleep(visibility_timeout / 3)
+        if not await asyncio.to_thread(queue.heartbeat, job_id, worker, visibility_timeout):
+            print(f"⚠️ Lost the lease on job {job_id}", file=sys.stderr)
+            return
+
+
+async def process_job(queue: JobQueue, store: OutputStore, job: dict, worker: str,
+                      visibility_timeout: float = VISIBILITY_TIMEOUT) -> bool:
+    """Run one claimed job through the pipeline and store its result. Returns True on success."""
+    lease = asyncio.create_task(_keep_leased(queue, job["id"], worker, visibility_timeout))
+    try:
+        with recording() as recorder:
+            result = await aorchestrate_pipeline(
+                job["ticket"],
+                verbose=False,
+                speculative=job.get("speculative", 0),
+                fused=job.get("fused", False),
+                execute_tests=job.get("execute_tests", False),
+            )
+        result["metrics"] = recorder.summary()
+        output = await asyncio.to_thread(store.save, job["id"], result)
+        await asyncio.to_thread(queue.complete, job["id"], worker, {
+            "score": result["score"],
+            "passed": result["score"] >= REVIEW_THRESHOLD,
+            "output": output,
+        })
+        print(f"✅ {job['id']}: score {result['score']} → {output}", file=sys.stderr)
+        return True
+    except Exception as e:
+        await asyncio.to_thread(queue.fail, job["id"], worker, str(e))
+        print(f"❌ {job['id']} (attempt {job['attempt']}): {e}", file=sys.stderr)
+        return False
+    finally:
+        lease.cancel()
+
+
+async def run_worker(queue_path: str = DEFAULT_QUEUE_PATH, output_dir: str = DEFAULT_OUTPUT_DIR,
+                     concurrency: int = CONCURRENCY, drain: bool = False,
+                     visibility_timeout: float = VISIBILITY_TIMEOUT) -> dict:
+    """
+    Pull jobs until stopped, `concurrency` at a time. With drain=True each slot stops once
+    no job is ready instead of polling. Returns {"done", "failed"} counts for this worker.
+    """
+    queue = JobQueue(queue_path)
+    store = OutputStore(output_dir)
+    name = f"{socket.gethostname()}-{os.getpid()}"
+    stats = {"done": 0, "failed": 0}
+
+    async def slot(number: int):
+        worker = f"{name}/{number}"
+        while True:
+            # SQLite transactions can wait on the database lock; keep them off the event loop
+            job = await asyncio.to_thread(queue.claim, worker, visibility_timeout)
+            if job is None:
+                if drain:
+                    return
+                await asyncio.sleep(POLL_SECONDS)
+                continue
+            ok = await process_job(queue, store, job, worker, visibility_timeout)
+            stats["done" if ok else "failed"] += 1
+
+    try:
+        await asyncio.gather(*(slot(number) for number in range(concurrency)))
+    finally:
+        queue.close()
+    return stats
+
+
+def _worker_process(queue_path, output_dir, concurrency, drain, visibility_timeout):
+    try:
+        asyncio.run(run_worker(queue_path, output_dir, concurrency, drain, visibility_timeout))
+    except KeyboardInterrupt:
+        pass  # leases of unfinished jobs expire and the jobs are picked up again
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Queue tickets and run headless pipeline workers.")
+    parser.add_argument("--queue", default=os.getenv("PIPELINE_QUEUE_PATH", DEFAULT_QUEUE_PATH), help="SQLite queue file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="Queue tickets from a JSONL/CSV file or stdin")
+    submit.add_argument("input", nargs="?", default="-", help="JSONL/CSV file of tickets, or - for stdin")
+    submit.add_argument("--priority", type=int, default=2, help="Lower runs first (0 = critical ... 3 = low)")
+    submit.add_argument("--speculative", type=int, default=0, help="Parallel candidates per attempt (0 = off)")
+    submit.add_argument("--fused", action="store_true", help="Fuse classify+generate and review+tests into one call each")
+    submit.add_argument("--run-tests", action="store_true", help="Run each passing solution's unit tests in a sandbox")
+
+    run = commands.add_parser("run", help="Start workers")
+    run.add_argument("--output-dir", default=os.getenv("PIPELINE_OUTPUT_DIR", DEFAULT_OUTPUT_DIR), help="Where results are stored")
+    run.add_argument("--processes", type=int, default=1, help="Worker processes")
+    run.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Jobs in flight per process")
+    run.add_argument("--visibility-timeout", type=float, default=VISIBILITY_TIMEOUT, help="Seconds before an unrenewed lease expires")
+    run.add_argument("--drain", action="store_true", help="Exit once the queue is empty instead of polling")
+
+    status = commands.add_parser("status", help="Show queue counts, or one job")
+    status.add_argument("job_id", nargs="?")
+    args = parser.parse_args(argv)
+
+    if args.command == "submit":
+        queue = JobQueue(args.queue)
+        for ticket in read_tickets(args.input):
+            job_id = queue.submit(ticket["ticket"], priority=args.priority, speculative=args.speculative,
+                                  fused=args.fused, execute_tests=args.run_tests, source_id=ticket["id"])
+            print(f"{job_id}\t{ticket['id']}")
+        print(f"📥 Queue: {queue.counts()}", file=sys.stderr)
+
+    elif args.command == "run":
+        worker_args = (args.queue, args.output_dir, args.concurrency, args.drain, args.visibility_timeout)
+        if args.processes <= 1:
+            _worker_process(*worker_args)
+        else:
+            context = multiprocessing.get_context("spawn")
+            processes = [context.Process(target=_worker_process, args=worker_args) for _ in range(args.processes)]
+            for process in processes:
+                process.start()
+            try:
+                for process in processes:
+                    process.join()
+            except KeyboardInterrupt:
+                for process in processes:
+                    process.join()
+        print(f"📦 Queue: {JobQueue(args.queue).counts()}", file=sys.stderr)
+
+    else:
+        queue = JobQueue(args.queue)
+        if args.job_id:
+            print(json.dumps(queue.get(args.job_id), ensure_ascii=False, indent=2))
+        else:
+            print(json.dumps(queue.counts()))
+
+
+if __name__ == "__main__":
+    main()
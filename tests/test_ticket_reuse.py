@@ -0,0 +1,34 @@
+from pipeline import orchestrator_pipeline
+from utils.ticket_index import TicketIndex, SIMILAR_THRESHOLD, DUPLICATE_THRESHOLD
+
+EARLIER = "Login page does not redirect after successful authentication"
+LATER = "Logout page does not redirect after successful authentication"
+
+
+def _earlier_result() -> dict:
+    return {
+        "ticket_info": {"category": "Enhancement", "urgency": "High", "language": "JavaScript",
+                        "summary": "Redirect users to the dashboard after they log in"},
+        "code_output": {"filename": "login.js", "code": "redirect('/dashboard');", "explanation": ""},
+        "review": {"review": "Looks good.", "score": 9.0, "ready": "Yes"},
+        "score": 9.0,
+    }
+
+
+def test_similar_ticket_keeps_its_own_summary(monkeypatch):
+    for name, value in {"LLM_BACKEND": "stub", "LLM_CACHE_DISABLED": "1",
+                        "PIPELINE_CHECKPOINTS_DISABLED": "1", "SOLUTION_LIBRARY_DISABLED": "1"}.items():
+        monkeypatch.setenv(name, value)
+    index = TicketIndex(":memory:")
+    index.add(EARLIER, _earlier_result())
+    monkeypatch.setattr(orchestrator_pipeline, "get_ticket_index", lambda: index)
+
+    similar = orchestrator_pipeline.find_similar(LATER)
+    assert SIMILAR_THRESHOLD <= similar["similarity"] < DUPLICATE_THRESHOLD
+
+    result = orchestrator_pipeline.orchestrate_pipeline(LATER)
+    ticket_info = result["ticket_info"]
+    assert "duplicate_of" not in result
+    assert ticket_info["summary"] == LATER
+    assert (ticket_info["category"], ticket_info["urgency"], ticket_info["language"]) == \
+        ("Enhancement", "High", "JavaScript")
@@ -0,0 +1,83 @@
+import json, os, sqlite3, threading, time
+
+DEFAULT_PATH = os.path.join(".cache", "checkpoints.sqlite")
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+class CheckpointStore:
+    """
+    Stage outputs of pipeline runs, keyed by (ticket, stage), e.g. ("3f2a...", "attempt-2").
+    A run that dies part-way resumes from what was saved instead of paying for those LLM
+    calls again. Checkpoints older than `ttl_seconds` are ignored.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, ttl_seconds: float | None = DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                ticket TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (ticket, stage)
+            )
+        """)
+        self._conn.commit()
+
+    def save(self, ticket: str, stage: str, value) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (ticket, stage, value, created) VALUES (?, ?, ?, ?)",
+                (ticket, stage, json.dumps(value, ensure_ascii=False, default=str), time.time()),
+            )
+            self._conn.commit()
+
+    def load(self, ticket: str, stage: str):
+        """The saved value, or None when the stage has no live checkpoint."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM checkpoints WHERE ticket = ? AND stage = ?", (ticket, stage)
+            ).fetchone()
+        if row is None or (self.ttl_seconds is not None and time.time() - row[1] > self.ttl_seconds):
+            return None
+        return json.loads(row[0])
+
+    def stages(self, ticket: str) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage FROM checkpoints WHERE ticket = ? ORDER BY created", (ticket,)
+            ).fetchall()
+        return [stage for (stage,) in rows]
+
+    def clear(self, ticket: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE ticket = ?", (ticket,))
+            self._conn.commit()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_checkpoint_store() -> CheckpointStore | None:
+    """
+    Process-wide checkpoint store configured from the environment:
+      PIPELINE_CHECKPOINTS_DISABLED=1   turn checkpointing off
+      PIPELINE_CHECKPOINT_PATH          SQLite file (default .cache/checkpoints.sqlite)
+      PIPELINE_CHECKPOINT_TTL           seconds before a checkpoint is ignored (0 = never)
+    """
+    global _store
+    if os.getenv("PIPELINE_CHECKPOINTS_DISABLED", "0") == "1":
+        return None
+
+    with _store_lock:
+        if _store is None:
+            ttl = float(os.getenv("PIPELINE_CHECKPOINT_TTL", DEFAULT_TTL_SECONDS))
+            _store = CheckpointStore(os.getenv("PIPELINE_CHECKPOINT_PATH", DEFAULT_PATH), ttl or None)
+        return _store
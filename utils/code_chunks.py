@@ -0,0 +1,145 @@
+import ast, os, re
+
+from utils.token_budget import count_tokens, truncate
+
+# Target size of one chunk; a single function or class bigger than this stays whole
+CHUNK_TOKENS = int(os.getenv("REVIEW_CHUNK_TOKENS", 2000))
+# The file outline every chunk is shown next to
+OUTLINE_TOKENS = 600
+
+# Top-level declarations other languages' chunks start at
+DECLARATION_RE = re.compile(
+    r"(?:(?:export|default|public|private|protected|internal|static|abstract|final|async|pub|unsafe|extern)\s+)*"
+    r"(?:(?:function\*?|class|interface|struct|enum|impl|trait|fn|func|def|type|module|namespace|object)\b"
+    r"|(?:const|let|var)\s+\w+\s*=\s*(?:async\s*)?(?:\(|function\b))"
+)
+IMPORT_RE = re.compile(r"(?:import|from|#include|#import|using|require|package|use)\b")
+CLOSING_RE = re.compile(r"[}\])]|end\b")
+
+
+def _name(node, owner: str = "") -> str:
+    """"def f" / "class C" at the top level, "C.f" / "C attributes" inside class C."""
+    named = isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+    if owner:
+        return f"{owner}.{node.name}" if named else f"{owner} attributes"
+    if not named:
+        return "module code"
+    return f"class {node.name}" if isinstance(node, ast.ClassDef) else f"def {node.name}"
+
+
+def _start(node, lines: list) -> int:
+    """First line of a node, including its decorators and the comment lines right above it."""
+    start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+    while start > 1 and lines[start - 2].strip().startswith("#"):
+        start -= 1
+    return start
+
+
+def _units(nodes: list, lines: list, first: int, last: int, owner: str = "") -> list:
+    """[name, start, end, node] per node, covering lines first..last; consecutive plain statements share one."""
+    units = []
+    for node in nodes:
+        name = _name(node, owner)
+        if units and units[-1][0] == name and name.endswith(("module code", "attributes")):
+            continue
+        start = max(_start(node, lines), first)
+        if units:
+            units[-1][2] = start - 1
+        units.append([name, start, last, node])
+    if units:
+        units[0][1] = first
+    return units
+
+
+def _python_units(code: str, max_tokens: int) -> list | None:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    lines = code.splitlines()
+    units = []
+    for name, start, end, node in _units(tree.body, lines, 1, len(lines)):
+        text = "\n".join(lines[start - 1:end])
+        # A class too big for one chunk is reviewed method by method, after its own header
+        if isinstance(node, ast.ClassDef) and count_tokens(text) > max_tokens and len(node.body) > 1:
+            body_start = _start(node.body[0], lines)
+            units.append((f"{name} (header)", start, body_start - 1))
+            units += [(n, s, e) for n, s, e, _ in _units(node.body, lines, body_start, end, node.name)]
+        else:
+            units.append((name, start, end))
+    return [unit for unit in units if unit[1] <= unit[2]]
+
+
+def _heuristic_units(code: str) -> list:
+    """
+    Units of a file in any language: a new one starts at every top-level declaration, and
+    at any other unindented line that follows a blank line or a block's closing bracket.
+    """
+    lines = code.splitlines()
+    units = []
+    previous = ""
+    for number, line in enumerate(lines, start=1):
+        top_level = line[:1].strip() != "" and not CLOSING_RE.match(line)
+        starts = top_level and (DECLARATION_RE.match(line) or not previous.strip() or CLOSING_RE.match(previous))
+        if starts or not units:
+            if units:
+                units[-1][2] = number - 1
+            units.append([line.strip()[:60] or "start of file", number, len(lines)])
+        previous = line
+    return units
+
+
+def split_code(code: str, language: str = "python", max_tokens: int = CHUNK_TOKENS) -> list:
+    """
+    Split code at function/class boundaries into chunks of about `max_tokens`, as
+    [{"name", "start", "end", "code"}] with 1-based line numbers. Python is split with
+    `ast` (falling back to the heuristic when it doesn't parse), other languages at their
+    top-level declarations. Small neighbouring units are packed together.
+    """
+    lines = code.splitlines()
+    units = _python_units(code, max_tokens) if language.lower() == "python" else None
+    if units is None:
+        units = _heuristic_units(code)
+
+    chunks = []
+    for name, start, end in units:
+        text = "\n".join(lines[start - 1:end])
+        if chunks and count_tokens(chunks[-1]["code"] + "\n" + text) <= max_tokens:
+            chunk = chunks[-1]
+            chunk["names"].append(name)
+            chunk["end"] = end
+            chunk["code"] += "\n" + text
+        else:
+            chunks.append({"names": [name], "start": start, "end": end, "code": text})
+
+    for chunk in chunks:
+        names = chunk.pop("names")
+        chunk["name"] = ", ".join(names) if len(names) <= 3 else f"{', '.join(names[:2])} and {len(names) - 2} more"
+    return [chunk for chunk in chunks if chunk["code"].strip()]
+
+
+def outline(code: str, language: str = "python", budget: int = OUTLINE_TOKENS) -> str:
+    """
+    What a file defines, for reviewing one part of it: its imports and the first line of
+    every top-level declaration (and, for Python classes, of every method).
+    """
+    lines = code.splitlines()
+    kept = set()
+    try:
+        tree = ast.parse(code) if language.lower() == "python" else None
+    except SyntaxError:
+        tree = None
+
+    if tree is not None:
+        for node in tree.body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                kept.update(range(node.lineno, node.end_lineno + 1))
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                kept.add(node.lineno)
+                if isinstance(node, ast.ClassDef):
+                    kept.update(n.lineno for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)))
+    else:
+        kept.update(number for number, line in enumerate(lines, start=1) if IMPORT_RE.match(line))
+        kept.update(start for _, start, _ in _heuristic_units(code))
+
+    return truncate("\n".join(lines[number - 1].rstrip() for number in sorted(kept)), budget)
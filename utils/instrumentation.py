@@ -0,0 +1,211 @@
+import json, os, threading, time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Labels set by an enclosing span (ticket, attempt, ...) are inherited by nested spans
+_scope = ContextVar("instrumentation_scope", default={})
+_current = ContextVar("instrumentation_span", default=None)
+_recorder = ContextVar("instrumentation_recorder", default=None)
+# (callback, tokens) of the innermost listening() block
+_listener = ContextVar("instrumentation_listener", default=None)
+
+
+class Recorder:
+    """
+    Collects one record per span: stage, inherited labels such as ticket/attempt,
+    wall_ms, prompt/completion tokens, cache_hit, parse_ok, score and error, and
+    repaired: how many responses in the span a repair follow-up completed.
+    """
+
+    def __init__(self, run_id: str | None = None, max_records: int | None = None):
+        self.run_id = run_id or time.strftime("%Y%m%d-%H%M%S")
+        self.records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def add(self, record: dict):
+        with self._lock:
+            self.records.append(record)
+
+    def summary(self) -> list:
+        """One row per stage: calls, latency percentiles, tokens, cache hits and parse failures."""
+        stages = {}
+        for record in self.records:
+            stages.setdefault(record["stage"], []).append(record)
+
+        rows = []
+        for stage, records in stages.items():
+            times = sorted(r["wall_ms"] for r in records)
+            rows.append({
+                "stage": stage,
+                "calls": len(records),
+                "total_ms": round(sum(times), 1),
+                "p50_ms": round(times[len(times) // 2], 1),
+                "p95_ms": round(times[min(int(len(times) * 0.95), len(times) - 1)], 1),
+                "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in records),
+                "completion_tokens": sum(r.get("completion_tokens", 0) for r in records),
+                "cache_hits": sum(1 for r in records if r.get("cache_hit")),
+                "parse_failures": sum(1 for r in records if r.get("parse_ok") is False),
+                # Format slips fixed by a repair follow-up instead of a full retry
+                "repairs": sum(r.get("repaired", 0) for r in records),
+                "errors": sum(1 for r in records if r.get("error")),
+            })
+        return rows
+
+    def summary_table(self) -> str:
+        rows = self.summary()
+        if not rows:
+            return "(no stages recorded)"
+        columns = list(rows[0])
+        widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in columns}
+        lines = ["  ".join(c.ljust(widths[c]) for c in columns),
+                 "  ".join("-" * widths[c] for c in columns)]
+        lines += ["  ".join(str(r[c]).ljust(widths[c]) for c in columns) for r in rows]
+        return "\n".join(lines)
+
+    def export_jsonl(self, path: str):
+        with open(path, "a", encoding="utf-8") as fh:
+            for record in self.records:
+                fh.write(json.dumps({"run_id": self.run_id, **record}, ensure_ascii=False) + "\n")
+
+    def export_prometheus(self, path: str):
+        """Write the run's aggregates in the Prometheus text exposition format."""
+        lines = [
+            "# HELP devpilot_stage_duration_seconds Wall time spent per pipeline stage.",
+            "# TYPE devpilot_stage_duration_seconds summary",
+        ]
+        counters = {
+            "devpilot_prompt_tokens_total": ("prompt_tokens", "Prompt tokens sent per stage."),
+            "devpilot_completion_tokens_total": ("completion_tokens", "Completion tokens received per stage."),
+            "devpilot_cache_hits_total": ("cache_hits", "LLM calls answered from the response cache."),
+            "devpilot_parse_failures_total": ("parse_failures", "Responses that could not be parsed."),
+            "devpilot_repairs_total": ("repairs", "Format slips fixed by a repair call instead of a retry."),
+            "devpilot_errors_total": ("errors", "Stages that raised an exception."),
+        }
+        rows = self.summary()
+        for row in rows:
+            label = f'stage="{row["stage"]}"'
+            lines.append(f'devpilot_stage_duration_seconds{{{label},quantile="0.5"}} {round(row["p50_ms"] / 1000, 6)}')
+            lines.append(f'devpilot_stage_duration_seconds{{{label},quantile="0.95"}} {round(row["p95_ms"] / 1000, 6)}')
+            lines.append(f'devpilot_stage_duration_seconds_sum{{{label}}} {round(row["total_ms"] / 1000, 6)}')
+            lines.append(f'devpilot_stage_duration_seconds_count{{{label}}} {row["calls"]}')
+        for name, (field, help_text) in counters.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            lines += [f'{name}{{stage="{row["stage"]}"}} {row[field]}' for row in rows]
+
+        retries = sum(1 for r in self.records if r["stage"] == "attempt" and r.get("attempt", 1) > 1)
+        lines += ["# HELP devpilot_retries_total Generate/review attempts beyond the first.",
+                  "# TYPE devpilot_retries_total counter",
+                  f"devpilot_retries_total {retries}"]
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write("\n".join(lines) + "\n")
+
+    def export(self, directory: str):
+        """Append records to <dir>/metrics.jsonl and write <dir>/metrics.prom."""
+        os.makedirs(directory, exist_ok=True)
+        self.export_jsonl(os.path.join(directory, "metrics.jsonl"))
+        self.export_prometheus(os.path.join(directory, "metrics.prom"))
+
+
+def export_from_env(recorder: Recorder):
+    """Export a run's metrics when PIPELINE_METRICS_DIR is set."""
+    directory = os.getenv("PIPELINE_METRICS_DIR")
+    if directory:
+        recorder.export(directory)
+
+
+# Catches spans opened outside recording(); bounded so long-lived processes don't grow forever
+default_recorder = Recorder("default", max_records=10000)
+
+
+@contextmanager
+def recording(run_id: str | None = None):
+    """Route every span opened inside the block to a fresh Recorder."""
+    recorder = Recorder(run_id)
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+@contextmanager
+def listening(callback, tokens: bool = False):
+    """
+    Call callback(event) for every span started ("start") or finished ("end", with the
+    span's record) inside the block, and for anything else emit()ted there. Events are
+    dicts with "event", "stage" and the span's labels (ticket, attempt, ...).
+    With tokens=True agents that can stream also emit their output as "token" events.
+    Spans run in worker threads call it from those threads.
+    """
+    token = _listener.set((callback, tokens))
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+
+def wants_tokens() -> bool:
+    listener = _listener.get()
+    return listener is not None and listener[1]
+
+
+def emit(event: str, **data):
+    """Send an event, labelled with the enclosing spans' labels, to the active listener."""
+    listener = _listener.get()
+    if listener is not None:
+        record = _current.get()
+        listener[0]({"event": event, "stage": record["stage"] if record else None, **_scope.get(), **data})
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """
+    Time a stage. Yields the record dict so callers can add fields (score, parse_ok, ...).
+    Labels passed here are inherited by spans opened inside the block.
+    """
+    scope = {**_scope.get(), **labels}
+    record = {"stage": stage, **scope}
+    scope_token = _scope.set(scope)
+    span_token = _current.set(record)
+    listener = _listener.get()
+    if listener is not None:
+        listener[0]({"event": "start", **record})
+    started = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = str(e)
+        raise
+    finally:
+        record["wall_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        _current.reset(span_token)
+        _scope.reset(scope_token)
+        (_recorder.get() or default_recorder).add(record)
+        if listener is not None:
+            listener[0]({"event": "end", **record})
+
+
+def record_usage(record: dict, response):
+    """Copy prompt/completion token counts from an LLM response onto a span record."""
+    if record.get("cache_hit"):
+        # A cached message still carries the usage of the call that produced it
+        return
+    usage = getattr(response, "usage_metadata", None) or {}
+    record["prompt_tokens"] = record.get("prompt_tokens", 0) + usage.get("input_tokens", 0)
+    record["completion_tokens"] = record.get("completion_tokens", 0) + usage.get("output_tokens", 0)
+
+
+def annotate(**fields):
+    """Add fields to the enclosing span's record, if there is one."""
+    record = _current.get()
+    if record is not None:
+        record.update(fields)
+
+
+def note_cache_hit(hit: bool):
+    """Called by the response cache so the enclosing span knows it was served from cache."""
+    record = _current.get()
+    if record is not None:
+        record["cache_hit"] = record.get("cache_hit", False) or hit
@@ -0,0 +1,137 @@
+import json, os, sqlite3, threading, time, uuid
+
+DEFAULT_QUEUE_PATH = os.path.join(".cache", "jobs.sqlite")
+# A claimed job goes back to the queue if its worker stops renewing the lease for this long
+VISIBILITY_TIMEOUT = 300
+MAX_JOB_ATTEMPTS = 3
+
+
+class JobQueue:
+    """
+    Durable ticket queue on SQLite, safe to share between processes.
+
+    Workers claim() a job, which leases it for `visibility_timeout` seconds; they renew the
+    lease with heartbeat() while working and finish with complete() or fail(). A job whose
+    lease runs out (the worker died) is handed to the next claim(), up to `max_attempts`
+    claims in total. Jobs are claimed by priority (lower first), then in submission order.
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, max_attempts: int = MAX_JOB_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        # isolation_level=None: transactions are explicit, so claim() can take the write lock up front
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_expires REAL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                error TEXT,
+                result TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority, created)")
+
+    def submit(self, ticket: str, job_id: str | None = None, priority: int = 2, **options) -> str:
+        """Queue a ticket; `options` (e.g. fused=True) are handed to the worker with it."""
+        job_id = job_id or uuid.uuid4().hex[:12]
+        now = time.time()
+        payload = json.dumps({"ticket": ticket, **options}, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, payload, priority, status, created, updated) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, payload, priority, now, now),
+            )
+        return job_id
+
+    def claim(self, worker: str, visibility_timeout: float = VISIBILITY_TIMEOUT) -> dict | None:
+        """Lease the next ready job to `worker`, or return None when there is none."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired leases whose job has used up its attempts are failed, not retried
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'lease expired', updated = ? "
+                    "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, self.max_attempts),
+                )
+                row = self._conn.execute(
+                    "SELECT id, payload, attempts FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) "
+                    "ORDER BY priority, created LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, lease_expires = ?, "
+                        "attempts = attempts + 1, updated = ? WHERE id = ?",
+                        (worker, now + visibility_timeout, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"id": row[0], "attempt": row[2] + 1, **json.loads(row[1])}
+
+    def _finish(self, sql: str, params: tuple) -> bool:
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount == 1
+
+    def heartbeat(self, job_id: str, worker: str, visibility_timeout: float = VISIBILITY_TIMEOUT) -> bool:
+        """Extend the lease; False means the job was lost to another worker."""
+        now = time.time()
+        return self._finish(
+            "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (now + visibility_timeout, now, job_id, worker),
+        )
+
+    def complete(self, job_id: str, worker: str, result: dict | None = None) -> bool:
+        return self._finish(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_expires = NULL, updated = ? "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (json.dumps(result or {}, ensure_ascii=False), time.time(), job_id, worker),
+        )
+
+    def fail(self, job_id: str, worker: str, error: str) -> bool:
+        """Record an error; the job is queued again until it has used up its attempts."""
+        return self._finish(
+            "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+            "error = ?, worker = NULL, lease_expires = NULL, updated = ? "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (self.max_attempts, error, time.time(), job_id, worker),
+        )
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, payload, status, attempts, worker, error, result, created, updated FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0], **json.loads(row[1]), "status": row[2], "attempts": row[3], "worker": row[4],
+            "error": row[5], "result": json.loads(row[6]) if row[6] else None,
+            "created": row[7], "updated": row[8],
+        }
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {"queued": 0, "running": 0, "done": 0, "failed": 0, **dict(rows)}
+
+    def close(self):
+        self._conn.close()
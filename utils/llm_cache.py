@@ -0,0 +1,196 @@
+import hashlib, json, os, re, sqlite3, threading, time, warnings
+from typing import Optional
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+from utils.instrumentation import note_cache_hit
+
+DEFAULT_PATH = os.path.join(".cache", "llm_cache.sqlite")
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+# Cached generations round-trip through langchain_core.load, which warns on every call
+warnings.filterwarnings("ignore", message="The function `loads` is in beta")
+
+
+class SQLiteLLMCache(BaseCache):
+    """
+    Content-addressed, on-disk LLM response cache shared by all agents.
+
+    Entries are keyed on sha256(llm_string + rendered prompt); the llm_string LangChain
+    passes in already carries the model name and temperature. Entries older than
+    `ttl_seconds` are ignored, and once the store exceeds `max_entries` or `max_bytes`
+    the least recently used rows are evicted.
+    With `cache_creative=False`, calls made at temperature > 0 bypass the cache.
+    """
+
+    def __init__(self,
+                 path: str = DEFAULT_PATH,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl_seconds: float | None = DEFAULT_TTL_SECONDS,
+                 cache_creative: bool = True):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.cache_creative = cache_creative
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.evictions = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def _skip(self, llm_string: str) -> bool:
+        if self.cache_creative:
+            return False
+        return _temperature(llm_string) > 0
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if self._skip(llm_string):
+            self.skipped += 1
+            return None
+
+        key = self.make_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                note_cache_hit(False)
+                return None
+
+            self._conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            note_cache_hit(True)
+
+        return [loads(item) for item in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self._skip(llm_string):
+            return
+
+        key = self.make_key(prompt, llm_string)
+        value = json.dumps([dumps(gen) for gen in return_val])
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        if self.ttl_seconds is not None:
+            cur = self._conn.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl_seconds,))
+            self.evictions += max(cur.rowcount, 0)
+
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        while count > self.max_entries or total > self.max_bytes:
+            # Drop least recently used rows until both bounds hold
+            batch = max(count - self.max_entries, 1)
+            rows = self._conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY accessed ASC LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                break
+            self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", [(k,) for k, _ in rows])
+            self.evictions += len(rows)
+            count -= len(rows)
+            total -= sum(size for _, size in rows)
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    # SQLite calls are sub-millisecond, so skip the executor hop of the default async methods
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        return self.lookup(prompt, llm_string)
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self.update(prompt, llm_string, return_val)
+
+    async def aclear(self, **kwargs) -> None:
+        self.clear(**kwargs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+def _temperature(llm_string: str) -> float:
+    match = re.search(r"""['"]temperature['"]\s*[:,]\s*([0-9.]+)""", llm_string)
+    return float(match.group(1)) if match else 0.0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[SQLiteLLMCache]:
+    """
+    Process-wide cache configured from the environment:
+      LLM_CACHE_DISABLED=1      turn caching off
+      LLM_CACHE_PATH            SQLite file (default .cache/llm_cache.sqlite)
+      LLM_CACHE_MAX_ENTRIES     LRU bound on entry count
+      LLM_CACHE_MAX_MB          LRU bound on stored size
+      LLM_CACHE_TTL             seconds before an entry expires (0 = never)
+      LLM_CACHE_CREATIVE=0      bypass the cache for temperature > 0 calls
+    """
+    global _cache
+    if os.getenv("LLM_CACHE_DISABLED", "0") == "1":
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            ttl = float(os.getenv("LLM_CACHE_TTL", DEFAULT_TTL_SECONDS))
+            _cache = SQLiteLLMCache(
+                path=os.getenv("LLM_CACHE_PATH", DEFAULT_PATH),
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+                max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", DEFAULT_MAX_BYTES / 1024 / 1024)) * 1024 * 1024),
+                ttl_seconds=ttl or None,
+                cache_creative=os.getenv("LLM_CACHE_CREATIVE", "1") == "1",
+            )
+        return _cache
@@ -0,0 +1,169 @@
+import asyncio, os, threading, weakref
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+DEFAULT_TEMPERATURE = 0.7
+
+# Per-agent model settings. Any entry can be overridden from the environment with
+# <AGENT>_AGENT_MODEL / <AGENT>_AGENT_TEMPERATURE (e.g. REVIEW_AGENT_TEMPERATURE=0.2),
+# or for every agent at once with LLM_MODEL / LLM_TEMPERATURE.
+#
+# LLM_BACKEND selects where calls go:
+#   gemini  (default) the real API
+#   record  the real API, with every prompt/response appended to the LLM_CASSETTE file
+#   replay  answers from LLM_CASSETTE only (LLM_REPLAY_FALLBACK=stub answers misses offline)
+#   stub    canned, well-formed responses for every agent
+# LLM_LATENCY_MS / LLM_JITTER add simulated latency to the replay and stub backends.
+#
+# Every call goes through a per-model QuotaScheduler (utils/scheduler.py): LLM_RPM / LLM_TPM
+# set the quota (unlimited when unset), LLM_MAX_RETRIES the retries on 429/5xx. Offline
+# backends only go through it when LLM_RPM / LLM_TPM are set.
+AGENT_CONFIG = {
+    "ticket":  {},
+    "dev":     {},
+    "review":  {},
+    "test":    {},
+    "improve": {},
+    "explain": {},
+}
+
+_clients = {}
+_client_loops = {}
+_overrides = {}
+_base = None
+_lock = threading.Lock()
+
+
+def agent_settings(agent: str) -> dict:
+    """Resolve the model name and temperature an agent should run with."""
+    config = AGENT_CONFIG.get(agent, {})
+    prefix = f"{agent.upper()}_AGENT_"
+    model = os.getenv(prefix + "MODEL") or config.get("model") or os.getenv("LLM_MODEL") or DEFAULT_MODEL
+    temperature = os.getenv(prefix + "TEMPERATURE")
+    if temperature is None:
+        temperature = config.get("temperature")
+    if temperature is None:
+        temperature = os.getenv("LLM_TEMPERATURE", DEFAULT_TEMPERATURE)
+    return {"model": model, "temperature": float(temperature)}
+
+
+def _base_client():
+    """
+    The first Gemini client built in the process. Its transport is reused by every
+    other agent's client, so the whole process keeps one warm connection pool.
+    """
+    global _base
+    if _base is None:
+        # Imported here so that `import agents.*` does not pull in the Gemini SDK
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        from utils.llm_cache import get_response_cache
+
+        _base = ChatGoogleGenerativeAI(
+            model=DEFAULT_MODEL,
+            temperature=DEFAULT_TEMPERATURE,
+            cache=get_response_cache(),
+        )
+    return _base
+
+
+def get_llm(agent: str, model: str | None = None, temperature: float | None = None, cache: bool = True):
+    """
+    Return the shared chat model for an agent, creating it on first use.
+    `model`/`temperature` override the configured settings for this call only;
+    `cache=False` returns a variant that bypasses the response cache.
+    """
+    if agent in _overrides:
+        return _overrides[agent]
+
+    backend = os.getenv("LLM_BACKEND", "gemini").lower()
+    if backend in ("replay", "stub"):
+        llm = _offline_backend(backend)
+        if os.getenv("LLM_RPM") or os.getenv("LLM_TPM"):
+            return _scheduled(backend, llm)
+        return llm
+
+    settings = agent_settings(agent)
+    if model:
+        settings["model"] = model
+    if temperature is not None:
+        settings["temperature"] = float(temperature)
+
+    key = (settings["model"], settings["temperature"], cache)
+    with _lock:
+        if key not in _clients:
+            name = settings["model"]
+            if not name.startswith(("models/", "tunedModels/")):
+                name = f"models/{name}"
+            update = {"model": name, "temperature": settings["temperature"]}
+            if not cache:
+                update["cache"] = False
+            # model_copy keeps the base client's transport instead of opening a new one
+            _clients[key] = _base_client().model_copy(update=update)
+        llm = _clients[key]
+        _bind_loop(key, llm)
+
+        if backend == "record":
+            if ("record",) + key not in _clients:
+                from utils.llm_backends import CassetteChatModel
+                _clients[("record",) + key] = CassetteChatModel(path=_cassette_path(), mode="record", inner=llm)
+            llm = _clients[("record",) + key]
+    return _scheduled(settings["model"], llm, key=(backend,) + key)
+
+
+def _scheduled(model: str, llm, key=None):
+    """Wrap a chat model so its calls go through the model's QuotaScheduler."""
+    from utils.scheduler import ScheduledChatModel, get_scheduler
+
+    key = ("scheduled",) + (key or (model,))
+    with _lock:
+        if key not in _clients:
+            _clients[key] = ScheduledChatModel(
+                inner=llm, scheduler=get_scheduler(model), cache=llm.cache
+            )
+        return _clients[key]
+
+
+def _cassette_path() -> str:
+    return os.getenv("LLM_CASSETTE", os.path.join("cassettes", "default.jsonl"))
+
+
+def _offline_backend(backend: str):
+    with _lock:
+        if backend not in _clients:
+            from utils.llm_backends import CassetteChatModel, StubChatModel
+
+            latency = float(os.getenv("LLM_LATENCY_MS", "0")) / 1000
+            jitter = float(os.getenv("LLM_JITTER", "0"))
+            stub = StubChatModel(latency=latency, jitter=jitter)
+            if backend == "stub":
+                _clients[backend] = stub
+            else:
+                fallback = StubChatModel() if os.getenv("LLM_REPLAY_FALLBACK") == "stub" else None
+                _clients[backend] = CassetteChatModel(
+                    path=_cassette_path(), mode="replay", fallback=fallback, latency=latency, jitter=jitter
+                )
+        return _clients[backend]
+
+
+def _bind_loop(key, llm):
+    # Gemini's async client is tied to the event loop that created it; sync callers that
+    # wrap work in asyncio.run() get a fresh loop each time, so drop the stale client.
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    previous = _client_loops.get(key)
+    if previous is not None and previous() is not loop:
+        llm.async_client_running = None
+    _client_loops[key] = weakref.ref(loop)
+
+
+def set_llm(agent: str, llm):
+    """Route an agent to a specific chat model (e.g. a replay backend); None restores the default."""
+    if llm is None:
+        _overrides.pop(agent, None)
+    else:
+        _overrides[agent] = llm
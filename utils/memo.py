@@ -0,0 +1,42 @@
+import hashlib, pickle
+from collections import OrderedDict
+
+
+class BoundedMemo:
+    """
+    Small LRU memo keyed on a hash of (name, args).
+    Meant to live in a per-user store such as Streamlit's session_state, so reruns
+    with unchanged code/feedback reuse the previous LLM result instead of calling again.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(name: str, *args) -> str:
+        return hashlib.sha256(pickle.dumps((name, args))).hexdigest()
+
+    def get(self, name: str, *args):
+        """Return the memoized value, or None when absent."""
+        key = self.key(name, *args)
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def call(self, name: str, fn, *args):
+        key = self.key(name, *args)
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        self.misses += 1
+        value = fn(*args)
+        self._entries[key] = value
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return value
@@ -0,0 +1,58 @@
+import json, os, pathlib, shutil
+
+from utils.zip_file import write_export
+from utils.sandbox_runner import format_test_report
+
+DEFAULT_OUTPUT_DIR = "outputs"
+
+
+class OutputStore:
+    """
+    Finished pipeline results on disk, one directory per job:
+      • result.json  (ticket_info, code_output, review, score, tests, test_run, metrics)
+      • export.zip   (the same code/tests/review bundle the Streamlit app exports)
+    A directory is written under a temporary name and renamed, so readers never see half a result.
+    """
+
+    def __init__(self, root: str = DEFAULT_OUTPUT_DIR):
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _dir(self, job_id: str) -> pathlib.Path:
+        return self.root / pathlib.Path(job_id).name
+
+    def save(self, job_id: str, result: dict) -> str:
+        target = self._dir(job_id)
+        staging = self.root / f".{target.name}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir()
+
+        (staging / "result.json").write_text(json.dumps(result, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+        code_output = result.get("code_output") or {}
+        if code_output.get("code"):
+            tests = result.get("tests") or {}
+            review = result.get("review") or {}
+            write_export(
+                staging / "export.zip",
+                code_output["code"],
+                code_output.get("filename") or "solution.py",
+                tests.get("test_code"),
+                review.get("review"),
+                None,
+                (result.get("ticket_info") or {}).get("language", "python"),
+                format_test_report(result["test_run"]) if result.get("test_run") else None,
+            )
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(staging, target)
+        return str(target)
+
+    def load(self, job_id: str) -> dict | None:
+        path = self._dir(job_id) / "result.json"
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def zip_path(self, job_id: str) -> str | None:
+        path = self._dir(job_id) / "export.zip"
+        return str(path) if path.exists() else None
@@ -0,0 +1,44 @@
+from langchain_core.prompts import PromptTemplate
+from utils.llm_client import get_llm
+from utils.instrumentation import span, record_usage
+from utils.token_budget import budget_for, truncate
+
+# A response that slipped on the format usually has most of the work in it. Asking for only
+# the missing part is a short call, where regenerating repeats the whole response (and, for
+# a review, a whole generate/review attempt).
+REPAIR_PROMPT = PromptTemplate.from_template("""
+Your previous response could not be used because it is missing: {missing}.
+
+PREVIOUS RESPONSE:
+{previous}
+
+Reply with ONLY the missing part, in exactly this format, and nothing else:
+{format}
+""")
+
+
+def _inputs(agent: str, previous: str, missing: list, format_spec: str) -> dict:
+    return {
+        "missing": ", ".join(missing),
+        "previous": truncate(previous, budget_for(agent)),
+        "format": format_spec,
+    }
+
+
+def repair_output(agent: str, previous: str, missing: list, format_spec: str) -> str:
+    """
+    Ask `agent`'s model for just the `missing` parts of `previous`, laid out as `format_spec`.
+    Returns `previous` with the reply appended, ready for the agent's own parser; parsers
+    keep the first non-empty copy of a section, so parts that were already there win.
+    """
+    with span("repair", agent=agent) as record:
+        response = (REPAIR_PROMPT | get_llm(agent)).invoke(_inputs(agent, previous, missing, format_spec))
+        record_usage(record, response)
+    return previous.rstrip() + "\n" + response.content.strip()
+
+
+async def arepair_output(agent: str, previous: str, missing: list, format_spec: str) -> str:
+    with span("repair", agent=agent) as record:
+        response = await (REPAIR_PROMPT | get_llm(agent)).ainvoke(_inputs(agent, previous, missing, format_spec))
+        record_usage(record, response)
+    return previous.rstrip() + "\n" + response.content.strip()
@@ -0,0 +1,145 @@
+import os, threading
+
+from utils.llm_client import agent_settings
+
+MAX_ATTEMPTS = int(os.getenv("MAX_ATTEMPTS", 3))
+REVIEW_THRESHOLD = float(os.getenv("REVIEW_THRESHOLD", 7.0))
+# A retry that raises the score by less than this, with no prospect of reaching the
+# threshold at that rate, counts as a plateau
+MIN_GAIN = float(os.getenv("RETRY_MIN_GAIN", 0.5))
+# Retries run this much cooler after an improvement (they follow the feedback more
+# closely) and this much warmer after none (they explore other solutions)
+TEMPERATURE_STEP = float(os.getenv("RETRY_TEMPERATURE_STEP", 0.2))
+MIN_TEMPERATURE, MAX_TEMPERATURE = 0.1, 1.0
+# Stronger, slower (and pricier) model for final attempts and for retries of urgent tickets,
+# e.g. gemini-2.5-pro; unset = never escalate
+ESCALATION_MODEL = os.getenv("ESCALATION_MODEL", "")
+ESCALATE_URGENCY = ("high", "critical")
+
+
+class RetryPolicy:
+    """
+    How a ticket's generate/review loop retries, shared by every pipeline:
+      • stop once a candidate clears `threshold` (and its tests), or after `max_attempts`;
+      • stop early when the scores plateau. With an escalation model that hasn't run yet,
+        one last attempt runs on it first; it is one of the `max_attempts`, so a plateau on
+        the second-to-last attempt just leads into the final (escalated) one;
+      • cool down or warm up the DevAgent's temperature between attempts (TEMPERATURE_STEP);
+      • run the final attempt, and every retry of a High/Critical ticket, on `escalation_model`.
+    Call start() per ticket for a RetryRun that tracks the attempts.
+    """
+
+    def __init__(self, max_attempts: int = MAX_ATTEMPTS, threshold: float = REVIEW_THRESHOLD,
+                 min_gain: float = MIN_GAIN, temperature: float | None = None,
+                 temperature_step: float = TEMPERATURE_STEP, escalation_model: str | None = ESCALATION_MODEL,
+                 escalate_urgency: tuple = ESCALATE_URGENCY):
+        self.max_attempts = max_attempts
+        self.threshold = threshold
+        self.min_gain = min_gain
+        self.temperature = temperature
+        self.temperature_step = temperature_step
+        self.escalation_model = escalation_model or None
+        self.escalate_urgency = escalate_urgency
+
+    def start(self, urgency: str | None = None) -> "RetryRun":
+        return RetryRun(self, str(urgency or "").strip().lower() in self.escalate_urgency)
+
+
+class RetryRun:
+    """One ticket's attempts under a RetryPolicy: plan() each attempt, then record() its outcome."""
+
+    def __init__(self, policy: RetryPolicy, urgent: bool = False):
+        self.policy = policy
+        self.urgent = urgent
+        self.scores = []
+        self.seconds = []
+        self.plans = []
+        self.stopped = None
+        self._last_chance = False
+        self._temperature = policy.temperature if policy.temperature is not None \
+            else agent_settings("dev")["temperature"]
+
+    def plan(self) -> dict:
+        """DevAgent settings for the next attempt: {"model", "temperature"} (None = configured)."""
+        policy = self.policy
+        number = len(self.scores) + 1
+        if number > 1:
+            step = policy.temperature_step if self._improved() else -policy.temperature_step
+            self._temperature = min(max(self._temperature - step, MIN_TEMPERATURE), MAX_TEMPERATURE)
+        final = number >= policy.max_attempts or self._last_chance
+        escalate = policy.escalation_model and (final or (self.urgent and number > 1))
+        plan = {"model": policy.escalation_model if escalate else None, "temperature": round(self._temperature, 2)}
+        self.plans.append(plan)
+        return plan
+
+    def _improved(self) -> bool:
+        # The first retry has no trajectory yet; it just follows the feedback
+        return len(self.scores) < 2 or self.scores[-1] - max(self.scores[:-1]) >= self.policy.min_gain
+
+    def _plateaued(self) -> bool:
+        if len(self.scores) < 2:
+            return False
+        gain = self.scores[-1] - self.scores[-2]
+        remaining = self.policy.max_attempts - len(self.scores)
+        return gain < self.policy.min_gain and self.scores[-1] + max(gain, 0) * remaining < self.policy.threshold
+
+    def record(self, score: float, passed: bool | None = None, seconds: float = 0.0) -> str:
+        """
+        Record an attempt's score (and whether it passed, by default score >= threshold).
+        Returns "passed", "retry", or "stop" when the loop should give up.
+        """
+        self.scores.append(score)
+        self.seconds.append(seconds)
+        if passed if passed is not None else score >= self.policy.threshold:
+            self.stopped = "passed"
+            return "passed"
+        if len(self.scores) >= self.policy.max_attempts:
+            self.stopped = "exhausted"
+            return "stop"
+        if self._last_chance:
+            # The escalated last chance didn't pass either
+            self.stopped = "plateau"
+            return "stop"
+        if self._plateaued():
+            escalated = any(plan["model"] for plan in self.plans)
+            if escalated or not self.policy.escalation_model:
+                self.stopped = "plateau"
+                return "stop"
+            self._last_chance = True
+        return "retry"
+
+    def report(self) -> dict:
+        """
+        How the run went, and the attempts and (estimated) seconds it saved over the fixed
+        loop, which would have kept going to max_attempts.
+        """
+        saved = self.policy.max_attempts - len(self.scores) if self.stopped == "plateau" else 0
+        average = sum(self.seconds) / len(self.seconds) if self.seconds else 0.0
+        return {
+            "attempts": len(self.scores),
+            "stopped": self.stopped,
+            "scores": self.scores,
+            "escalated": sum(1 for plan in self.plans if plan["model"]),
+            "temperatures": [plan["temperature"] for plan in self.plans],
+            "saved_attempts": saved,
+            "saved_seconds": round(saved * average, 3),
+        }
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_retry_policy() -> RetryPolicy:
+    """
+    Process-wide default policy, configured from the environment:
+      MAX_ATTEMPTS / REVIEW_THRESHOLD     attempts per ticket and the passing score
+      RETRY_MIN_GAIN                      smallest score gain that isn't a plateau
+      RETRY_TEMPERATURE_STEP              temperature change between attempts (0 = fixed)
+      ESCALATION_MODEL                    model for final/urgent attempts (unset = never escalate)
+    """
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = RetryPolicy()
+        return _policy
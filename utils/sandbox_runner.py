@@ -0,0 +1,215 @@
+import asyncio, contextvars, os, pathlib, re, signal, subprocess, sys, tempfile, time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+
+from utils.instrumentation import span
+
+# Generated tests run generated code, so each run gets its own process, a throwaway
+# directory, a scrubbed environment (no API keys) and CPU/memory/file-size limits.
+TEST_TIMEOUT = 30
+MEMORY_MB = 1024
+MAX_FILE_MB = 16
+TEST_WORKERS = int(os.getenv("TEST_WORKERS", min(os.cpu_count() or 1, 8)))
+MAX_OUTPUT_CHARS = 4000
+
+# Applies the limits inside the child, then execs the test command. Setting them there
+# instead of in a preexec_fn keeps the runner safe to call from threads.
+_SANDBOX = """
+import os, resource, sys
+cpu, memory, fsize = (int(v) for v in sys.argv[1:4])
+resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+resource.setrlimit(resource.RLIMIT_FSIZE, (fsize, fsize))
+resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+os.execv(sys.executable, [sys.executable] + sys.argv[4:])
+"""
+
+_executor = None
+
+
+def _sandboxed(command: list, timeout: int, memory_mb: int) -> list:
+    if os.name != "posix":
+        return [sys.executable] + command
+    limits = [str(timeout), str(memory_mb * 1024 * 1024), str(MAX_FILE_MB * 1024 * 1024)]
+    return [sys.executable, "-c", _SANDBOX] + limits + command
+
+
+def _environment(workdir: str) -> dict:
+    return {
+        "PATH": os.environ.get("PATH", ""),
+        "HOME": workdir,
+        "TMPDIR": workdir,
+        "PYTHONPATH": workdir,
+        "PYTHONDONTWRITEBYTECODE": "1",
+        "PYTHONHASHSEED": "0",
+        # Third-party pytest plugins slow startup and would run inside the sandbox too
+        "PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1",
+    }
+
+
+def _module_filename(filename: str) -> str:
+    """The generated file's name as tests would import it: a bare, importable .py name."""
+    stem = re.sub(r"\W", "_", pathlib.Path(filename or "solution").stem) or "solution"
+    return f"{stem}.py"
+
+
+def _result(status: str, started: float, output: str = "", **counts) -> dict:
+    result = {"status": status, "passed": 0, "failed": 0, "errors": 0, "skipped": 0, "failures": []}
+    result.update(counts)
+    result["duration_s"] = round(time.perf_counter() - started, 3)
+    result["output"] = output[-MAX_OUTPUT_CHARS:]
+    return result
+
+
+def _parse_junit(path: pathlib.Path) -> dict | None:
+    if not path.exists():
+        return None
+    root = ET.parse(path).getroot()
+    suites = [root] if root.tag == "testsuite" else root.findall("testsuite")
+    counts = {"passed": 0, "failed": 0, "errors": 0, "skipped": 0, "failures": []}
+    for suite in suites:
+        for case in suite.iter("testcase"):
+            outcome = next((child for child in case if child.tag in ("failure", "error", "skipped")), None)
+            if outcome is None:
+                counts["passed"] += 1
+                continue
+            counts[{"failure": "failed", "error": "errors", "skipped": "skipped"}[outcome.tag]] += 1
+            if outcome.tag != "skipped":
+                counts["failures"].append({
+                    "test": case.get("name", "?"),
+                    "message": (outcome.get("message") or outcome.text or "").strip()[:500],
+                })
+    return counts
+
+
+def _parse_unittest(output: str) -> dict:
+    ran = re.search(r"^Ran (\d+) tests?", output, re.M)
+    failed = re.search(r"failures=(\d+)", output)
+    errors = re.search(r"errors=(\d+)", output)
+    skipped = re.search(r"skipped=(\d+)", output)
+    counts = {
+        "failed": int(failed.group(1)) if failed else 0,
+        "errors": int(errors.group(1)) if errors else 0,
+        "skipped": int(skipped.group(1)) if skipped else 0,
+        "failures": [{"test": name, "message": ""} for name in re.findall(r"^(?:FAIL|ERROR): (\S+)", output, re.M)],
+    }
+    total = int(ran.group(1)) if ran else 0
+    counts["passed"] = max(total - counts["failed"] - counts["errors"] - counts["skipped"], 0)
+    return counts
+
+
+def run_python_tests(code: str, filename: str, test_code: str,
+                     timeout: int = TEST_TIMEOUT, memory_mb: int = MEMORY_MB) -> dict:
+    """
+    Run generated pytest/unittest tests against the generated code in a sandboxed subprocess.
+    Returns {"status", "passed", "failed", "errors", "skipped", "failures", "duration_s", "output"}
+    where status is "passed", "failed" or "error"; when the tests could not run at all
+    (timeout, nothing collected) the result also has an "error" message.
+    """
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="devpilot-tests-") as workdir:
+        work = pathlib.Path(workdir)
+        module = _module_filename(filename)
+        test_file = module if module.startswith("test_") else f"test_{module}"
+        if test_file != module:
+            (work / module).write_text(code, encoding="utf-8")
+        (work / test_file).write_text(test_code, encoding="utf-8")
+
+        report = work / "report.xml"
+        if find_spec("pytest"):
+            command = ["-m", "pytest", "-q", "--tb=short", "-p", "no:cacheprovider",
+                       f"--junitxml={report}", test_file]
+        else:
+            command = ["-m", "unittest", "-v", pathlib.Path(test_file).stem]
+
+        proc = subprocess.Popen(
+            _sandboxed(command, timeout, memory_mb), cwd=workdir, env=_environment(workdir),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+            text=True, start_new_session=True
+        )
+        try:
+            output, _ = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            # Kill the whole session so processes spawned by the tests die too
+            os.killpg(proc.pid, signal.SIGKILL)
+            output, _ = proc.communicate()
+            return {**_result("error", started, output or ""), "error": f"Tests timed out after {timeout}s"}
+
+        output = output.replace(workdir + os.sep, "")
+        counts = _parse_junit(report) if find_spec("pytest") else _parse_unittest(output)
+
+    if not counts or sum(counts[k] for k in ("passed", "failed", "errors", "skipped")) == 0:
+        return {**_result("error", started, output), "error": "No tests were collected"}
+    status = "passed" if proc.returncode == 0 and not counts["failed"] and not counts["errors"] else "failed"
+    return _result(status, started, output, **counts)
+
+
+RUNNERS = {
+    "python": run_python_tests,
+}
+
+
+def run_tests(code: str, filename: str, test_code: str, language: str = "python", **limits) -> dict:
+    """Run tests with the sandboxed runner for `language`, recorded as a "test_run" span."""
+    runner = RUNNERS.get((language or "").lower())
+    if runner is None:
+        return {"status": "skipped", "error": f"No local test runner for {language}"}
+    with span("test_run") as record:
+        result = runner(code, filename, test_code, **limits)
+        record.update(status=result["status"], passed=result["passed"], failed=result["failed"] + result["errors"])
+    return result
+
+
+def _pool() -> ThreadPoolExecutor:
+    # Every run is already its own process; the threads only wait on them
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=TEST_WORKERS, thread_name_prefix="test-run")
+    return _executor
+
+
+def run_tests_parallel(jobs: list) -> list:
+    """
+    Run many test suites at once, at most TEST_WORKERS processes at a time.
+    `jobs` are dicts of run_tests keyword arguments; results come back in the same order.
+    """
+    futures = [_pool().submit(contextvars.copy_context().run, run_tests, **job) for job in jobs]
+    return [future.result() for future in futures]
+
+
+async def arun_tests(code: str, filename: str, test_code: str, language: str = "python", **limits) -> dict:
+    """Async counterpart of run_tests; shares run_tests_parallel's worker limit."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        _pool(), lambda: context.run(run_tests, code, filename, test_code, language, **limits)
+    )
+
+
+def failed_tests_feedback(result: dict) -> str:
+    """Turn a failed run into reviewer-style feedback the DevAgent can act on."""
+    if result.get("error"):
+        changes = [f"- Fix: the unit tests could not run ({result['error']})."]
+    else:
+        changes = [f"- Fix: test '{f['test']}' failed: {' '.join(f['message'].split()) or 'see output'}"
+                   for f in result.get("failures", [])] or ["- Fix: the unit tests failed."]
+    return (f"Review:\nThe code was reviewed, but its unit tests did not pass "
+            f"({result.get('passed', 0)} passed, {result.get('failed', 0)} failed, {result.get('errors', 0)} errors).\n"
+            "Suggested changes:\n" + "\n".join(changes))
+
+
+def format_test_report(result: dict) -> str:
+    """Plain-text report of a run, as shipped in the export ZIP."""
+    lines = [
+        f"Status: {result.get('status')}",
+        f"Passed: {result.get('passed', 0)}  Failed: {result.get('failed', 0)}  "
+        f"Errors: {result.get('errors', 0)}  Skipped: {result.get('skipped', 0)}",
+        f"Duration: {result.get('duration_s', 0)}s",
+    ]
+    if result.get("error"):
+        lines.append(f"Error: {result['error']}")
+    for failure in result.get("failures", []):
+        lines.append(f"\nFAILED {failure['test']}\n{failure['message']}")
+    if result.get("output"):
+        lines.append("\n--- Output ---\n" + result["output"])
+    return "\n".join(lines)
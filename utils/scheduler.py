@@ -0,0 +1,313 @@
+import asyncio, heapq, itertools, math, os, random, threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+
+from utils.token_budget import count_tokens
+
+# Lower runs first. Calls made before a ticket is classified (the classification itself)
+# run at Medium.
+URGENCY_PRIORITY = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+DEFAULT_PRIORITY = URGENCY_PRIORITY["medium"]
+
+# Quota per model, shared by every agent in the process, set with LLM_RPM / LLM_TPM (e.g.
+# 15 / 1000000 for Gemini 2.0 Flash's free tier). Unset or 0 means unlimited: quotas differ
+# per account tier, and 429s are retried with backoff either way.
+
+# Output tokens reserved per call until the response reports what it really used
+EXPECTED_OUTPUT_TOKENS = 512
+MAX_RETRIES = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+_priority = ContextVar("llm_priority", default=DEFAULT_PRIORITY)
+_schedulers = {}
+_lock = threading.Lock()
+
+
+def priority_for(level) -> int:
+    return URGENCY_PRIORITY.get(str(level or "").strip().lower(), DEFAULT_PRIORITY)
+
+
+@contextmanager
+def urgency(level):
+    """Run every LLM call made inside the block at the priority of a ticket's urgency."""
+    token = _priority.set(priority_for(level))
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Refills `per_minute` units a minute, up to one minute's worth. 0 means unlimited."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if not self.rate:
+            return 0.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # A request bigger than the whole bucket goes through once the bucket is full
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        # May go negative when a response used more than was reserved; that debt delays later calls
+        if self.rate:
+            self.level -= amount
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for rate-limit (429) and server-side (5xx) failures."""
+    code = getattr(error, "code", None)
+    if not isinstance(code, int):
+        code = getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code == 429 or 500 <= code < 600
+    text = str(error)
+    return any(marker in text for marker in ("429", "RESOURCE_EXHAUSTED", "503", "UNAVAILABLE", "500 Internal"))
+
+
+class QuotaScheduler:
+    """
+    Admits LLM calls under requests/min and tokens/min token buckets.
+    When the quota is exhausted, waiting calls are released in priority order (see urgency()),
+    then first come, first served. A 429/5xx pauses every call for a jittered exponential
+    backoff before the failed call is retried.
+    Only the first call in line sleeps, until the buckets will have refilled enough for it;
+    the others sleep until the line moves.
+    """
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, max_retries: int = MAX_RETRIES,
+                 base_delay: float = BASE_DELAY, max_delay: float = MAX_DELAY):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {"calls": 0, "retries": 0, "waited_s": 0.0}
+        self._waiting = []
+        # ticket -> callback that wakes an async waiter (sync waiters wait on _cond)
+        self._wakers = {}
+        self._order = itertools.count()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _try_acquire(self, ticket: tuple, amount: int) -> float:
+        """
+        Admit the call (0.0) or return how long to wait before trying again: until the
+        buckets refill for the first call in line, until woken (math.inf) for the others.
+        """
+        with self._cond:
+            if self._waiting[0] != ticket:
+                return math.inf
+            now = time.monotonic()
+            wait = max(self._paused_until - now,
+                       self.requests.wait_time(1, now),
+                       self.tokens.wait_time(amount, now))
+            if wait > 0:
+                return wait
+            heapq.heappop(self._waiting)
+            self._wakers.pop(ticket, None)
+            self.requests.take(1)
+            self.tokens.take(amount)
+            self.stats["calls"] += 1
+            self._notify()
+            return 0.0
+
+    def _notify(self):
+        """Wake every waiter so the new first in line works out its wait. Call with _cond held."""
+        self._cond.notify_all()
+        for wake in self._wakers.values():
+            wake()
+
+    def _enqueue(self, waker=None) -> tuple:
+        ticket = (_priority.get(), next(self._order))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            if waker is not None:
+                self._wakers[ticket] = waker
+        return ticket
+
+    def _abandon(self, ticket: tuple):
+        with self._cond:
+            self._wakers.pop(ticket, None)
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._notify()
+
+    def acquire(self, amount: int):
+        ticket = self._enqueue()
+        started = time.monotonic()
+        try:
+            with self._cond:
+                while (wait := self._try_acquire(ticket, amount)) > 0:
+                    self._cond.wait(None if wait == math.inf else wait)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        self.stats["waited_s"] += time.monotonic() - started
+
+    async def aacquire(self, amount: int):
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+        ticket = self._enqueue(lambda: loop.call_soon_threadsafe(woken.set))
+        started = time.monotonic()
+        try:
+            while True:
+                # Cleared before checking, so a wake-up that lands in between isn't lost
+                woken.clear()
+                wait = self._try_acquire(ticket, amount)
+                if wait <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(woken.wait(), None if wait == math.inf else wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        self.stats["waited_s"] += time.monotonic() - started
+
+    def settle(self, reserved: int, used: int | None):
+        """Correct the token bucket once the response reports its real usage."""
+        if used is not None:
+            with self._cond:
+                self.tokens.take(used - reserved)
+                if used < reserved:
+                    self._notify()
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential delay; also holds back every other call for that long."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self.stats["retries"] += 1
+        return delay
+
+
+def get_scheduler(model: str) -> QuotaScheduler:
+    """The process-wide scheduler for a model, throttled to LLM_RPM / LLM_TPM when they are set."""
+    with _lock:
+        if model not in _schedulers:
+            _schedulers[model] = QuotaScheduler(
+                float(os.getenv("LLM_RPM") or 0), float(os.getenv("LLM_TPM") or 0),
+                max_retries=int(os.getenv("LLM_MAX_RETRIES", MAX_RETRIES))
+            )
+        return _schedulers[model]
+
+
+def _usage(message) -> int | None:
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+def _as_chunk(result) -> ChatGenerationChunk:
+    """A whole response as a single stream chunk, for models that can't stream."""
+    message = result.generations[0].message
+    return ChatGenerationChunk(message=AIMessageChunk(
+        content=message.content, usage_metadata=getattr(message, "usage_metadata", None)
+    ))
+
+
+class ScheduledChatModel(BaseChatModel):
+    """
+    Routes a chat model's calls through a QuotaScheduler. Cache hits are answered before
+    the scheduler is consulted, so they cost no quota.
+    """
+
+    inner: BaseChatModel
+    scheduler: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return self.inner._llm_type
+
+    def _get_llm_string(self, stop=None, **kwargs: Any) -> str:
+        # Same cache key as the wrapped model, so existing cache entries stay valid
+        return self.inner._get_llm_string(stop=stop, **kwargs)
+
+    def _reserve(self, messages) -> int:
+        return count_tokens("\n".join(str(m.content) for m in messages)) + EXPECTED_OUTPUT_TOKENS
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        reserved = self._reserve(messages)
+        for attempt in range(self.scheduler.max_retries + 1):
+            self.scheduler.acquire(reserved)
+            try:
+                result = self.inner._generate(messages, stop=stop, **kwargs)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.scheduler.max_retries:
+                    raise
+                time.sleep(self.scheduler.backoff(attempt))
+                continue
+            self.scheduler.settle(reserved, _usage(result.generations[0].message))
+            return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        reserved = self._reserve(messages)
+        for attempt in range(self.scheduler.max_retries + 1):
+            await self.scheduler.aacquire(reserved)
+            try:
+                result = await self.inner._agenerate(messages, stop=stop, **kwargs)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.scheduler.max_retries:
+                    raise
+                await asyncio.sleep(self.scheduler.backoff(attempt))
+                continue
+            self.scheduler.settle(reserved, _usage(result.generations[0].message))
+            return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        if type(self.inner)._stream is BaseChatModel._stream:
+            yield _as_chunk(self._generate(messages, stop=stop, **kwargs))
+            return
+        reserved = self._reserve(messages)
+        for attempt in range(self.scheduler.max_retries + 1):
+            self.scheduler.acquire(reserved)
+            started, message = False, None
+            try:
+                for chunk in self.inner._stream(messages, stop=stop, **kwargs):
+                    started = True
+                    message = chunk.message if message is None else message + chunk.message
+                    yield chunk
+            except Exception as e:
+                # Once tokens have been shown to the caller the stream can't be replayed
+                if started or not is_retryable(e) or attempt == self.scheduler.max_retries:
+                    raise
+                time.sleep(self.scheduler.backoff(attempt))
+                continue
+            self.scheduler.settle(reserved, _usage(message))
+            return
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        if type(self.inner)._astream is BaseChatModel._astream and type(self.inner)._stream is BaseChatModel._stream:
+            yield _as_chunk(await self._agenerate(messages, stop=stop, **kwargs))
+            return
+        reserved = self._reserve(messages)
+        for attempt in range(self.scheduler.max_retries + 1):
+            await self.scheduler.aacquire(reserved)
+            started, message = False, None
+            try:
+                async for chunk in self.inner._astream(messages, stop=stop, **kwargs):
+                    started = True
+                    message = chunk.message if message is None else message + chunk.message
+                    yield chunk
+            except Exception as e:
+                if started or not is_retryable(e) or attempt == self.scheduler.max_retries:
+                    raise
+                await asyncio.sleep(self.scheduler.backoff(attempt))
+                continue
+            self.scheduler.settle(reserved, _usage(message))
+            return
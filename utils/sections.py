@@ -0,0 +1,139 @@
+import re
+
+_patterns = {}
+
+
+def _marker_pattern(markers: dict) -> re.Pattern:
+    """
+    One regex matching any of the `---NAME---` markers, tolerating the variations models
+    produce: any case, two or more dashes per side, spaces/underscores inside the name,
+    a trailing colon, and **bold** wrapping.
+    """
+    key = tuple(markers.items())
+    if key not in _patterns:
+        _patterns[key] = _compile_markers(markers)
+    return _patterns[key]
+
+
+def _compile_markers(markers: dict) -> re.Pattern:
+    alternatives = []
+    for marker, section in markers.items():
+        words = marker.strip("-").split()
+        name = r"[\s_]*".join(re.escape(w) for w in words)
+        # Section names double as regex group names, so they must be identifiers
+        alternatives.append(f"(?P<{section}>{name})")
+    return re.compile(
+        r"(?:\*\*)?-{2,}[ \t]*(?:" + "|".join(alternatives) + r")[ \t]*:?[ \t]*-{2,}(?:\*\*)?:?",
+        re.I,
+    )
+
+
+def strip_fences(text: str) -> str:
+    """Drop a markdown fence (with its language label) opening and/or closing a section."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+    if text.rstrip().endswith("```"):
+        text = text.rstrip()[:-3]
+    return text.strip()
+
+
+def parse_sections(content: str, markers: dict) -> dict:
+    """
+    Split `---MARKER---` delimited output into {section: text} in a single pass.
+    Text before the first marker is ignored, fences around a section (or the whole
+    response) are removed, and when a marker repeats the first non-empty section wins.
+    Sections that never appear are absent from the result.
+    """
+    sections = {}
+    matches = list(_marker_pattern(markers).finditer(content))
+    for match, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following else len(content)
+        text = strip_fences(content[match.end():end])
+        if not sections.get(match.lastgroup):
+            sections[match.lastgroup] = text
+    return sections
+
+
+def first_marker(content: str, markers: dict) -> int:
+    """Index where the first marker starts, or -1. Used to split fused responses."""
+    match = _marker_pattern(markers).search(content)
+    return match.start() if match else -1
+
+
+def section_template(markers: dict, sections: list) -> str:
+    """The `---MARKER---` layout for just `sections`, e.g. for asking a model to fill them in."""
+    return "\n".join(f"{marker}\n<{section}>" for marker, section in markers.items() if section in sections)
+
+
+class SectionStreamParser:
+    """
+    Incremental parser for `---MARKER---` delimited LLM output.
+
+    Feed it text chunks as they stream in; it returns (section, text) events as soon as
+    text can be attributed to a section. Sections listed in `whole` (e.g. a filename) are
+    buffered and emitted once, when the next marker closes them; all other sections are
+    emitted chunk by chunk. Text that could be the start of a marker split across two
+    chunks is held back until the next feed().
+    """
+
+    def __init__(self, markers: dict, whole: tuple = ()):
+        # markers maps the literal marker text to a section name,
+        # e.g. {"---CODE---": "code"}
+        self.markers = markers
+        self.whole = set(whole)
+        self.section = None
+        self._pending = ""
+        self._held = ""
+        self._longest = max(len(m) for m in markers)
+
+    def feed(self, chunk: str) -> list:
+        self._pending += chunk
+        events = []
+
+        while True:
+            hit = min(
+                ((self._pending.find(m), m) for m in self.markers if m in self._pending),
+                default=None,
+            )
+            if hit is None:
+                break
+            index, marker = hit
+            self._emit(self._pending[:index], events)
+            self._close_section(events)
+            self.section = self.markers[marker]
+            self._pending = self._pending[index + len(marker):]
+
+        # Keep back a tail that might be the first half of a marker
+        keep = self._partial_marker_length()
+        ready, self._pending = self._pending[:len(self._pending) - keep], self._pending[len(self._pending) - keep:]
+        self._emit(ready, events)
+        return events
+
+    def close(self) -> list:
+        events = []
+        self._emit(self._pending, events)
+        self._pending = ""
+        self._close_section(events)
+        self.section = None
+        return events
+
+    def _partial_marker_length(self) -> int:
+        tail = self._pending[-(self._longest - 1):] if self._longest > 1 else ""
+        for start in range(len(tail)):
+            if any(m.startswith(tail[start:]) for m in self.markers):
+                return len(tail) - start
+        return 0
+
+    def _emit(self, text: str, events: list):
+        if not text or self.section is None:
+            return
+        if self.section in self.whole:
+            self._held += text
+            return
+        events.append((self.section, text))
+
+    def _close_section(self, events: list):
+        if self.section in self.whole:
+            events.append((self.section, self._held.strip()))
+            self._held = ""
@@ -0,0 +1,114 @@
+import os, threading
+
+from utils.ticket_index import TicketIndex
+from utils.token_budget import count_tokens, compact_code
+from utils.instrumentation import span
+
+DEFAULT_PATH = os.path.join(".cache", "solutions.sqlite")
+# Accepted solutions shown to the DevAgent per generation, and the tokens they may take up
+FEW_SHOT_EXAMPLES = int(os.getenv("FEW_SHOT_EXAMPLES", 2))
+FEW_SHOT_BUDGET = int(os.getenv("FEW_SHOT_BUDGET", 800))
+# Below this cosine similarity an accepted solution is more distraction than help
+EXAMPLE_MIN_SIMILARITY = float(os.getenv("EXAMPLE_MIN_SIMILARITY", 0.2))
+
+
+def _text(summary: str, category: str) -> str:
+    return f"{category}: {summary}"
+
+
+class SolutionLibrary:
+    """
+    Accepted solutions (ticket summary, category, language, filename, code) indexed by
+    their summary with the same TF-IDF index as utils/ticket_index.py, so the DevAgent can
+    start from how similar tickets were solved instead of from scratch.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self._index = TicketIndex(path)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def add(self, ticket_info: dict, code_output: dict) -> bool:
+        """Store an accepted solution; returns False if it was already stored."""
+        language = ticket_info.get("language", "python").lower()
+        text = _text(ticket_info["summary"], ticket_info.get("category", ""))
+        for match in self._index.search(text, 1, 0.99):
+            if match["result"]["code"] == code_output["code"]:
+                return False
+        self._index.add(text, {
+            "summary": ticket_info["summary"],
+            "category": ticket_info.get("category", ""),
+            "language": language,
+            "filename": code_output.get("filename", ""),
+            "code": code_output["code"],
+        })
+        return True
+
+    def similar(self, summary: str, category: str, language: str, limit: int = FEW_SHOT_EXAMPLES,
+                threshold: float = EXAMPLE_MIN_SIMILARITY) -> list:
+        """The `limit` most similar accepted solutions in `language`, each with its "similarity"."""
+        language = language.lower()
+        matches = self._index.search(_text(summary, category), limit, threshold,
+                                     accept=lambda record: record["language"] == language)
+        return [{**match["result"], "similarity": match["similarity"]} for match in matches]
+
+
+def format_examples(examples: list, budget: int = FEW_SHOT_BUDGET) -> str:
+    """
+    Render accepted solutions as a compact prompt section of at most `budget` tokens. Each
+    example gets an equal share; code that doesn't fit is compacted, and examples that
+    still don't fit are dropped, least similar first.
+    """
+    if not examples:
+        return ""
+    share = budget // len(examples)
+    blocks = []
+    for number, example in enumerate(examples, start=1):
+        header = (f"Example {number} ({example['category']}, similarity {example['similarity']}):\n"
+                  f"Ticket: {example['summary']}\nFile: {example['filename']}\n")
+        code = compact_code(example["code"], max(share - count_tokens(header) - 10, 0), example["language"])
+        blocks.append(f"{header}```{example['language']}\n{code}\n```")
+
+    while blocks and count_tokens("\n\n".join(blocks)) > budget:
+        blocks.pop()
+    return "\n\n".join(blocks)
+
+
+_library = None
+_library_lock = threading.Lock()
+
+
+def get_solution_library() -> SolutionLibrary | None:
+    """
+    Process-wide solution library configured from the environment:
+      SOLUTION_LIBRARY_DISABLED=1   don't retrieve or store accepted solutions
+      SOLUTION_LIBRARY_PATH         SQLite file (default .cache/solutions.sqlite)
+      FEW_SHOT_EXAMPLES / FEW_SHOT_BUDGET / EXAMPLE_MIN_SIMILARITY   see above
+    """
+    global _library
+    if os.getenv("SOLUTION_LIBRARY_DISABLED", "0") == "1":
+        return None
+
+    with _library_lock:
+        if _library is None:
+            _library = SolutionLibrary(os.getenv("SOLUTION_LIBRARY_PATH", DEFAULT_PATH))
+        return _library
+
+
+def few_shot_examples(summary: str, category: str, language: str) -> str:
+    """Prompt section with the accepted solutions closest to a ticket, or "" when there are none."""
+    library = get_solution_library()
+    if library is None or not summary:
+        return ""
+    with span("retrieve") as record:
+        examples = library.similar(summary, category, language)
+        record["examples"] = len(examples)
+        return format_examples(examples)
+
+
+def remember_solution(ticket_info: dict, code_output: dict | None):
+    """Add a solution that passed review (and its tests) to the library."""
+    library = get_solution_library()
+    if library is not None and code_output and code_output.get("code") and "summary" in ticket_info:
+        library.add(ticket_info, code_output)
@@ -0,0 +1,158 @@
+import asyncio, contextvars, inspect, time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from utils.instrumentation import span
+
+
+class Stage:
+    """One step of a StageGraph: func(**inputs), whose value is stored under `name`."""
+
+    def __init__(self, name: str, func, inputs=(), when=None):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.when = when
+
+    def ready(self, values: dict) -> bool:
+        return all(name in values for name in self.inputs)
+
+
+class GraphRun:
+    """The values of one StageGraph run (initial ones and every stage's) and its stage timings."""
+
+    def __init__(self, values: dict):
+        self.values = dict(values)
+        # stage -> {"start_ms", "wall_ms"}, start relative to the start of the run
+        self.timings = {}
+        self.skipped = []
+        self.wall_ms = 0.0
+        self._started = time.perf_counter()
+
+    def __getitem__(self, name: str):
+        return self.values[name]
+
+    def get(self, name: str, default=None):
+        return self.values.get(name, default)
+
+    def _elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self._started) * 1000, 3)
+
+
+class StageGraph:
+    """
+    Stages that declare the values they need. A stage starts as soon as all of its inputs
+    exist, concurrently with every other stage that is ready, and its return value is stored
+    under its name for the stages that need it. `when(**inputs)` can skip a stage, which
+    then produces None.
+
+    run() calls the stages in the calling thread while they run one at a time and in worker
+    threads while several are ready at once; arun() awaits coroutine functions as tasks and
+    runs plain functions in threads. Either way each stage is timed in a span named after
+    it, and the returned GraphRun says when each one started and how long it took.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name: str, func, inputs=(), when=None) -> "StageGraph":
+        if name in self.stages:
+            raise ValueError(f"Stage {name!r} is already defined")
+        self.stages[name] = Stage(name, func, inputs, when)
+        return self
+
+    def _check(self, values: dict):
+        """Raise ValueError for inputs nothing provides and for stages that wait on each other."""
+        for stage in self.stages.values():
+            if stage.name in values:
+                raise ValueError(f"Stage {stage.name!r} would overwrite the initial value of the same name")
+            missing = [name for name in stage.inputs if name not in values and name not in self.stages]
+            if missing:
+                raise ValueError(f"Stage {stage.name!r} needs {', '.join(missing)}, which nothing provides")
+
+        available = set(values)
+        remaining = dict(self.stages)
+        while remaining:
+            ready = [name for name, stage in remaining.items() if all(i in available for i in stage.inputs)]
+            if not ready:
+                raise ValueError(f"Stages {', '.join(remaining)} depend on each other")
+            for name in ready:
+                available.add(name)
+                del remaining[name]
+
+    def _skip(self, stage: Stage, arguments: dict, run: GraphRun) -> bool:
+        if stage.when is None or stage.when(**arguments):
+            return False
+        run.skipped.append(stage.name)
+        return True
+
+    def _execute(self, stage: Stage, run: GraphRun):
+        arguments = {name: run.values[name] for name in stage.inputs}
+        if self._skip(stage, arguments, run):
+            return None
+        start_ms = run._elapsed_ms()
+        with span(stage.name) as record:
+            value = stage.func(**arguments)
+        run.timings[stage.name] = {"start_ms": start_ms, "wall_ms": record["wall_ms"]}
+        return value
+
+    async def _aexecute(self, stage: Stage, run: GraphRun):
+        arguments = {name: run.values[name] for name in stage.inputs}
+        if self._skip(stage, arguments, run):
+            return None
+        start_ms = run._elapsed_ms()
+        with span(stage.name) as record:
+            if inspect.iscoroutinefunction(stage.func):
+                value = await stage.func(**arguments)
+            else:
+                value = await asyncio.to_thread(stage.func, **arguments)
+        run.timings[stage.name] = {"start_ms": start_ms, "wall_ms": record["wall_ms"]}
+        return value
+
+    def run(self, **values) -> GraphRun:
+        """Run every stage, given the initial values they need; a failing stage's exception is raised."""
+        self._check(values)
+        run = GraphRun(values)
+        pending = dict(self.stages)
+        futures = {}
+        pool = None
+        try:
+            while pending or futures:
+                ready = [pending.pop(name) for name in [n for n, s in pending.items() if s.ready(run.values)]]
+                if len(ready) == 1 and not futures:
+                    # Nothing to overlap with, so stay on the caller's thread (Streamlit needs that)
+                    run.values[ready[0].name] = self._execute(ready[0], run)
+                    continue
+                if ready and pool is None:
+                    pool = ThreadPoolExecutor(len(self.stages), thread_name_prefix="stage")
+                for stage in ready:
+                    # Each thread gets the caller's context: enclosing spans, recorder, urgency...
+                    context = contextvars.copy_context()
+                    futures[pool.submit(context.run, self._execute, stage, run)] = stage.name
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    run.values[futures.pop(future)] = future.result()
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+        run.wall_ms = run._elapsed_ms()
+        return run
+
+    async def arun(self, **values) -> GraphRun:
+        """Async run(); when a stage fails the ones still running are cancelled."""
+        self._check(values)
+        run = GraphRun(values)
+        pending = dict(self.stages)
+        tasks = {}
+        try:
+            while pending or tasks:
+                for name in [n for n, s in pending.items() if s.ready(run.values)]:
+                    tasks[asyncio.create_task(self._aexecute(pending.pop(name), run))] = name
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    run.values[tasks.pop(task)] = task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        run.wall_ms = run._elapsed_ms()
+        return run
@@ -0,0 +1,147 @@
+import ast, io, os, re, shutil, subprocess, tempfile
+
+# Local checks that run in milliseconds, before an LLM review that takes seconds.
+# A checker takes the code and returns (errors, warnings): errors mean the code can't
+# run as written and fail the gate; warnings are handed to the reviewer. A checker whose
+# tool isn't installed returns None and is skipped.
+CHECK_TIMEOUT = 10
+
+
+def check_python_compile(code: str):
+    try:
+        compile(code, "<generated>", "exec")
+    except SyntaxError as e:
+        return [f"line {e.lineno}: {e.msg} (SyntaxError)"], []
+    except ValueError as e:  # e.g. null bytes
+        return [str(e)], []
+    return [], []
+
+
+def check_python_lint(code: str):
+    """pyflakes when installed, otherwise a few cheap ast checks."""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return [], []  # already reported by check_python_compile
+
+    try:
+        from pyflakes.api import check
+        from pyflakes.reporter import Reporter
+    except ImportError:
+        return [], _ast_lint(tree)
+
+    out = io.StringIO()
+    check(code, "generated.py", Reporter(out, out))
+    warnings = [line.split(":", 1)[1].strip() if ":" in line else line
+                for line in out.getvalue().splitlines() if line.strip()]
+    return [], [f"line {w}" for w in warnings]
+
+
+def _ast_lint(tree: ast.AST) -> list:
+    warnings = []
+    imported = {}
+    used = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            if isinstance(node, ast.ImportFrom) and node.module == "__future__":
+                continue
+            for alias in node.names:
+                name = (alias.asname or alias.name).split(".")[0]
+                if name != "*":
+                    imported.setdefault(name, node.lineno)
+        elif isinstance(node, ast.Name):
+            used.add(node.id)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            used.add(node.value)  # names listed in __all__
+        elif isinstance(node, ast.ExceptHandler) and node.type is None:
+            warnings.append(f"line {node.lineno}: bare 'except:' also catches KeyboardInterrupt/SystemExit")
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for default in node.args.defaults + node.args.kw_defaults:
+                if isinstance(default, (ast.List, ast.Dict, ast.Set)):
+                    warnings.append(f"line {node.lineno}: mutable default argument in '{node.name}'")
+        elif isinstance(node, ast.Compare):
+            if any(isinstance(op, (ast.Eq, ast.NotEq)) for op in node.ops) and \
+                    any(isinstance(c, ast.Constant) and c.value is None for c in node.comparators):
+                warnings.append(f"line {node.lineno}: comparison to None should use 'is' / 'is not'")
+
+    for name, lineno in imported.items():
+        if name not in used:
+            warnings.append(f"line {lineno}: '{name}' imported but unused")
+    return sorted(warnings, key=lambda w: int(w.split(":")[0].split()[1]))
+
+
+def _run_tool(command: list, code: str, suffix: str, use_stdin: bool = False):
+    """Run a syntax-check command on the code; its stderr becomes the errors."""
+    if not shutil.which(command[0]):
+        return None
+    path = None
+    try:
+        if use_stdin:
+            proc = subprocess.run(command, input=code, capture_output=True, text=True, timeout=CHECK_TIMEOUT)
+        else:
+            with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False, encoding="utf-8") as fh:
+                fh.write(code)
+                path = fh.name
+            proc = subprocess.run(command + [path], capture_output=True, text=True, timeout=CHECK_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return [], [f"{command[0]} timed out after {CHECK_TIMEOUT}s"]
+    finally:
+        if path:
+            os.unlink(path)
+
+    if proc.returncode == 0:
+        return [], []
+    output = proc.stderr or proc.stdout
+    if path:
+        output = output.replace(path, "<generated>")
+    # Keep the diagnostic itself, not the tool's own stack trace or version banner
+    lines = [ln for ln in output.splitlines()
+             if ln.strip() and not ln.lstrip().startswith("at ") and not ln.startswith("Node.js v")]
+    return lines[:10], []
+
+
+def check_javascript(code: str):
+    # node can't parse JSX, and only parses import/export in an .mjs file
+    if re.search(r"return\s*\(?\s*<[A-Za-z>]|<[A-Z]\w*[\s/>]", code):
+        return None
+    suffix = ".mjs" if re.search(r"^\s*(import|export)\b", code, re.M) else ".js"
+    return _run_tool(["node", "--check"], code, suffix)
+
+
+def check_go(code: str):
+    return _run_tool(["gofmt", "-e"], code, ".go", use_stdin=True)
+
+
+def check_shell(code: str):
+    return _run_tool(["bash", "-n"], code, ".sh")
+
+
+CHECKERS = {
+    "python": [check_python_compile, check_python_lint],
+    "javascript": [check_javascript],
+    "go": [check_go],
+    "bash": [check_shell],
+    "shell": [check_shell],
+}
+
+
+def register_checker(language: str, checker):
+    """Add a checker for a language, e.g. a wrapper around a project's own linter."""
+    CHECKERS.setdefault(language.lower(), []).append(checker)
+
+
+def check_code(code: str, language: str) -> dict:
+    """
+    Run every available checker for `language`.
+    Returns {"ok", "errors", "warnings", "checkers"}; ok is False when any checker found
+    an error. Languages without a local checker pass with nothing checked.
+    """
+    errors, warnings, ran = [], [], []
+    for checker in CHECKERS.get((language or "").lower(), []):
+        found = checker(code)
+        if found is None:
+            continue
+        ran.append(checker.__name__)
+        errors += found[0]
+        warnings += found[1]
+    return {"ok": not errors, "errors": errors, "warnings": warnings, "checkers": ran}
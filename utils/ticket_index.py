@@ -0,0 +1,202 @@
+import array, json, math, os, re, sqlite3, threading, time, zlib
+
+import numpy as np
+
+DEFAULT_PATH = os.path.join(".cache", "ticket_index.sqlite")
+# Cosine similarity above which a processed ticket's whole result is reused, and above
+# which only its category, urgency and language are
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", 0.9))
+SIMILAR_THRESHOLD = float(os.getenv("SIMILAR_THRESHOLD", 0.75))
+# Best candidates from the inverted index that get a full cosine check
+CANDIDATES = 8
+# A document's cached TF-IDF norm is recomputed once the index has grown this much
+NORM_STALENESS = 0.05
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can for from has have i in is it its of on or should so that the
+their them then there this to was we when which while will with would our your you user users
+""".split())
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def terms(text: str) -> dict:
+    """
+    Hashed, roughly stemmed word terms of a ticket with sublinear tf weights. Bigrams were
+    left out on purpose: reworded duplicates share words far more often than word pairs.
+    """
+    words = [_stem(w) for w in re.findall(r"[a-z0-9]+", text.lower()) if len(w) > 1 and w not in STOPWORDS]
+    counts = {}
+    for term in words:
+        # crc32 rather than hash(): stable across processes, so stored tickets index the same way
+        key = zlib.crc32(term.encode("utf-8"))
+        counts[key] = counts.get(key, 0) + 1
+    return {key: 1.0 + math.log(count) for key, count in counts.items()}
+
+
+class TicketIndex:
+    """
+    TF-IDF similarity index over tickets that already went through the pipeline.
+
+    Tickets and their results live in SQLite; the index itself is in memory: an inverted
+    index of hashed terms whose postings are flat arrays, scored with NumPy. The top
+    CANDIDATES are re-scored with the full cosine (document norms are cached and refreshed
+    as IDF weights drift with NORM_STALENESS growth). Adding a ticket
+    and looking one up are sub-millisecond at tens of thousands of tickets. Tickets added by
+    other processes are picked up on the next lookup.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tickets (
+                id INTEGER PRIMARY KEY,
+                ticket TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+        self._postings = {}   # term -> (array of doc positions, array of tf weights)
+        self._docs = []       # per doc: (row id, {term: tf})
+        self._norms = {}      # doc position -> (index size when computed, norm)
+        self._last_id = 0
+        with self._lock:
+            self._refresh()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _index(self, row_id: int, text: str):
+        doc_terms = terms(text)
+        position = len(self._docs)
+        self._docs.append((row_id, doc_terms))
+        for term, tf in doc_terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array.array("i"), array.array("f"))
+            postings[0].append(position)
+            postings[1].append(tf)
+        self._last_id = max(self._last_id, row_id)
+
+    def _refresh(self):
+        rows = self._conn.execute(
+            "SELECT id, ticket FROM tickets WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        for row_id, text in rows:
+            self._index(row_id, text)
+
+    def _idf(self, df: int) -> float:
+        return math.log((len(self._docs) + 1) / (df + 1)) + 1.0
+
+    def add(self, ticket: str, result: dict) -> int:
+        """Remember a processed ticket and its pipeline result."""
+        stored = {k: v for k, v in result.items() if k not in ("metrics", "stages", "duplicate_of")}
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO tickets (ticket, result, created) VALUES (?, ?, ?)",
+                (ticket, json.dumps(stored, ensure_ascii=False, default=str), time.time()),
+            )
+            self._conn.commit()
+            self._refresh()
+        return cursor.lastrowid
+
+    def _norm(self, position: int) -> float:
+        size, norm = self._norms.get(position, (0, 0.0))
+        if len(self._docs) > size * (1 + NORM_STALENESS):
+            doc = self._docs[position][1]
+            norm = math.sqrt(sum((tf * self._idf(len(self._postings[term][0]))) ** 2 for term, tf in doc.items()))
+            self._norms[position] = (len(self._docs), norm)
+        return norm
+
+    def _cosine(self, query: dict, q_norm: float, position: int, idf: dict) -> float:
+        doc = self._docs[position][1]
+        dot = sum(tf * doc[term] * idf[term] ** 2 for term, tf in query.items() if term in doc)
+        d_norm = self._norm(position)
+        return dot / (q_norm * d_norm) if q_norm and d_norm else 0.0
+
+    def search(self, ticket: str, limit: int = 1, threshold: float = SIMILAR_THRESHOLD, accept=None) -> list:
+        """
+        Up to `limit` processed tickets at least `threshold` similar to `ticket`, most similar
+        first, as {"similarity", "ticket", "result"}. `accept(result)` can filter them further.
+        """
+        query = terms(ticket)
+        with self._lock:
+            self._refresh()
+            if not query or not self._docs:
+                return []
+            scores = np.zeros(len(self._docs), dtype=np.float32)
+            idf = {}
+            for term, tf in query.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                idf[term] = self._idf(len(postings[0]))
+                # A doc appears once per term's postings, so plain fancy-index addition is safe
+                positions = np.frombuffer(postings[0], dtype=np.int32)
+                scores[positions] += np.frombuffer(postings[1], dtype=np.float32) * (tf * idf[term] ** 2)
+                del positions  # release the buffer so the postings array can grow again
+            q_norm = math.sqrt(sum((tf * idf.get(term, self._idf(0))) ** 2 for term, tf in query.items()))
+
+            count = min(max(CANDIDATES, limit * 4), len(scores))
+            candidates = np.argpartition(-scores, count - 1)[:count]
+            ranked = []
+            for position in candidates:
+                if scores[position] <= 0:
+                    continue
+                value = self._cosine(query, q_norm, position, idf)
+                if value >= threshold:
+                    ranked.append((value, self._docs[position][0]))
+            ranked.sort(reverse=True)
+
+            matches = []
+            for similarity, row_id in ranked:
+                text, result = self._conn.execute(
+                    "SELECT ticket, result FROM tickets WHERE id = ?", (row_id,)
+                ).fetchone()
+                result = json.loads(result)
+                if accept is None or accept(result):
+                    matches.append({"similarity": round(similarity, 4), "ticket": text, "result": result})
+                    if len(matches) == limit:
+                        break
+        return matches
+
+    def lookup(self, ticket: str, threshold: float = SIMILAR_THRESHOLD) -> dict | None:
+        """
+        The most similar processed ticket as {"similarity", "ticket", "result"}, or None
+        when nothing reaches `threshold`.
+        """
+        matches = self.search(ticket, 1, threshold)
+        return matches[0] if matches else None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_ticket_index() -> TicketIndex | None:
+    """
+    Process-wide ticket index configured from the environment:
+      TICKET_INDEX_DISABLED=1   don't look up or remember tickets
+      TICKET_INDEX_PATH         SQLite file (default .cache/ticket_index.sqlite)
+      DUPLICATE_THRESHOLD / SIMILAR_THRESHOLD   see above
+    """
+    global _index
+    if os.getenv("TICKET_INDEX_DISABLED", "0") == "1":
+        return None
+
+    with _index_lock:
+        if _index is None:
+            _index = TicketIndex(os.getenv("TICKET_INDEX_PATH", DEFAULT_PATH))
+        return _index
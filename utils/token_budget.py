@@ -0,0 +1,185 @@
+import ast, os, re
+
+# Input budgets (in tokens) for the variable parts of each agent's prompt: the code,
+# reviewer feedback, ticket text... Override per agent with <AGENT>_AGENT_INPUT_BUDGET.
+AGENT_BUDGETS = {
+    "ticket":  2000,
+    "dev":     1500,
+    "review":  12000,
+    "test":    8000,
+    "improve": 12000,
+    "explain": 8000,
+}
+DEFAULT_BUDGET = 8000
+
+# Older attempts' feedback is squeezed into this many tokens each
+OLDER_FEEDBACK_TOKENS = 120
+
+_encoder = None
+
+
+def budget_for(agent: str) -> int:
+    override = os.getenv(f"{agent.upper()}_AGENT_INPUT_BUDGET")
+    return int(override) if override else AGENT_BUDGETS.get(agent, DEFAULT_BUDGET)
+
+
+def count_tokens(text: str) -> int:
+    """
+    Token count used for budgeting. Uses tiktoken when it is installed; Gemini's own
+    tokenizer needs an API round-trip, and a BPE count is close enough to budget with.
+    Falls back to ~4 characters per token.
+    """
+    global _encoder
+    if not text:
+        return 0
+    if _encoder is None:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoder = False
+    if _encoder:
+        return len(_encoder.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate(text: str, budget: int, marker: str = "\n[... truncated ...]") -> str:
+    """Cut text to roughly `budget` tokens, keeping the beginning."""
+    if count_tokens(text) <= budget:
+        return text
+    # Scale by the observed chars/token ratio, then trim until it fits
+    chars = int(len(text) * budget / max(count_tokens(text), 1))
+    while chars > 0 and count_tokens(text[:chars]) > budget:
+        chars = int(chars * 0.9)
+    return text[:chars].rstrip() + marker
+
+
+def extract_suggested_changes(review: str) -> str:
+    """
+    Keep only the actionable part of a ReviewAgent review: the suggested-changes list
+    when there is one, otherwise every bullet/numbered line, otherwise the review itself.
+    """
+    lines = review.splitlines()
+    for index, line in enumerate(lines):
+        if re.search(r"suggested changes?", line, re.I):
+            section = []
+            for item in lines[index + 1:]:
+                if re.match(r"\s*(score|ready\s*for\s*deployment)\s*:", item, re.I):
+                    break
+                # A non-bullet line after the list has started ends the section
+                if section and item.strip() and not re.match(r"\s*([-*•]|\d+[.)])\s+", item) \
+                        and not item.startswith((" ", "\t")):
+                    break
+                section.append(item)
+            if "\n".join(section).strip():
+                return "\n".join(section).strip()
+
+    bullets = [ln.strip() for ln in review.splitlines() if re.match(r"\s*([-*•]|\d+[.)])\s+", ln)]
+    if bullets:
+        return "\n".join(bullets)
+    return review.strip()
+
+
+def compact_feedback(feedback, budget: int) -> str:
+    """
+    Turn reviewer feedback from one or more attempts into a prompt section of at most
+    `budget` tokens. The latest review contributes its suggested changes in full; older
+    attempts are reduced to a short line each so retries don't grow the prompt.
+    """
+    if not feedback:
+        return ""
+    history = [feedback] if isinstance(feedback, str) else [f for f in feedback if f]
+    if not history:
+        return ""
+
+    latest = extract_suggested_changes(history[-1])
+    older = []
+    for number, review in enumerate(history[:-1], start=1):
+        summary = " ".join(extract_suggested_changes(review).split())
+        older.append(f"- Attempt {number}: {truncate(summary, OLDER_FEEDBACK_TOKENS, ' ...')}")
+
+    sections = []
+    if older:
+        sections.append("Earlier attempts were asked to:\n" + "\n".join(older))
+    sections.append(latest)
+
+    text = "\n\n".join(sections)
+    if count_tokens(text) > budget:
+        # Drop the oldest summaries first, then truncate what is left
+        while older and count_tokens(text) > budget:
+            older.pop(0)
+            sections = (["Earlier attempts were asked to:\n" + "\n".join(older)] if older else []) + [latest]
+            text = "\n\n".join(sections)
+        text = truncate(text, budget)
+    return text
+
+
+def compact_code(code: str, budget: int, language: str = "python") -> str:
+    """
+    Fit code into `budget` tokens. Code that fits is returned untouched. Otherwise Python
+    code keeps every import, signature and docstring with long bodies elided largest-first;
+    other languages keep the head and tail of the file around an elision marker.
+    """
+    if count_tokens(code) <= budget:
+        return code
+
+    if language.lower() == "python":
+        elided = _elide_python_bodies(code, budget)
+        if elided is not None:
+            return elided
+
+    lines = code.splitlines()
+    head, tail = lines[: len(lines) // 2], lines[len(lines) // 2:]
+    while (head or tail) and count_tokens("\n".join(head + tail)) > budget:
+        if len(head) >= len(tail):
+            head = head[:-max(len(head) // 10, 1)]
+        else:
+            tail = tail[max(len(tail) // 10, 1):]
+    skipped = len(lines) - len(head) - len(tail)
+    return "\n".join(head + [f"# ... {skipped} lines elided to fit the prompt budget ..."] + tail)
+
+
+def _elide_python_bodies(code: str, budget: int) -> str | None:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+
+    lines = code.splitlines()
+    bodies = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.body:
+            body = node.body
+            # Keep the docstring so the reviewer still sees what the function is for
+            if isinstance(body[0], ast.Expr) and isinstance(getattr(body[0], "value", None), ast.Constant) \
+                    and isinstance(body[0].value.value, str):
+                body = body[1:]
+            # A body on the signature's own line (def f(x): return x) stays, or the def would go with it
+            if body and not lines[body[0].lineno - 1][:body[0].col_offset].strip():
+                start, end = body[0].lineno, body[-1].end_lineno
+                indent = re.match(r"\s*", lines[start - 1]).group(0)
+                bodies.append((end - start + 1, start, end, indent))
+
+    elided = set()
+    replacements = {}
+    for size, start, end, indent in sorted(bodies, reverse=True):
+        if any(s <= start and end <= e for s, e in elided):
+            continue
+        elided.add((start, end))
+        replacements[start] = (end, f"{indent}...  # {size} lines elided to fit the prompt budget")
+        if count_tokens(_apply(lines, replacements)) <= budget:
+            return _apply(lines, replacements)
+    return None
+
+
+def _apply(lines: list, replacements: dict) -> str:
+    out, number = [], 1
+    while number <= len(lines):
+        if number in replacements:
+            end, text = replacements[number]
+            out.append(text)
+            number = end + 1
+        else:
+            out.append(lines[number - 1])
+            number += 1
+    return "\n".join(out)
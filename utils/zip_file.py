@@ -1,34 +1,227 @@
-import zipfile, io, pathlib
+import zipfile, io, json, os, pathlib, re, tempfile
+
+from utils.sandbox_runner import format_test_report
+
+# deflate opens everywhere and suits source code best. lzma rarely beats it on files this
+# small, its encoder needs ~100 MB while it works, and not every unzip tool reads it.
+COMPRESSION = {
+    "stored":  zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2":   zipfile.ZIP_BZIP2,
+    "lzma":    zipfile.ZIP_LZMA,
+}
+# EXPORT_COMPRESSION picks the method; EXPORT_COMPRESS_LEVEL the deflate/bzip2 level (1-9)
+DEFAULT_COMPRESSION = os.getenv("EXPORT_COMPRESSION", "deflate")
+COMPRESS_LEVEL = int(os.getenv("EXPORT_COMPRESS_LEVEL", 6))
+# Entries are written, and streamed archives handed out, in pieces of about this size
+CHUNK_SIZE = 64 * 1024
+
+
+def _zip(target, compression: str) -> zipfile.ZipFile:
+    """ZipFile writing to a path or binary file object; non-seekable ones work too."""
+    if compression not in COMPRESSION:
+        raise ValueError(f"Unknown compression {compression!r}, expected one of {', '.join(COMPRESSION)}")
+    method = COMPRESSION[compression]
+    level = COMPRESS_LEVEL if method in (zipfile.ZIP_DEFLATED, zipfile.ZIP_BZIP2) else None
+    return zipfile.ZipFile(target, "w", compression=method, compresslevel=level)
+
+
+def _write(zf: zipfile.ZipFile, name: str, data):
+    """Compress one entry into the archive in CHUNK_SIZE pieces."""
+    view = memoryview(data.encode("utf-8") if isinstance(data, str) else data)
+    with zf.open(name, "w") as dest:
+        for start in range(0, len(view), CHUNK_SIZE):
+            dest.write(view[start:start + CHUNK_SIZE])
+
+
+class _ChunkSink:
+    """
+    Write-only file object that hands out what ZipFile wrote to it, for streaming responses.
+    ZipFile falls back to data descriptors on it, as it can't seek back to patch headers.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    @property
+    def size(self) -> int:
+        return len(self._buffer)
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def export_entries(code: str,
+                   filename: str,
+                   test_code: str | None = None,
+                   review: str | None = None,
+                   improved_code: str | None = None,
+                   language: str = "python",
+                   test_report: str | None = None) -> list:
+    """
+    (name, text) pairs of a ticket's export:
+      • main code      (filename)
+      • improved code  (improved_code.<ext>)
+      • tests          (<filename>_test.py)
+      • review.txt     (final review)
+      • test_report.txt (sandboxed test run, see utils/sandbox_runner.py)
+    """
+    ext = ".py" if language.lower() == "python" else pathlib.Path(filename).suffix
+    entries = [(filename, code)]
+    if improved_code:
+        entries.append((f"improved_code{ext}", improved_code))
+    if test_code:
+        entries.append((filename.replace(ext, f"_test{ext}"), test_code))
+    if review:
+        entries.append(("review.txt", review))
+    if test_report:
+        entries.append(("test_report.txt", test_report))
+    return entries
+
+
+def write_export(target, *args, compression: str = DEFAULT_COMPRESSION, **kwargs):
+    """Write a ticket's export (see export_entries for the arguments) to a path or binary file object."""
+    with _zip(target, compression) as zf:
+        for name, data in export_entries(*args, **kwargs):
+            _write(zf, name, data)
+
+
+def iter_export_zip(*args, compression: str = DEFAULT_COMPRESSION, **kwargs):
+    """A ticket's export as a stream of bytes chunks, e.g. for an HTTP response."""
+    sink = _ChunkSink()
+    with _zip(sink, compression) as zf:
+        for name, data in export_entries(*args, **kwargs):
+            _write(zf, name, data)
+            if sink.size >= CHUNK_SIZE:
+                yield sink.drain()
+    yield sink.drain()
+
 
 def create_export_zip(code: str,
                       filename: str,
                       test_code: str | None = None,
                       review: str | None = None,
                       improved_code: str | None = None,
-                      language: str = "python") -> bytes:
+                      language: str = "python",
+                      test_report: str | None = None,
+                      compression: str = DEFAULT_COMPRESSION) -> bytes:
     """
-    Build an in‑memory ZIP with:
-      • main code      (filename)
-      • improved code  (improved_code.<ext>)   ← NEW
-      • tests          (<filename>_test.py)
-      • review.txt     (final review)
+    Build a ticket's export ZIP in memory (see export_entries for what goes in it).
+    Prefer write_export / iter_export_zip for anything that doesn't need the bytes at once.
     """
-    ext = ".py" if language.lower() == "python" else pathlib.Path(filename).suffix
-    # print("filename = " + filename) //debugging
-    # print("ext = " + ext) //debugging
     buffer = io.BytesIO()
+    write_export(buffer, code, filename, test_code, review, improved_code, language, test_report,
+                 compression=compression)
+    return buffer.getvalue()
+
 
-    with zipfile.ZipFile(buffer, "w") as zf:
-        zf.writestr(filename, code)
+class BulkExport:
+    """
+    Archive of many pipeline results (bulk_pipeline records, OutputStore results...),
+    written as they are add()ed: each ticket gets a directory with ticket.txt and its
+    export_entries, and close() adds manifest.json indexing every directory. Tickets are
+    compressed straight into `target` and manifest rows are spooled to a temporary file,
+    so memory stays flat however large the archive grows; only the ZIP's own directory
+    (a couple of hundred bytes per file) is held until close().
+    """
 
-        if improved_code:
-            zf.writestr(f"improved_code{ext}", improved_code)
+    def __init__(self, target, compression: str = DEFAULT_COMPRESSION):
+        self._zf = _zip(target, compression)
+        self._manifest = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self._dirs = set()
+        self.count = 0
 
-        if test_code:
-            zf.writestr(filename.replace(ext, f"_test{ext}"), test_code)
+    def _dir(self, record_id) -> str:
+        base = re.sub(r"[^\w.-]+", "_", str(record_id)).strip("._") or "ticket"
+        name, number = base, 1
+        while name in self._dirs:
+            number += 1
+            name = f"{base}-{number}"
+        self._dirs.add(name)
+        return name
 
-        if review:
-            zf.writestr("review.txt", review)
+    def add(self, result: dict) -> str:
+        """Write one result's directory; returns its name."""
+        directory = self._dir(result.get("id", self.count))
+        ticket_info = result.get("ticket_info") or {}
+        code_output = result.get("code_output") or {}
+        review = result.get("review") or {}
+        test_run = result.get("test_run")
 
-    buffer.seek(0)
-    return buffer.getvalue()
+        entries = [("ticket.txt", result.get("ticket", ""))]
+        if code_output.get("code"):
+            entries += export_entries(
+                code_output["code"],
+                pathlib.Path(code_output.get("filename") or "solution.py").name,
+                (result.get("tests") or {}).get("test_code"),
+                review.get("review"),
+                result.get("improved_code"),
+                ticket_info.get("language", "python"),
+                format_test_report(test_run) if test_run else None,
+            )
+        for name, data in entries:
+            _write(self._zf, f"{directory}/{name}", data)
+
+        row = {
+            "id": result.get("id"),
+            "dir": directory,
+            "summary": ticket_info.get("summary"),
+            "category": ticket_info.get("category"),
+            "language": ticket_info.get("language"),
+            "score": result.get("score"),
+            "ready": review.get("ready"),
+            "tests": test_run["status"] if test_run else None,
+            "files": [name for name, _ in entries],
+        }
+        if result.get("error"):
+            row["error"] = result["error"]
+        self._manifest.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+        self.count += 1
+        return directory
+
+    def close(self) -> int:
+        """Write manifest.json ({"tickets", "entries": [row, ...]}) and finish the archive; returns the ticket count."""
+        self._manifest.seek(0)
+        with self._zf.open("manifest.json", "w") as dest:
+            dest.write(f'{{"tickets": {self.count}, "entries": [\n'.encode("utf-8"))
+            for number, line in enumerate(self._manifest):
+                dest.write((",\n" if number else "").encode("utf-8") + line.rstrip("\n").encode("utf-8"))
+            dest.write(b"\n]}\n")
+        self._manifest.close()
+        self._zf.close()
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_bulk_export(target, results, compression: str = DEFAULT_COMPRESSION) -> int:
+    """Archive every result from an iterable into a path or binary file object; returns the ticket count."""
+    with BulkExport(target, compression) as archive:
+        for result in results:
+            archive.add(result)
+    return archive.count
+
+
+def iter_bulk_export(results, compression: str = DEFAULT_COMPRESSION):
+    """write_bulk_export as a stream of bytes chunks, e.g. for an HTTP response."""
+    sink = _ChunkSink()
+    archive = BulkExport(sink, compression)
+    for result in results:
+        archive.add(result)
+        if sink.size >= CHUNK_SIZE:
+            yield sink.drain()
+    archive.close()
+    yield sink.drain()